@@ -0,0 +1,155 @@
+"""
+Agent Metrics - LangChain callbacks recording model, tool and node timings per agent
+"""
+
+import time
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from app.utils.metrics import TOKEN_BUCKETS, metrics
+
+agent_runs = metrics.histogram(
+    "agent_run_seconds", "End-to-end agent invocation latency", ("agent", "status")
+)
+agent_nodes = metrics.histogram(
+    "agent_node_seconds",
+    "Latency of each agent graph node; the model node includes output parsing",
+    ("agent", "node"),
+)
+model_calls = metrics.histogram(
+    "agent_model_call_seconds", "Latency of a single model turn", ("agent", "status")
+)
+model_tokens = metrics.histogram(
+    "agent_model_tokens",
+    "Tokens per model turn",
+    ("agent", "direction"),
+    buckets=TOKEN_BUCKETS,
+)
+model_tokens_total = metrics.counter(
+    "agent_model_tokens_total", "Tokens consumed by model turns", ("agent", "direction")
+)
+tool_calls = metrics.histogram(
+    "agent_tool_call_seconds", "Wall time of a single tool call", ("agent", "tool", "status")
+)
+
+
+class AgentMetricsCallback(BaseCallbackHandler):
+    """Records latencies and token usage of one agent into the metrics registry"""
+
+    run_inline = True
+
+    def __init__(self, agent: str):
+        self.agent = agent
+        self.started: dict[UUID, tuple[str, float]] = {}
+
+    def _start(self, run_id: UUID, name: str) -> None:
+        self.started[run_id] = (name, time.perf_counter())
+
+    def _finish(self, run_id: UUID) -> tuple[str, float] | None:
+        started = self.started.pop(run_id, None)
+        if started is None:
+            return None
+        name, start = started
+        return name, time.perf_counter() - start
+
+    def on_chain_start(
+        self,
+        serialized: dict[str, Any],
+        inputs: dict[str, Any],
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        name = kwargs.get("name") or ""
+        if parent_run_id is None:
+            self._start(run_id, "")
+        elif metadata and metadata.get("langgraph_node") == name:
+            self._start(run_id, name)
+
+    def on_chain_end(
+        self, outputs: Any, *, run_id: UUID, parent_run_id: UUID | None = None, **kwargs: Any
+    ) -> None:
+        self._record_chain(run_id, parent_run_id, "ok")
+
+    def on_chain_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        **kwargs: Any,
+    ) -> None:
+        self._record_chain(run_id, parent_run_id, "error")
+
+    def _record_chain(self, run_id: UUID, parent_run_id: UUID | None, status: str):
+        finished = self._finish(run_id)
+        if finished is None:
+            return
+
+        node, elapsed = finished
+        if parent_run_id is None:
+            agent_runs.observe(elapsed, agent=self.agent, status=status)
+        else:
+            agent_nodes.observe(elapsed, agent=self.agent, node=node)
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: list[list[Any]],
+        *,
+        run_id: UUID,
+        **kwargs: Any,
+    ) -> None:
+        self._start(run_id, "model")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        finished = self._finish(run_id)
+        if finished is not None:
+            model_calls.observe(finished[1], agent=self.agent, status="ok")
+
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if not usage:
+                    continue
+                for direction in ("input", "output"):
+                    tokens = usage.get(f"{direction}_tokens", 0)
+                    model_tokens.observe(tokens, agent=self.agent, direction=direction)
+                    model_tokens_total.inc(tokens, agent=self.agent, direction=direction)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        finished = self._finish(run_id)
+        if finished is not None:
+            model_calls.observe(finished[1], agent=self.agent, status="error")
+
+    def on_tool_start(
+        self,
+        serialized: dict[str, Any],
+        input_str: str,
+        *,
+        run_id: UUID,
+        **kwargs: Any,
+    ) -> None:
+        self._start(run_id, serialized.get("name") or kwargs.get("name") or "unknown")
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        finished = self._finish(run_id)
+        if finished is not None:
+            tool_calls.observe(finished[1], agent=self.agent, tool=finished[0], status="ok")
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        finished = self._finish(run_id)
+        if finished is not None:
+            tool_calls.observe(
+                finished[1], agent=self.agent, tool=finished[0], status="error"
+            )
+
+
+def agent_callbacks(agent: str) -> list[BaseCallbackHandler]:
+    """Callbacks to pass in the config of every invocation of ``agent``"""
+    return [AgentMetricsCallback(agent)]
@@ -0,0 +1,239 @@
+"""
+Batch Insights - Generates insights for many users with batched model calls
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any
+
+from app.dependencies.calendar import getTodayEvents
+from app.dependencies.langchain import (
+    SYSTEM_PROMPT,
+    describe_objectives,
+    describe_schedule,
+    describe_today_health_data,
+    get_llm_model,
+)
+from app.dependencies.user_profile import get_user_profiles
+from app.models.health_models import HealthInsightsResponse
+from app.utils.health_rules import rule_based_insights
+from app.utils.insight_precomputer import insight_precomputer
+from app.utils.random_health_data import get_mock_health_data
+from app.utils.resilience import llm_calls
+
+logger = logging.getLogger("batch_insights")
+
+# Configuration
+BATCH_CHUNK_SIZE = 200  # Users per profile query and model batch
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_INSIGHTS_MAX_CONCURRENCY", "16"))
+BATCH_JOB_TTL = timedelta(hours=float(os.getenv("BATCH_JOB_TTL_HOURS", "24")))
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", "100"))  # Finished jobs kept for polling
+
+
+@dataclass
+class BatchInsightsJob:
+    """Progress of a batch insights run"""
+
+    job_id: str
+    user_ids: list[str]
+    enrich: bool = False
+    status: str = "pending"
+    completed: int = 0
+    failed: int = 0
+    errors: dict[str, str] = field(default_factory=dict)
+    created_at: datetime = field(default_factory=datetime.now)
+    finished_at: datetime | None = None
+
+    def progress(self) -> dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "total": len(self.user_ids),
+            "enrich": self.enrich,
+            "completed": self.completed,
+            "failed": self.failed,
+            "errors": self.errors,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+batch_jobs: dict[str, BatchInsightsJob] = {}
+_running_tasks: set[asyncio.Task] = set()
+
+
+def build_insights_prompt(
+    user_data: Any,
+    health_data: str,
+    schedule: str,
+    current_datetime: datetime,
+    insights: HealthInsightsResponse | None = None,
+) -> list[tuple[str, str]]:
+    """Inline the context the insights agent would otherwise fetch with tools"""
+    findings = (
+        f"\n\nRule-based findings for today: {insights.response_text}" if insights else ""
+    )
+    return [
+        ("system", SYSTEM_PROMPT),
+        (
+            "human",
+            "Generate personalized health insights for me based on my objectives, today's health data, and schedule. "
+            f"Current date and time is {current_datetime.strftime('%Y-%m-%d %H:%M:%S')}.\n\n"
+            f"{describe_objectives(user_data)}\n\n"
+            f"Today's health data: {health_data}\n\n"
+            f"{schedule}{findings}",
+        ),
+    ]
+
+
+async def run_batch_insights(job: BatchInsightsJob) -> None:
+    """
+    Generate and store insights for every user in the job.
+
+    Users the health rules can answer are served from the rules; the model
+    is only batched for the rest, or for everyone when the job enriches.
+    """
+    from app.dependencies.agent_metrics import agent_callbacks
+
+    job.status = "running"
+    current_datetime = datetime.now()
+    kind = "insights_narrative" if job.enrich else "insights"
+
+    try:
+        # The calendar is shared by every user in this deployment and only
+        # fetched once the model is needed
+        schedule = None
+
+        for start in range(0, len(job.user_ids), BATCH_CHUNK_SIZE):
+            chunk = job.user_ids[start : start + BATCH_CHUNK_SIZE]
+            profiles = await get_user_profiles(chunk)
+
+            for user_id in chunk:
+                if user_id not in profiles:
+                    job.failed += 1
+                    job.errors[user_id] = "User not found."
+
+            rule_insights = {}
+            for user_id in chunk:
+                if user_id not in profiles:
+                    continue
+                insights = rule_based_insights(
+                    get_mock_health_data(user_id), profiles[user_id].get("step_goal")
+                )
+                if insights is not None and not job.enrich:
+                    insight_precomputer.put(kind, user_id, insights)
+                    job.completed += 1
+                else:
+                    rule_insights[user_id] = insights
+
+            found = list(rule_insights)
+            if found:
+                if schedule is None:
+                    schedule = describe_schedule(
+                        await asyncio.to_thread(getTodayEvents)
+                    )
+
+                prompts = [
+                    build_insights_prompt(
+                        profiles[user_id],
+                        describe_today_health_data(user_id),
+                        schedule,
+                        current_datetime,
+                        rule_insights[user_id],
+                    )
+                    for user_id in found
+                ]
+
+                async def generate() -> list[Any]:
+                    responses = await get_llm_model().abatch(
+                        prompts,
+                        config={
+                            "max_concurrency": BATCH_MAX_CONCURRENCY,
+                            "callbacks": agent_callbacks("batch_insights"),
+                        },
+                        return_exceptions=True,
+                    )
+                    # A chunk where every prompt failed counts against the breaker
+                    if all(isinstance(response, Exception) for response in responses):
+                        raise responses[0]
+                    return responses
+
+                try:
+                    responses = await llm_calls.call("batch_insights", generate)
+                except Exception as exc:
+                    responses = [exc] * len(found)
+
+                for user_id, response in zip(found, responses):
+                    if isinstance(response, Exception):
+                        job.failed += 1
+                        job.errors[user_id] = str(response)
+                        continue
+
+                    insights = rule_insights[user_id]
+                    insight_precomputer.put(
+                        kind,
+                        user_id,
+                        HealthInsightsResponse(
+                            response_text=response.text,
+                            findings=insights.findings if insights else [],
+                            source="llm",
+                            ai_insights=response.text,
+                        ),
+                    )
+                    job.completed += 1
+
+            logger.info(
+                f"Batch {job.job_id}: {job.completed + job.failed}/{len(job.user_ids)} users processed"
+            )
+
+        job.status = "completed"
+    except asyncio.CancelledError:
+        job.status = "cancelled"
+        raise
+    except Exception as exc:
+        logger.error(f"Batch {job.job_id} failed: {exc}")
+        job.status = "failed"
+        job.errors["_batch"] = str(exc)
+    finally:
+        job.finished_at = datetime.now()
+
+
+def _prune_jobs() -> None:
+    """Forget finished jobs past BATCH_JOB_TTL, then the oldest beyond BATCH_MAX_JOBS"""
+    now = datetime.now()
+    finished = sorted(
+        (job for job in batch_jobs.values() if job.finished_at is not None),
+        key=lambda job: job.finished_at,
+    )
+    excess = len(finished) - BATCH_MAX_JOBS
+    for index, job in enumerate(finished):
+        if index < excess or now - job.finished_at > BATCH_JOB_TTL:
+            del batch_jobs[job.job_id]
+
+
+def start_batch_insights(user_ids: list[str], enrich: bool = False) -> BatchInsightsJob:
+    """Start a batch insights run in the background"""
+    unique_user_ids = list(dict.fromkeys(user_ids))
+    job = BatchInsightsJob(
+        job_id=str(uuid.uuid4()), user_ids=unique_user_ids, enrich=enrich
+    )
+    _prune_jobs()
+    batch_jobs[job.job_id] = job
+
+    task = asyncio.create_task(run_batch_insights(job))
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+
+    return job
+
+
+async def stop_batch_insights() -> None:
+    """Cancel running batch jobs and wait for them to finish"""
+    tasks = list(_running_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
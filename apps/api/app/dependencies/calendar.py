@@ -3,8 +3,6 @@ from datetime import datetime
 from typing import Optional, Union
 
 from dotenv import load_dotenv
-from nylas import Client
-from nylas.models.events import CreateEventRequest, ListEventQueryParams
 
 from app.utils.timestamp import ensure_unix_timestamp, parse_iso_timestamp
 
@@ -29,6 +27,9 @@ def getCalendarEvents(
         List of events or calendars if no time filters
     """
     try:
+        from nylas import Client
+        from nylas.models.events import ListEventQueryParams
+
         nylas = Client(os.environ.get("NYLAS_API_KEY") or "")
         grant_id = os.environ.get("NYLAS_GRANT_ID")
 
@@ -121,6 +122,9 @@ def createCalendarEvent(
         Created event data or error
     """
     try:
+        from nylas import Client
+        from nylas.models.events import CreateEventRequest
+
         nylas = Client(os.environ.get("NYLAS_API_KEY") or "")
         grant_id = os.environ.get("NYLAS_GRANT_ID")
 
@@ -238,6 +242,8 @@ def getAllEvents(calendar_id: str | None = None, limit: int = 100):
         List of events
     """
     try:
+        from nylas import Client
+
         nylas = Client(os.environ.get("NYLAS_API_KEY") or "")
         grant_id = os.environ.get("NYLAS_GRANT_ID")
 
@@ -0,0 +1,193 @@
+"""
+Chat History - Keeps the chatbot's checkpointed history within a token budget
+"""
+
+import json
+import logging
+from typing import Any
+
+from langchain.agents.middleware import AgentMiddleware, AgentState
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AnyMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+from langgraph.runtime import Runtime
+
+from app.utils.resilience import llm_calls
+
+logger = logging.getLogger("chat_history")
+
+SUMMARY_MESSAGE_ID = "chat-history-summary"
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+STALE_TOOL_OUTPUT = "[stale tool output removed]"
+MAX_TRANSCRIPT_LINE_CHARS = 500
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and a health assistant.
+Merge the new conversation lines into the existing summary.
+Keep the user's goals, preferences, decisions and any calendar events that were created.
+Drop raw health data values and tool outputs. Respond with the updated summary only."""
+
+
+class ChatHistoryMiddleware(AgentMiddleware):
+    """Sliding window over recent turns with an incrementally updated summary
+
+    A turn starts at a user message and includes every model and tool message
+    that follows it. Before each model call the history is normalized:
+
+    - tool outputs of previous turns are replaced by a short placeholder
+    - turns beyond ``max_turns`` are folded into the running summary
+    - older turns are folded as well while the history exceeds ``token_budget``
+
+    The current turn is never evicted, so the budget is best effort when a
+    single turn is larger than the budget on its own. Summaries are model
+    calls guarded like the agent's own (async only, as is the agent); when
+    one fails the old summary is kept and the turns are dropped anyway.
+    """
+
+    def __init__(self, model: BaseChatModel, max_turns: int, token_budget: int):
+        super().__init__()
+        self.model = model
+        self.max_turns = max(1, max_turns)
+        self.token_budget = token_budget
+
+    async def abefore_model(
+        self, state: AgentState, runtime: Runtime
+    ) -> dict[str, Any] | None:
+        plan = self._plan(state["messages"])
+        if plan is None:
+            return None
+
+        summary, evicted, kept = plan
+        if evicted:
+            try:
+                request = self._summary_request(summary, evicted)
+                response = await llm_calls.call(
+                    "chat_summary", lambda: self.model.ainvoke(request)
+                )
+                summary = response.text.strip() or summary
+            except Exception as exc:
+                logger.warning("Failed to update conversation summary: %s", exc)
+
+        return self._build_update(summary, kept)
+
+    def _plan(
+        self, messages: list[AnyMessage]
+    ) -> tuple[str, list[AnyMessage], list[AnyMessage]] | None:
+        """Decide which turns to keep, strip and evict; None when nothing changes"""
+        summary, turns = self._split_turns(messages)
+        if not turns:
+            return None
+
+        changed = False
+        for index in range(len(turns) - 1):
+            stripped = self._strip_tool_outputs(turns[index])
+            if stripped is not None:
+                turns[index] = stripped
+                changed = True
+
+        keep_from = 0
+        if len(turns) > self.max_turns:
+            # Evict half a window at a time so summaries are not regenerated on every turn
+            keep_from = len(turns) - max(1, self.max_turns // 2)
+
+        while (
+            keep_from < len(turns) - 1
+            and self._count_tokens(summary, turns[keep_from:]) > self.token_budget
+        ):
+            keep_from += 1
+
+        if keep_from == 0 and not changed:
+            return None
+
+        evicted = [message for turn in turns[:keep_from] for message in turn]
+        kept = [message for turn in turns[keep_from:] for message in turn]
+        return summary, evicted, kept
+
+    def _split_turns(
+        self, messages: list[AnyMessage]
+    ) -> tuple[str, list[list[AnyMessage]]]:
+        """Split history into the running summary and a list of turns"""
+        summary = ""
+        turns: list[list[AnyMessage]] = []
+
+        for message in messages:
+            if message.id == SUMMARY_MESSAGE_ID:
+                summary = message.text.removeprefix(SUMMARY_PREFIX)
+                continue
+
+            if isinstance(message, HumanMessage) or not turns:
+                turns.append([])
+            turns[-1].append(message)
+
+        return summary, turns
+
+    def _strip_tool_outputs(self, turn: list[AnyMessage]) -> list[AnyMessage] | None:
+        """Replace tool payloads of a finished turn; None when already stripped"""
+        stripped = []
+        changed = False
+
+        for message in turn:
+            if isinstance(message, ToolMessage) and message.content != STALE_TOOL_OUTPUT:
+                message = message.model_copy(
+                    update={"content": STALE_TOOL_OUTPUT, "artifact": None}
+                )
+                changed = True
+            stripped.append(message)
+
+        return stripped if changed else None
+
+    def _count_tokens(self, summary: str, turns: list[list[AnyMessage]]) -> int:
+        messages: list[AnyMessage] = [message for turn in turns for message in turn]
+        if summary:
+            messages.insert(0, HumanMessage(content=SUMMARY_PREFIX + summary))
+        return count_tokens_approximately(messages)
+
+    def _summary_request(
+        self, summary: str, evicted: list[AnyMessage]
+    ) -> list[AnyMessage]:
+        transcript = "\n".join(
+            line for line in (self._render(message) for message in evicted) if line
+        )
+        return [
+            SystemMessage(content=SUMMARY_PROMPT),
+            HumanMessage(
+                content=(
+                    f"Existing summary:\n{summary or '(none)'}\n\n"
+                    f"New conversation lines:\n{transcript}"
+                )
+            ),
+        ]
+
+    def _render(self, message: AnyMessage) -> str:
+        """Render a message as a single transcript line, skipping tool outputs"""
+        if isinstance(message, HumanMessage):
+            line = f"User: {message.text}"
+        elif isinstance(message, AIMessage):
+            parts = [message.text] if message.text else []
+            parts.extend(
+                f"{call['name']}({json.dumps(call['args'], ensure_ascii=False)})"
+                for call in message.tool_calls
+            )
+            if not parts:
+                return ""
+            line = "Assistant: " + " ".join(parts)
+        else:
+            return ""
+
+        return line[:MAX_TRANSCRIPT_LINE_CHARS]
+
+    def _build_update(self, summary: str, kept: list[AnyMessage]) -> dict[str, Any]:
+        messages: list[Any] = [RemoveMessage(id=REMOVE_ALL_MESSAGES)]
+        if summary:
+            messages.append(
+                HumanMessage(content=SUMMARY_PREFIX + summary, id=SUMMARY_MESSAGE_ID)
+            )
+        messages.extend(kept)
+        return {"messages": messages}
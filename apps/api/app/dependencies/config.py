@@ -7,3 +7,21 @@ load_dotenv()
 GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+SUPABASE_TIMEOUT_SEC = float(os.getenv("SUPABASE_TIMEOUT_SEC", "10"))
+
+CHAT_HISTORY_MAX_TURNS = int(os.getenv("CHAT_HISTORY_MAX_TURNS", "6"))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "4000"))
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.5-flash")
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+FAKE_LLM_LATENCY_JITTER_MS = float(os.getenv("FAKE_LLM_LATENCY_JITTER_MS", "0"))
+FAKE_LLM_LATENCY_DISTRIBUTION = os.getenv("FAKE_LLM_LATENCY_DISTRIBUTION", "constant")
+
+# Threads available to blocking agent tools (Supabase, Nylas) across all runs
+AGENT_TOOL_MAX_WORKERS = int(os.getenv("AGENT_TOOL_MAX_WORKERS", "8"))
+
+# Let the model rephrase the workout planner's rationale
+PLANNER_LLM_RATIONALE = os.getenv("ENABLE_PLANNER_LLM_RATIONALE", "0") == "1"
+
+WARM_AGENTS_ON_STARTUP = os.getenv("WARM_AGENTS_ON_STARTUP", "1") == "1"
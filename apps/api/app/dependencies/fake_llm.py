@@ -0,0 +1,195 @@
+"""
+Fake LLM - Deterministic offline chat model for load testing the agents
+"""
+
+import asyncio
+import hashlib
+import random
+import re
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Literal, Sequence
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+USER_ID_PATTERN = re.compile(r"user ID is ([\w-]+)")
+CURRENT_TIME_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+SUGGESTED_EVENT_DURATION = timedelta(minutes=45)
+
+FAKE_SENTENCES = (
+    "You are close to your step goal, a short walk this evening will get you there.",
+    "Your sleep was within the healthy range, keep a consistent bedtime tonight.",
+    "Stress is moderate today, consider a 10 minute breathing break after lunch.",
+    "Your heart rate looks steady, a light swim would fit your weekly plan.",
+)
+
+
+class FakeHealthChatModel(BaseChatModel):
+    """Chat model that answers agent turns deterministically without a network
+
+    On the first model call of a turn it requests every bound read tool
+    (``get_*``) at once. Once tool results are present it calls the bound
+    structured-output tool (schema names start with an uppercase letter) with
+    arguments generated from its JSON schema. Without tools it returns text.
+    Outputs and latencies are seeded from the conversation, so the same
+    input always produces the same response.
+    """
+
+    latency_ms: float = 0.0
+    latency_jitter_ms: float = 0.0
+    latency_distribution: Literal["constant", "uniform", "normal", "lognormal"] = (
+        "constant"
+    )
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-health"
+
+    def bind_tools(
+        self,
+        tools: Sequence[Any],
+        *,
+        tool_choice: str | None = None,
+        **kwargs: Any,
+    ):
+        formatted_tools = [convert_to_openai_tool(_) for _ in tools]
+        return super().bind(tools=formatted_tools, tool_choice=tool_choice, **kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        rng = self._rng(messages)
+        time.sleep(self._sample_latency(rng))
+        return self._respond(messages, kwargs.get("tools") or [], rng)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        rng = self._rng(messages)
+        await asyncio.sleep(self._sample_latency(rng))
+        return self._respond(messages, kwargs.get("tools") or [], rng)
+
+    def _rng(self, messages: list[BaseMessage]) -> random.Random:
+        digest = hashlib.sha256(
+            "\n".join(str(message.content) for message in messages).encode("utf-8")
+        ).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _sample_latency(self, rng: random.Random) -> float:
+        """Sample a latency in seconds from the configured distribution"""
+        mean = self.latency_ms
+        jitter = self.latency_jitter_ms
+
+        if self.latency_distribution == "uniform":
+            value = rng.uniform(mean - jitter, mean + jitter)
+        elif self.latency_distribution == "normal":
+            value = rng.gauss(mean, jitter)
+        elif self.latency_distribution == "lognormal" and mean > 0:
+            # latency_ms is the median, the jitter sets the spread of the tail
+            value = mean * rng.lognormvariate(0, jitter / mean)
+        else:
+            value = mean
+
+        return max(0.0, value) / 1000
+
+    def _respond(
+        self, messages: list[BaseMessage], tools: list[dict], rng: random.Random
+    ) -> ChatResult:
+        turn_start = max(
+            (i for i, message in enumerate(messages) if isinstance(message, HumanMessage)),
+            default=0,
+        )
+        turn_messages = messages[turn_start:]
+        context = " ".join(str(message.content) for message in turn_messages)
+        tools_called = any(isinstance(message, ToolMessage) for message in turn_messages)
+
+        read_tools = [_ for _ in tools if _["function"]["name"].startswith("get_")]
+        response_tools = [_ for _ in tools if _["function"]["name"][:1].isupper()]
+
+        if read_tools and not tools_called:
+            tool_calls = [self._tool_call(_, context, rng) for _ in read_tools]
+            message = AIMessage(content="", tool_calls=tool_calls)
+        elif response_tools:
+            message = AIMessage(
+                content="", tool_calls=[self._tool_call(response_tools[0], context, rng)]
+            )
+        else:
+            message = AIMessage(content=rng.choice(FAKE_SENTENCES))
+
+        input_tokens = count_tokens_approximately(messages)
+        output_tokens = count_tokens_approximately([message])
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _tool_call(
+        self, tool: dict, context: str, rng: random.Random
+    ) -> dict[str, Any]:
+        function = tool["function"]
+        properties = function.get("parameters", {}).get("properties", {})
+        return {
+            "name": function["name"],
+            "args": self._tool_args(properties, context, rng),
+            "id": f"call_{uuid.UUID(int=rng.getrandbits(128)).hex}",
+            "type": "tool_call",
+        }
+
+    def _tool_args(
+        self, properties: dict[str, Any], context: str, rng: random.Random
+    ) -> dict[str, Any]:
+        """Generate schema-valid arguments, with plausible values for known fields"""
+        user_id = USER_ID_PATTERN.search(context)
+        current_time = CURRENT_TIME_PATTERN.search(context)
+        now = (
+            datetime.fromisoformat(current_time.group(0))
+            if current_time
+            else datetime.now()
+        )
+        start = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+
+        args: dict[str, Any] = {}
+        for name, schema in properties.items():
+            field_type = schema.get("type", "string")
+
+            if name == "user_id":
+                args[name] = user_id.group(1) if user_id else ""
+            elif name == "start_time":
+                args[name] = start.isoformat()
+            elif name == "end_time":
+                args[name] = (start + SUGGESTED_EVENT_DURATION).isoformat()
+            elif name == "title":
+                args[name] = rng.choice(("Brisk walk", "Swim session", "Pickleball"))
+            elif field_type == "string":
+                args[name] = rng.choice(FAKE_SENTENCES)
+            elif field_type == "integer":
+                args[name] = 0
+            elif field_type == "number":
+                args[name] = 0.0
+            elif field_type == "boolean":
+                args[name] = False
+            elif field_type == "array":
+                args[name] = []
+            else:
+                args[name] = {}
+
+        return args
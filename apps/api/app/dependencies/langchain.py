@@ -1,17 +1,44 @@
-import json
+import asyncio
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any
-
-from langchain.agents import create_agent
-from langchain.tools import tool
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langgraph.checkpoint.memory import InMemorySaver
+from functools import cache, partial
+from typing import TYPE_CHECKING, Any
 
 from app.dependencies.calendar import createCalendarEvent, getTodayEvents
-from app.dependencies.supabase import supabase_client
+from app.dependencies.config import (
+    AGENT_TOOL_MAX_WORKERS,
+    CHAT_HISTORY_MAX_TURNS,
+    CHAT_HISTORY_TOKEN_BUDGET,
+    PLANNER_LLM_RATIONALE,
+)
+from app.dependencies.user_profile import get_user_profile
+from app.dependencies.tool_cache import tool_results
 from app.models.health_models import HealthInsightsResponse
-from app.utils.random_health_data import get_persisted_mock_health_data
+from app.utils.context_encoder import (
+    encode_health_data,
+    encode_objectives,
+    encode_percentiles,
+    encode_schedule,
+)
+from app.utils.health_rules import rule_based_insights
+from app.utils.health_store import METRICS as HEALTH_METRICS
+from app.utils.population_sketches import (
+    cohort_of,
+    latest_daily_values,
+    population_sketches,
+)
+from app.utils.random_health_data import get_mock_health_data
+from app.utils.resilience import llm_calls
+from app.utils.workout_planner import PlannedWorkout, plan_workouts
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
+logger = logging.getLogger("langchain_agents")
 
 SYSTEM_PROMPT = """You are a health AI assistant.
 Your goal is to help users achieve their health objectives by analyzing their daily health data and schedule. 
@@ -21,6 +48,11 @@ Just tell meaningful insights based on the data provided. Don't just repeat the
 Healthy sleep range: 7-9 hours per night.
 Good sleep quality: above 80.
 Stress level: below 50 is considered low stress.
+Blood oxygen: 95-100% is normal, below 92% needs attention.
+Blood pressure: 140/90 or above is high, 180/120 or above is a crisis.
+Resting heart rate: 60-100 bpm; sustained rates above 100 bpm at rest need attention.
+Blood glucose: 70-180 mg/dL is the target range.
+Percentiles compare the user with peers of the same age band, gender and activity level; mention them when they add context.
 """
 
 
@@ -40,6 +72,10 @@ Recommend calendar adjustments that keep the user on track with health goals.
 When proposing an event, ensure the times are in ISO 8601 format and the plan is concise."""
 
 
+RATIONALE_PROMPT = """You write one short, friendly sentence explaining why a planned activity helps the user.
+Only use the facts given. Do not change the activity or its time."""
+
+
 @dataclass
 class HealthChatbotResponse:
     """Structured response for health chatbot."""
@@ -55,59 +91,64 @@ You also can create calendar events to help users stay on track with their healt
 """
 
 
-@tool
-def get_users_objectives(user_id: str):
+def describe_objectives(user_data: Any) -> str:
+    """Describe a user profile row's health objectives for the model."""
+    return encode_objectives(user_data)
+
+
+def describe_today_health_data(user_id: str) -> str:
+    """Serialize the user's health data for today for the model."""
+    return encode_health_data(get_mock_health_data(user_id))
+
+
+def describe_schedule(res: list[Any]) -> str:
+    """Describe a list of calendar events for the model."""
+    return encode_schedule(res)
+
+
+async def get_users_objectives(user_id: str):
     """Fetch the user's health objectives."""
     try:
-        res = supabase_client.table("users").select("*").eq("id", user_id).execute()
-        if len(res.data) == 0:
+        profile = await get_user_profile(user_id)
+        if profile is None:
             return "User not found."
 
-        user_data: Any = res.data[0]
-        return f"My step goal is {user_data['step_goal']} steps per day. My custom goals are: {user_data['custom_goals']}"
+        return describe_objectives(profile)
     except Exception as e:
         return f"An error occurred while fetching user objectives: {str(e)}"
 
 
-@tool
-def get_today_health_data():
+async def get_today_health_data(user_id: str):
     """Fetch the user's health data for today."""
-    mock_data = get_persisted_mock_health_data("realistic")
+    return describe_today_health_data(user_id)
 
-    return json.dumps(
-        {
-            "steps": mock_data["steps"],
-            "distance_meters": mock_data["distance_meters"],
-            "calories_burned": mock_data["calories_burned"],
-            "sleep_duration": mock_data["sleep_duration"],
-            "sleep_quality": mock_data["sleep_quality"],
-            "heart_rate": mock_data["heart_rate"],
-            "stress_score": mock_data["stress_score"],
-            "bp_systolic": mock_data["bp_systolic"],
-            "bp_diastolic": mock_data["bp_diastolic"],
-            "blood_glucose": mock_data["blood_glucose"],
-            "blood_oxygen": mock_data["blood_oxygen"],
-            "blood_pressure": mock_data["blood_pressure"],
-            "timestamp": mock_data["timestamp"],
-            "weekly_workouts": mock_data["weekly_workouts"],
-        }
+
+async def get_health_percentiles(user_id: str):
+    """Rank the user's latest full day of wearable data against peers of the same age band, gender and activity level."""
+    try:
+        profile = await get_user_profile(user_id)
+    except Exception as e:
+        return f"An error occurred while fetching the user profile: {str(e)}"
+
+    cohort = cohort_of(profile)
+    if cohort is None:
+        return "Percentiles need the user's date of birth, gender and activity level."
+
+    daily = await asyncio.to_thread(latest_daily_values, user_id, list(HEALTH_METRICS))
+    if not daily:
+        return "percentiles: no wearable data from the past week"
+    return encode_percentiles(
+        population_sketches.rank_values(
+            cohort, {metric: value for metric, (_, value) in daily.items()}
+        )
     )
 
 
-@tool
 def get_today_schedule():
     """Fetch the user's schedule for today."""
-    res = getTodayEvents()
-    events = [
-        f"{datetime.fromtimestamp(_.when.start_time).strftime('%H:%M:%S')} - {
-            _.title
-        } ({_.description})"
-        for _ in res
-    ]
-    return "User's schedule for today: " + ", ".join(events)
+    return describe_schedule(getTodayEvents())
 
 
-@tool
 def create_calendar_event(start_time: str, end_time: str, title: str, description: str):
     """Create a calendar event."""
     try:
@@ -122,45 +163,192 @@ def create_calendar_event(start_time: str, end_time: str, title: str, descriptio
         return f"An error occurred while creating calendar event: {str(e)}"
 
 
-llm_model = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
-agent = create_agent(
-    model=llm_model,
-    tools=[
-        get_users_objectives,
-        get_today_health_data,
-        get_today_schedule,
-    ],
-    system_prompt=SYSTEM_PROMPT,
-    response_format=HealthChatbotResponse,
-)
+@cache
+def get_llm_model() -> "BaseChatModel":
+    """Build the shared chat model on first use."""
+    from app.dependencies.llm_provider import create_chat_model
 
+    return create_chat_model()
+
+
+@cache
+def get_tool_executor() -> ThreadPoolExecutor:
+    """Thread pool the blocking tools run on, shared by every agent run."""
+    return ThreadPoolExecutor(
+        max_workers=AGENT_TOOL_MAX_WORKERS, thread_name_prefix="agent-tool"
+    )
 
-event_suggestion_agent = create_agent(
-    model=llm_model,
-    tools=[
-        get_users_objectives,
-        get_today_health_data,
-        get_today_schedule,
-    ],
-    system_prompt=EVENT_SUGGESTION_PROMPT,
-    response_format=EventSuggestion,
-)
 
+def _blocking_tool(func: Any) -> Any:
+    """
+    Expose a blocking tool function to the agents as an async tool.
 
-def adapt_event_changes(event_list: list[str]):
-    pass
+    Tool calls from one model turn are dispatched together, so running each
+    on the tool thread pool makes the tool phase as long as the slowest call.
+    """
+    from langchain_core.tools import StructuredTool
+
+    async def run(**kwargs: Any) -> Any:
+        call = partial(contextvars.copy_context().run, func, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            get_tool_executor(), call
+        )
+
+    return StructuredTool.from_function(func=func, coroutine=run)
+
+
+def _async_tool(coroutine: Any) -> Any:
+    """Expose an async tool function to the agents."""
+    from langchain_core.tools import StructuredTool
+
+    return StructuredTool.from_function(coroutine=coroutine)
+
+
+@dataclass
+class Agents:
+    """The agent graphs, built together on first use."""
+
+    insights: Any
+    event_suggestion: Any
+    chatbot: Any
+
+
+_agents: Agents | None = None
+_agents_lock = threading.Lock()
+
+
+def _build_agents() -> Agents:
+    from langchain.agents import create_agent
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    from app.dependencies.chat_history import ChatHistoryMiddleware
+
+    llm_model = get_llm_model()
+    read_tools = [
+        _async_tool(get_users_objectives),
+        _async_tool(get_today_health_data),
+        _async_tool(get_health_percentiles),
+        _blocking_tool(get_today_schedule),
+    ]
+    tool_cache = tool_results.as_middleware()
+
+    insights_agent = create_agent(
+        model=llm_model,
+        tools=read_tools,
+        system_prompt=SYSTEM_PROMPT,
+        response_format=HealthChatbotResponse,
+        middleware=[llm_calls.as_middleware("insights"), tool_cache],
+    )
+
+    event_suggestion_agent = create_agent(
+        model=llm_model,
+        tools=read_tools,
+        system_prompt=EVENT_SUGGESTION_PROMPT,
+        response_format=EventSuggestion,
+        middleware=[llm_calls.as_middleware("event_changed_suggestion"), tool_cache],
+    )
+
+    chatbot_agent = create_agent(
+        model=llm_model,
+        tools=[*read_tools, _blocking_tool(create_calendar_event)],
+        response_format=HealthChatbotResponse,
+        checkpointer=InMemorySaver(),
+        system_prompt=HEALTH_CHATBOT_AGENT_PROMPT,
+        middleware=[
+            ChatHistoryMiddleware(
+                model=llm_model,
+                max_turns=CHAT_HISTORY_MAX_TURNS,
+                token_budget=CHAT_HISTORY_TOKEN_BUDGET,
+            ),
+            llm_calls.as_middleware("chatbot"),
+            tool_cache,
+        ],
+    )
+
+    return Agents(
+        insights=insights_agent,
+        event_suggestion=event_suggestion_agent,
+        chatbot=chatbot_agent,
+    )
 
 
-def create_ai_insights(user_id: str) -> HealthInsightsResponse | Any:
-    """Generate AI insights based on the user's health data and objectives."""
+def get_agents() -> Agents:
+    """Build the agent graphs on first use; safe to call from worker threads."""
+    global _agents
+    if _agents is None:
+        with _agents_lock:
+            if _agents is None:
+                _agents = _build_agents()
+    return _agents
+
+
+def warm_up_agents() -> None:
+    """Build the model and agent graphs ahead of the first request."""
+    try:
+        get_agents()
+    except Exception as e:
+        logger.error(f"Failed to build agents: {e}")
+
+
+async def _invoke_agent(
+    name: str, agent: str, payload: dict, config: dict | None = None
+) -> dict[str, Any]:
+    """
+    Invoke one of the agent graphs with metrics callbacks and a tool result
+    scope. Each model call inside the run is guarded by the agent's
+    llm_calls middleware.
+    """
+    from app.dependencies.agent_metrics import agent_callbacks
+
+    agents = _agents or await asyncio.to_thread(get_agents)
+    graph = getattr(agents, agent)
+
+    with tool_results.run_scope():
+        return await graph.ainvoke(
+            payload, config={**(config or {}), "callbacks": agent_callbacks(name)}
+        )
+
+
+async def get_user_goals(user_id: str) -> dict[str, Any] | None:
+    """Fetch the user's step goal and custom goals, or None when unavailable."""
+    try:
+        profile = await get_user_profile(user_id)
+    except Exception as e:
+        logger.warning(f"Failed to fetch goals for user {user_id}: {e}")
+        return None
+
+    if profile is None:
+        return None
+    return {key: profile.get(key) for key in ("step_goal", "custom_goals")}
+
+
+async def create_ai_insights(user_id: str, enrich: bool = False) -> HealthInsightsResponse | Any:
+    """
+    Generate insights based on the user's health data and objectives.
+
+    The health thresholds and step goal are evaluated by rules; the agent is
+    only run to write a narrative when enrich is set or the rules find nothing
+    conclusive.
+    """
+    health_data = get_mock_health_data(user_id)
+    goals = await get_user_goals(user_id)
+    insights = rule_based_insights(health_data, (goals or {}).get("step_goal"))
+    if insights is not None and not enrich:
+        return insights
+
     current_datetime = datetime.now()
+    findings = (
+        f" Rule-based findings for today: {insights.response_text}" if insights else ""
+    )
 
-    response = agent.invoke(
+    response = await _invoke_agent(
+        "insights",
+        "insights",
         {
             "messages": [
                 {
                     "role": "user",
-                    "content": f"Generate personalized health insights for me based on their objectives, today's health data, and schedule. My user ID is {user_id}. Current date and time is {current_datetime.strftime('%Y-%m-%d %H:%M:%S')}.",
+                    "content": f"Generate personalized health insights for me based on their objectives, today's health data, and schedule. My user ID is {user_id}. Current date and time is {current_datetime.strftime('%Y-%m-%d %H:%M:%S')}.{findings}",
                 }
             ]
         },
@@ -168,21 +356,23 @@ def create_ai_insights(user_id: str) -> HealthInsightsResponse | Any:
 
     structured = response.get("structured_response")
     if structured:
-        return structured
-    # return (
-    #     "\n".join(
-    #         [_["text"] for _ in response["messages"][-1].content if _["type"] == "text"]
-    #     )
-    #     or "No insights generated."
-    # )
+        return HealthInsightsResponse(
+            response_text=structured.response_text,
+            findings=insights.findings if insights else [],
+            source="llm",
+            ai_insights=structured.response_text,
+        )
+    return insights
 
 
-def ai_event_changed_suggestions(user_id: str, changed_events: list[str]) -> Any:
+async def ai_event_changed_suggestions(user_id: str, changed_events: list[str]) -> Any:
     """Generate AI suggestions for adapting to changed events in the user's schedule."""
     if not changed_events:
         return "No changed events provided."
 
-    response = event_suggestion_agent.invoke(
+    response = await _invoke_agent(
+        "event_changed_suggestion",
+        "event_suggestion",
         {
             "messages": [
                 {
@@ -193,7 +383,7 @@ def ai_event_changed_suggestions(user_id: str, changed_events: list[str]) -> Any
                     ),
                 }
             ]
-        }
+        },
     )
 
     structured = response.get("structured_response")
@@ -208,56 +398,68 @@ def ai_event_changed_suggestions(user_id: str, changed_events: list[str]) -> Any
     )
 
 
-def ai_event_day_suggestions(user_id: str) -> Any:
-    """Generate AI suggestions for a specific day based on events in the user's schedule."""
-    current_datetime = datetime.now()
-    response = event_suggestion_agent.invoke(
-        {
-            "messages": [
-                {
-                    "role": "user",
-                    "content": (
-                        f"My user ID is {user_id}. Review today's health objectives, custom goals and calendar, then propose one supportive event in ISO 8601 format. Current date and time is {current_datetime.strftime('%Y-%m-%d %H:%M:%S')}"
-                        "If no change is required, respond with 'No changes needed.'"
-                    ),
-                }
-            ]
-        }
-    )
+async def _write_rationale(plan: PlannedWorkout) -> str:
+    """Let the model rephrase the planner's rationale, keeping it on failure."""
+    from app.dependencies.agent_metrics import agent_callbacks
+
+    async def run() -> str:
+        response = await get_llm_model().ainvoke(
+            [
+                ("system", RATIONALE_PROMPT),
+                (
+                    "human",
+                    f"Planned: {plan.description} from {plan.start:%H:%M} to {plan.end:%H:%M}. Reason: {plan.rationale}",
+                ),
+            ],
+            config={"callbacks": agent_callbacks("planner_rationale")},
+        )
+        return response.text.strip()
 
-    structured = response.get("structured_response")
-    if structured:
-        return structured
+    try:
+        return await llm_calls.call("planner_rationale", run) or plan.rationale
+    except Exception as e:
+        logger.warning(f"Keeping the planner rationale: {e}")
+        return plan.rationale
 
-    return (
-        "\n".join(
-            [_["text"] for _ in response["messages"][-1].content if _["type"] == "text"]
-        )
-        or "No suggestions generated."
-    )
 
+async def ai_event_day_suggestions(user_id: str) -> Any:
+    """
+    Suggest one supportive event for today.
 
-checkpointer = InMemorySaver()
+    Slots, sports and durations come from the local workout planner, so
+    suggestions never overlap the calendar; the model may only rephrase the
+    rationale when PLANNER_LLM_RATIONALE is enabled.
+    """
+    goals, events = await asyncio.gather(
+        get_user_goals(user_id), asyncio.to_thread(getTodayEvents)
+    )
+    health_data = get_mock_health_data(user_id)
+    goals = goals or {}
 
-chatbot_agent = create_agent(
-    model=llm_model,
-    tools=[
-        get_users_objectives,
-        get_today_health_data,
-        get_today_schedule,
-        create_calendar_event,
-    ],
-    response_format=HealthChatbotResponse,
-    checkpointer=checkpointer,
-    system_prompt=HEALTH_CHATBOT_AGENT_PROMPT,
-)
+    plans = plan_workouts(
+        events, health_data, goals.get("step_goal"), goals.get("custom_goals")
+    )
+    if not plans:
+        return "No changes needed."
+
+    plan = plans[0]
+    rationale = await _write_rationale(plan) if PLANNER_LLM_RATIONALE else plan.rationale
+    return EventSuggestion(
+        start_time=plan.start.isoformat(),
+        end_time=plan.end.isoformat(),
+        title=plan.title,
+        description=plan.description,
+        rationale=rationale,
+    )
 
 
-def ai_health_chatbot_conversation(user_id: str, user_message: str) -> Any:
+async def ai_health_chatbot_conversation(user_id: str, user_message: str) -> Any:
     """Generate AI chatbot response based on user's health data and objectives."""
     current_datetime = datetime.now()
 
-    response = chatbot_agent.invoke(
+    response = await _invoke_agent(
+        "chatbot",
+        "chatbot",
         {
             "messages": [
                 {
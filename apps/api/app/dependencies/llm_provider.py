@@ -0,0 +1,37 @@
+from typing import TYPE_CHECKING
+
+from app.dependencies.config import (
+    FAKE_LLM_LATENCY_DISTRIBUTION,
+    FAKE_LLM_LATENCY_JITTER_MS,
+    FAKE_LLM_LATENCY_MS,
+    LLM_MODEL,
+    LLM_PROVIDER,
+)
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
+
+def create_chat_model() -> "BaseChatModel":
+    """
+    Create the chat model used by every agent, selected by LLM_PROVIDER.
+
+    Providers:
+    - gemini: Google Gemini through langchain-google-genai (default)
+    - fake: deterministic offline model for load testing and benchmarks
+    """
+    if LLM_PROVIDER == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(model=LLM_MODEL)
+
+    if LLM_PROVIDER == "fake":
+        from app.dependencies.fake_llm import FakeHealthChatModel
+
+        return FakeHealthChatModel(
+            latency_ms=FAKE_LLM_LATENCY_MS,
+            latency_jitter_ms=FAKE_LLM_LATENCY_JITTER_MS,
+            latency_distribution=FAKE_LLM_LATENCY_DISTRIBUTION,
+        )
+
+    raise ValueError(f"Unsupported LLM_PROVIDER: {LLM_PROVIDER}")
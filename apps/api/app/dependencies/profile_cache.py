@@ -0,0 +1,153 @@
+"""
+Profile Cache - Read-through LRU cache of user profiles with write-through updates
+"""
+
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from app.utils.metrics import cache_requests, metrics
+from app.utils.single_flight import SingleFlight
+
+# Configuration
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "10000"))
+PROFILE_CACHE_TTL_SEC = float(os.getenv("PROFILE_CACHE_TTL_SEC", "300"))
+PROFILE_CACHE_NEGATIVE_TTL_SEC = float(os.getenv("PROFILE_CACHE_NEGATIVE_TTL_SEC", "30"))
+
+Profile = dict[str, Any]
+
+
+class ProfileCache:
+    """Keeps recently read user profiles in memory
+
+    Profiles are evicted least recently used first and expire after a TTL;
+    users that do not exist are remembered for a shorter TTL so repeated
+    lookups do not reach Supabase either. Concurrent misses for one user
+    share a single fetch, and a fetch that races with a write is not
+    stored, so a write is never overwritten by an older read.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = PROFILE_CACHE_MAX_ENTRIES,
+        ttl_sec: float = PROFILE_CACHE_TTL_SEC,
+        negative_ttl_sec: float = PROFILE_CACHE_NEGATIVE_TTL_SEC,
+    ):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.negative_ttl_sec = negative_ttl_sec
+        self.entries: OrderedDict[str, tuple[float, Profile | None]] = OrderedDict()
+        # Write counts of users with a fetch in flight, dropped when it settles
+        self.versions: dict[str, int] = {}
+        self.loading: dict[str, int] = {}
+        self.fetches = SingleFlight("user_profiles")
+
+    def lookup(self, user_id: str) -> tuple[bool, Profile | None]:
+        """Return (found, profile); a found None means the user does not exist"""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return False, None
+
+        expires_at, profile = entry
+        if expires_at <= time.monotonic():
+            del self.entries[user_id]
+            return False, None
+
+        self.entries.move_to_end(user_id)
+        return True, profile
+
+    def put(self, user_id: str, profile: Profile | None) -> None:
+        """Store a profile, or remember that the user does not exist"""
+        ttl = self.ttl_sec if profile is not None else self.negative_ttl_sec
+        self.entries[user_id] = (time.monotonic() + ttl, profile)
+        self.entries.move_to_end(user_id)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def write(self, user_id: str, profile: Profile | None) -> None:
+        """Record the result of a write; in-flight reads will not overwrite it"""
+        if user_id in self.loading:
+            self.versions[user_id] = self.versions.get(user_id, 0) + 1
+        if profile is None:
+            self.entries.pop(user_id, None)
+        else:
+            self.put(user_id, profile)
+
+    def invalidate(self, user_id: str) -> None:
+        self.write(user_id, None)
+
+    async def get(
+        self, user_id: str, fetch: Callable[[str], Awaitable[Profile | None]]
+    ) -> Profile | None:
+        """Serve a profile from memory, fetching and caching it on a miss"""
+        found, profile = self.lookup(user_id)
+        if found:
+            result = "hit" if profile is not None else "negative_hit"
+            cache_requests.inc(cache="user_profile", result=result)
+            return profile
+
+        cache_requests.inc(cache="user_profile", result="miss")
+
+        async def load() -> Profile | None:
+            versions = self._start_loading([user_id])
+            try:
+                profile = await fetch(user_id)
+                self._store_loaded({user_id: profile}, versions)
+                return profile
+            finally:
+                self._finish_loading([user_id])
+
+        return await self.fetches.do(user_id, load)
+
+    async def load_many(
+        self,
+        user_ids: list[str],
+        fetch: Callable[[list[str]], Awaitable[dict[str, Profile]]],
+    ) -> dict[str, Profile]:
+        """Fetch many profiles in one request and cache them like get does
+
+        Users missing from the result are cached as not existing; users
+        written to while the fetch was in flight are not cached at all.
+        """
+        versions = self._start_loading(user_ids)
+        try:
+            profiles = await fetch(user_ids)
+            self._store_loaded(
+                {user_id: profiles.get(user_id) for user_id in user_ids}, versions
+            )
+            return profiles
+        finally:
+            self._finish_loading(user_ids)
+
+    def _start_loading(self, user_ids: list[str]) -> dict[str, int]:
+        """Register fetches in flight; returns each user's write count"""
+        for user_id in user_ids:
+            self.loading[user_id] = self.loading.get(user_id, 0) + 1
+        return {user_id: self.versions.get(user_id, 0) for user_id in user_ids}
+
+    def _store_loaded(
+        self, profiles: dict[str, Profile | None], versions: dict[str, int]
+    ) -> None:
+        for user_id, profile in profiles.items():
+            if self.versions.get(user_id, 0) == versions[user_id]:
+                self.put(user_id, profile)
+
+    def _finish_loading(self, user_ids: list[str]) -> None:
+        for user_id in user_ids:
+            self.loading[user_id] -= 1
+            if not self.loading[user_id]:
+                del self.loading[user_id]
+                self.versions.pop(user_id, None)
+
+
+# Global profile cache shared by the REST endpoints and the agent tools
+profile_cache = ProfileCache()
+
+metrics.gauge(
+    "user_profile_cache_entries",
+    "User profiles (and known missing users) held in memory",
+    lambda: len(profile_cache.entries),
+)
@@ -0,0 +1,25 @@
+from typing import Awaitable, Callable
+
+from langchain.agents.middleware import AgentMiddleware, ModelRequest, ModelResponse
+
+from app.utils.resilience import ResilientCaller
+
+
+class ResilientModelMiddleware(AgentMiddleware):
+    """Runs each model call of an agent through a ResilientCaller
+
+    Only the model call is guarded, so tool failures never count against the
+    breaker and a hedge repeats the model call, never the tools.
+    """
+
+    def __init__(self, caller: ResilientCaller, call: str):
+        super().__init__()
+        self.caller = caller
+        self.call = call
+
+    async def awrap_model_call(
+        self,
+        request: ModelRequest,
+        handler: Callable[[ModelRequest], Awaitable[ModelResponse]],
+    ) -> ModelResponse:
+        return await self.caller.call(self.call, lambda: handler(request))
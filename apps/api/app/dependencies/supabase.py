@@ -1,14 +1,72 @@
-from supabase import Client, create_client, create_async_client
-from supabase.client import ClientOptions
+import asyncio
+import logging
+from typing import TYPE_CHECKING
 
-from app.dependencies.config import SUPABASE_KEY, SUPABASE_URL
+from app.dependencies.config import SUPABASE_KEY, SUPABASE_TIMEOUT_SEC, SUPABASE_URL
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+logger = logging.getLogger("supabase")
 
 url: str = SUPABASE_URL or ""
 key: str = SUPABASE_KEY or ""
-supabase_client: Client = create_client(
-    url,
-    key,
-    options=ClientOptions(
-        schema="public",
-    ),
-)
\ No newline at end of file
+
+_client: "AsyncClient | None" = None
+_client_lock = asyncio.Lock()
+
+
+async def open_supabase_client() -> "AsyncClient":
+    """
+    Create the shared async Supabase client.
+
+    Called from lifespan; its HTTP connections are reused by every request
+    until close_supabase_client().
+    """
+    global _client
+    async with _client_lock:
+        if _client is None:
+            from supabase import AsyncClientOptions, acreate_client
+
+            client = await acreate_client(
+                url,
+                key,
+                options=AsyncClientOptions(
+                    schema="public",
+                    postgrest_client_timeout=SUPABASE_TIMEOUT_SEC,
+                ),
+            )
+            # Build the REST client now rather than on the first query
+            _ = client.postgrest
+            _client = client
+    return _client
+
+
+async def get_supabase_client() -> "AsyncClient":
+    """Return the shared async Supabase client, creating it on first use."""
+    return _client or await open_supabase_client()
+
+
+async def close_supabase_client() -> None:
+    """Close the HTTP connections of every sub-client the shared client opened."""
+    global _client
+    if _client is None:
+        return
+
+    client, _client = _client, None
+    closers = {
+        "postgrest": client.postgrest.aclose,
+        "auth": client.auth.close,
+        "realtime": client.realtime.close,
+    }
+    # Storage and functions clients are only created on first use
+    if client._storage is not None:
+        closers["storage"] = client._storage.session.aclose
+    if client._functions is not None:
+        closers["functions"] = client._functions._client.aclose
+
+    for name, close in closers.items():
+        try:
+            await close()
+        except Exception as e:
+            logger.warning(f"Failed to close Supabase {name} client: {e}")
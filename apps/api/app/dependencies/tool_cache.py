@@ -0,0 +1,195 @@
+"""
+Tool Cache - Memoizes agent tool results within a run and briefly across runs
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+from app.utils.metrics import metrics
+
+# Read-only tools and how long their results may be shared across runs
+READ_ONLY_TOOL_TTL_SEC = {
+    "get_users_objectives": 300,
+    "get_today_health_data": 60,
+    "get_health_percentiles": 300,
+    "get_today_schedule": 30,
+}
+# Read-only tools whose results depend on the user's profile
+PROFILE_TOOLS = ("get_users_objectives", "get_health_percentiles")
+# Results that must be fetched again next time, e.g. a user created moments later
+UNCACHEABLE_RESULTS = ("User not found.",)
+# Write tools and the read-only tools whose results they make stale
+WRITE_TOOL_INVALIDATES = {
+    "create_calendar_event": ("get_today_schedule",),
+}
+SHARED_TOOL_CACHE_ENABLED = os.getenv("ENABLE_SHARED_TOOL_CACHE", "1") == "1"
+SHARED_TOOL_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_TOOL_CACHE_MAX_ENTRIES", "10000"))
+
+tool_cache_requests = metrics.counter(
+    "agent_tool_cache_total",
+    "Tool result lookups by tool and result (run_hit, shared_hit, miss)",
+    ("tool", "result"),
+)
+
+CacheKey = tuple[str, str]
+
+_run_results: ContextVar[dict[CacheKey, str] | None] = ContextVar(
+    "tool_cache_run_results", default=None
+)
+
+
+def _cache_key(tool_call: dict[str, Any]) -> CacheKey:
+    return tool_call["name"], json.dumps(tool_call.get("args") or {}, sort_keys=True)
+
+
+def _is_error(message: Any) -> bool:
+    content = message.content if isinstance(message.content, str) else ""
+    return message.status == "error" or content.startswith("An error occurred")
+
+
+def _is_cacheable(message: Any) -> bool:
+    return message.content not in UNCACHEABLE_RESULTS
+
+
+class ToolResultCache:
+    """Serves repeated read-only tool calls from memory
+
+    Results are memoized for the duration of a ``run_scope()`` so every turn
+    of one invocation reuses them, and optionally shared across runs for a
+    short per-tool TTL, up to SHARED_TOOL_CACHE_MAX_ENTRIES. A successful
+    write tool call evicts the read-only results it makes stale.
+
+    Agents use it through ``as_middleware()``; invalidation and scoping do
+    not import LangChain so they stay cheap for callers outside the agents.
+    """
+
+    def __init__(self):
+        self.shared: dict[CacheKey, tuple[float, str]] = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def run_scope(self) -> Iterator[None]:
+        """Memoize tool results for the agent invocation running in this block"""
+        token = _run_results.set({})
+        try:
+            yield
+        finally:
+            _run_results.reset(token)
+
+    def invalidate(self, tool_name: str, args: dict[str, Any] | None = None) -> None:
+        """Drop cached results of a tool, optionally only for the given arguments"""
+        key = _cache_key({"name": tool_name, "args": args}) if args is not None else None
+        stores = [self.shared]
+        run_results = _run_results.get()
+        if run_results is not None:
+            stores.append(run_results)
+
+        with self.lock:
+            for store in stores:
+                for cached_key in list(store):
+                    if cached_key == key or (key is None and cached_key[0] == tool_name):
+                        del store[cached_key]
+
+    def invalidate_users(self, user_ids: list[str]) -> None:
+        """Drop profile-dependent results of users whose profile was written"""
+        args = {json.dumps({"user_id": user_id}) for user_id in user_ids}
+        stores = [self.shared]
+        run_results = _run_results.get()
+        if run_results is not None:
+            stores.append(run_results)
+
+        with self.lock:
+            for store in stores:
+                for cached_key in list(store):
+                    if cached_key[0] in PROFILE_TOOLS and cached_key[1] in args:
+                        del store[cached_key]
+
+    def _lookup(self, key: CacheKey) -> str | None:
+        run_results = _run_results.get()
+
+        with self.lock:
+            if run_results is not None and key in run_results:
+                tool_cache_requests.inc(tool=key[0], result="run_hit")
+                return run_results[key]
+
+            shared = self.shared.get(key)
+            if shared is not None:
+                expires_at, content = shared
+                if expires_at > time.monotonic():
+                    if run_results is not None:
+                        run_results[key] = content
+                    tool_cache_requests.inc(tool=key[0], result="shared_hit")
+                    return content
+                del self.shared[key]
+
+        tool_cache_requests.inc(tool=key[0], result="miss")
+        return None
+
+    def _store(self, key: CacheKey, content: str) -> None:
+        run_results = _run_results.get()
+
+        with self.lock:
+            if run_results is not None:
+                run_results[key] = content
+            if SHARED_TOOL_CACHE_ENABLED:
+                now = time.monotonic()
+                # Re-inserted so the dict stays ordered oldest first
+                self.shared.pop(key, None)
+                self.shared[key] = (now + READ_ONLY_TOOL_TTL_SEC[key[0]], content)
+                if len(self.shared) > SHARED_TOOL_CACHE_MAX_ENTRIES:
+                    self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        """Drop expired results, then the oldest until the cache is under its cap"""
+        for cached_key, (expires_at, _) in list(self.shared.items()):
+            if expires_at <= now:
+                del self.shared[cached_key]
+        while len(self.shared) > SHARED_TOOL_CACHE_MAX_ENTRIES:
+            del self.shared[next(iter(self.shared))]
+
+    def as_middleware(self):
+        """Agent middleware that routes tool calls through this cache"""
+        from app.dependencies.tool_cache_middleware import ToolResultCacheMiddleware
+
+        return ToolResultCacheMiddleware(self)
+
+    def before_call(self, tool_call: dict[str, Any]) -> Any | None:
+        """Return a cached ToolMessage for the call, if any"""
+        from langchain_core.messages import ToolMessage
+
+        name = tool_call["name"]
+        if name not in READ_ONLY_TOOL_TTL_SEC:
+            return None
+
+        content = self._lookup(_cache_key(tool_call))
+        if content is None:
+            return None
+
+        return ToolMessage(content=content, name=name, tool_call_id=tool_call["id"])
+
+    def after_call(self, tool_call: dict[str, Any], result: Any) -> None:
+        """Remember a read-only result or evict what a write made stale"""
+        from langchain_core.messages import ToolMessage
+
+        if not isinstance(result, ToolMessage) or _is_error(result):
+            return
+
+        name = tool_call["name"]
+        if (
+            name in READ_ONLY_TOOL_TTL_SEC
+            and isinstance(result.content, str)
+            and _is_cacheable(result)
+        ):
+            self._store(_cache_key(tool_call), result.content)
+
+        for dependent in WRITE_TOOL_INVALIDATES.get(name, ()):
+            self.invalidate(dependent)
+
+
+# Global tool cache shared by every agent
+tool_results = ToolResultCache()
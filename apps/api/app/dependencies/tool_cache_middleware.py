@@ -0,0 +1,42 @@
+from typing import Awaitable, Callable
+
+from langchain.agents.middleware import AgentMiddleware
+from langchain.tools.tool_node import ToolCallRequest
+from langchain_core.messages import ToolMessage
+from langgraph.types import Command
+
+from app.dependencies.tool_cache import ToolResultCache
+
+
+class ToolResultCacheMiddleware(AgentMiddleware):
+    """Answers tool calls from a ToolResultCache before executing the tool"""
+
+    def __init__(self, cache: ToolResultCache):
+        super().__init__()
+        self.cache = cache
+
+    def wrap_tool_call(
+        self,
+        request: ToolCallRequest,
+        handler: Callable[[ToolCallRequest], ToolMessage | Command],
+    ) -> ToolMessage | Command:
+        cached = self.cache.before_call(request.tool_call)
+        if cached is not None:
+            return cached
+
+        result = handler(request)
+        self.cache.after_call(request.tool_call, result)
+        return result
+
+    async def awrap_tool_call(
+        self,
+        request: ToolCallRequest,
+        handler: Callable[[ToolCallRequest], Awaitable[ToolMessage | Command]],
+    ) -> ToolMessage | Command:
+        cached = self.cache.before_call(request.tool_call)
+        if cached is not None:
+            return cached
+
+        result = await handler(request)
+        self.cache.after_call(request.tool_call, result)
+        return result
@@ -1,4 +1,22 @@
-from app.dependencies.supabase import supabase_client
+import asyncio
+from typing import Any
+
+from pydantic import ValidationError
+
+from app.dependencies.profile_cache import profile_cache
+from app.dependencies.supabase import get_supabase_client
+from app.models.user import User
+
+BULK_FETCH_CHUNK_SIZE = 500  # IDs per in_ query, keeps the request URL short
+BULK_WRITE_CHUNK_SIZE = 1000  # Rows per insert/upsert request
+BULK_MAX_CONCURRENCY = 4  # Chunks sent to Supabase at the same time
+USER_COLUMNS = tuple(User.model_fields)
+
+
+async def _fetch_user_profile(user_id: str):
+    client = await get_supabase_client()
+    response = await client.table("users").select("*").eq("id", user_id).execute()
+    return response.data[0] if response.data else None
 
 
 async def create_user_profile(profile_data: dict):
@@ -6,21 +24,23 @@ async def create_user_profile(profile_data: dict):
     Create a new user profile in Supabase.
     """
     try:
-        response = supabase_client.table("users").insert(profile_data).execute()
-        return response.data[0] if response.data else None
+        client = await get_supabase_client()
+        response = await client.table("users").insert(profile_data).execute()
+        profile = response.data[0] if response.data else None
     except Exception as e:
         raise Exception(f"Error creating user profile: {str(e)}")
 
+    if profile is not None:
+        profile_cache.write(profile["id"], profile)
+    return profile
+
 
 async def get_user_profile(user_id: str):
     """
-    Fetch user profile from Supabase based on user_id.
+    Fetch user profile from Supabase based on user_id, served from the profile cache when possible.
     """
     try:
-        response = (
-            supabase_client.table("users").select("*").eq("id", user_id).execute()
-        )
-        return response.data[0] if response.data else None
+        return await profile_cache.get(user_id, _fetch_user_profile)
     except Exception as e:
         raise Exception(f"Error fetching user profile: {str(e)}")
 
@@ -30,12 +50,173 @@ async def update_user_profile(user_id: str, profile_data: dict):
     Update user profile in Supabase based on user_id.
     """
     try:
-        response = (
-            supabase_client.table("users")
-            .update(profile_data)
-            .eq("id", user_id)
-            .execute()
+        client = await get_supabase_client()
+        response = await (
+            client.table("users").update(profile_data).eq("id", user_id).execute()
         )
-        return response.data[0] if response.data else None
+        profile = response.data[0] if response.data else None
     except Exception as e:
+        # The write may have been applied, so do not trust the cached row
+        profile_cache.invalidate(user_id)
         raise Exception(f"Error updating user profile: {str(e)}")
+
+    profile_cache.write(user_id, profile)
+    return profile
+
+
+async def _fetch_chunk(user_ids: list[str], select: str) -> list[dict[str, Any]]:
+    client = await get_supabase_client()
+    response = await client.table("users").select(select).in_("id", user_ids).execute()
+    return response.data
+
+
+async def get_user_profiles(
+    user_ids: list[str], columns: list[str] | None = None
+) -> dict[str, dict[str, Any]]:
+    """
+    Fetch many user profiles, keyed by ID; missing users are left out.
+
+    Cached profiles are served from memory and the rest are fetched with one
+    in_ query per chunk of IDs. With columns, only those columns are
+    returned and fetched rows are not cached.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    profiles: dict[str, dict[str, Any]] = {}
+    misses = []
+
+    for user_id in user_ids:
+        found, profile = profile_cache.lookup(user_id)
+        if not found:
+            misses.append(user_id)
+        elif profile is not None:
+            profiles[user_id] = profile
+
+    select = ",".join(dict.fromkeys(["id", *columns])) if columns else "*"
+    semaphore = asyncio.Semaphore(BULK_MAX_CONCURRENCY)
+
+    async def fetch_rows(chunk: list[str]) -> dict[str, dict[str, Any]]:
+        async with semaphore:
+            return {row["id"]: row for row in await _fetch_chunk(chunk, select)}
+
+    async def fetch(chunk: list[str]) -> dict[str, dict[str, Any]]:
+        if columns:
+            # Partial rows are not cached
+            return await fetch_rows(chunk)
+        return await profile_cache.load_many(chunk, fetch_rows)
+
+    try:
+        chunks = await asyncio.gather(
+            *(
+                fetch(misses[start : start + BULK_FETCH_CHUNK_SIZE])
+                for start in range(0, len(misses), BULK_FETCH_CHUNK_SIZE)
+            )
+        )
+    except Exception as e:
+        raise Exception(f"Error fetching user profiles: {str(e)}")
+
+    for rows in chunks:
+        profiles.update(rows)
+
+    if columns:
+        profiles = {
+            user_id: {column: profile.get(column) for column in ["id", *columns]}
+            for user_id, profile in profiles.items()
+        }
+    return profiles
+
+
+def _is_row_error(error: Exception) -> bool:
+    """Whether Supabase rejected the rows themselves rather than the request"""
+    code = getattr(error, "code", None)
+    if code == 413:  # Payload too large
+        return True
+    # Postgres data exceptions (22xxx) and constraint violations (23xxx)
+    return isinstance(code, str) and code[:2] in ("22", "23")
+
+
+async def _write_rows(
+    rows: list[tuple[int, dict[str, Any]]],
+    upsert: bool,
+    semaphore: asyncio.Semaphore,
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """
+    Insert or upsert rows in one request.
+
+    A batch rejected for its size or for one of its rows is split in half
+    and retried, so one bad row costs about log2(batch size) extra requests
+    and is reported on its own. Any other error fails the whole batch.
+    """
+    client = await get_supabase_client()
+    query = client.table("users")
+    payload = [row for _, row in rows]
+    try:
+        async with semaphore:
+            if upsert:
+                response = await query.upsert(payload, on_conflict="id").execute()
+            else:
+                response = await query.insert(payload).execute()
+        return response.data, []
+    except Exception as e:
+        if len(rows) == 1 or not _is_row_error(e):
+            error = getattr(e, "message", None) or str(e)
+            return [], [
+                {"index": index, "id": row.get("id"), "error": error}
+                for index, row in rows
+            ]
+
+    middle = len(rows) // 2
+    first, second = await asyncio.gather(
+        _write_rows(rows[:middle], upsert, semaphore),
+        _write_rows(rows[middle:], upsert, semaphore),
+    )
+    return first[0] + second[0], first[1] + second[1]
+
+
+async def bulk_create_user_profiles(
+    rows: list[dict[str, Any]], upsert: bool = False
+) -> dict[str, Any]:
+    """
+    Validate and insert (or upsert) many user profiles in chunked batches.
+
+    Returns how many rows were written and the index, ID and error of every
+    row that failed validation or was rejected by Supabase.
+    """
+    errors: list[dict[str, Any]] = []
+    valid: list[tuple[int, dict[str, Any]]] = []
+
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, User.model_validate(row).model_dump(mode="json")))
+        except ValidationError as e:
+            errors.append(
+                {
+                    "index": index,
+                    "id": row.get("id") if isinstance(row, dict) else None,
+                    "error": "; ".join(
+                        f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                        for error in e.errors()
+                    ),
+                }
+            )
+
+    semaphore = asyncio.Semaphore(BULK_MAX_CONCURRENCY)
+    results = await asyncio.gather(
+        *(
+            _write_rows(valid[start : start + BULK_WRITE_CHUNK_SIZE], upsert, semaphore)
+            for start in range(0, len(valid), BULK_WRITE_CHUNK_SIZE)
+        )
+    )
+
+    written = 0
+    for profiles, chunk_errors in results:
+        written += len(profiles)
+        errors.extend(chunk_errors)
+        for profile in profiles:
+            profile_cache.write(profile["id"], profile)
+
+    return {
+        "total": len(rows),
+        "written": written,
+        "failed": len(errors),
+        "errors": sorted(errors, key=lambda error: error["index"]),
+    }
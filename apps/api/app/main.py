@@ -1,39 +1,109 @@
-import json
+import asyncio
+import logging
+import math
+import time
 from contextlib import asynccontextmanager
 from dataclasses import asdict, is_dataclass
-from typing import Optional
+from typing import Any, Optional
 
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 
 from app.dependencies.auth import get_current_user
+from app.dependencies.batch_insights import (
+    batch_jobs,
+    start_batch_insights,
+    stop_batch_insights,
+)
 from app.dependencies.calendar import (
     createCalendarEvent,
     getCalendarEvents,
     getTodayEvents,
 )
+from app.dependencies.config import WARM_AGENTS_ON_STARTUP
 from app.dependencies.langchain import (
-    ai_event_day_suggestions,
     ai_health_chatbot_conversation,
-    create_ai_insights,
+    warm_up_agents,
 )
+from app.dependencies.supabase import close_supabase_client, open_supabase_client
+from app.dependencies.tool_cache import tool_results
 from app.dependencies.user_profile import (
+    USER_COLUMNS,
+    bulk_create_user_profiles,
     create_user_profile,
     get_user_profile,
+    get_user_profiles,
     update_user_profile,
 )
 from app.models.calendar import CreateEventRequest
 from app.utils.event_poller import event_poller
-from app.utils.random_health_data import get_persisted_mock_health_data
-from app.utils.timestamp import parse_iso_timestamp
+from app.utils.insight_precomputer import insight_precomputer
+from app.utils.metrics import metrics
+from app.utils.health_rollups import RESOLUTIONS as ROLLUP_RESOLUTIONS, health_rollups
+from app.utils.health_export import (
+    EXPORT_DATASETS,
+    EXPORT_FORMATS,
+    stream_export,
+)
+from app.utils.health_store import (
+    METRICS as HEALTH_METRICS,
+    StoreLockedError,
+    health_store,
+)
+from app.utils.population_sketches import (
+    COHORT_FIELDS,
+    cohort_of,
+    latest_daily_values,
+    population_sketches,
+)
+from app.utils.resilience import CircuitOpenError
+from app.utils.sample_ingest import (
+    IngestBufferFull,
+    IngestResult,
+    InvalidSample,
+    iter_lines,
+    sample_ingestor,
+)
+from app.utils.single_flight import agent_requests, normalize_input
+from app.utils.timestamp import ensure_unix_timestamp, parse_iso_timestamp
+
+logger = logging.getLogger("api")
+
+
+def _log_warm_up_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Agent warm-up failed: {task.exception()}")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Build the model and agents off the event loop so startup stays fast
+    warm_up = None
+    if WARM_AGENTS_ON_STARTUP:
+        warm_up = asyncio.create_task(asyncio.to_thread(warm_up_agents))
+        warm_up.add_done_callback(_log_warm_up_failure)
+        app.state.agent_warm_up = warm_up
+    try:
+        await open_supabase_client()
+    except Exception as exc:
+        # Retried on first use, so the API still starts without Supabase
+        logger.warning(f"Supabase client not ready: {exc}")
     await event_poller.start()
+    await insight_precomputer.start()
+    await sample_ingestor.start()
     yield
+    if warm_up is not None and not warm_up.done():
+        # The build itself finishes in its thread; only stop waiting for it
+        warm_up.cancel()
+        await asyncio.gather(warm_up, return_exceptions=True)
+    await sample_ingestor.stop()
+    # Batch jobs still use the Supabase client closed below
+    await stop_batch_insights()
+    await insight_precomputer.stop()
     await event_poller.stop()
+    await close_supabase_client()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -62,32 +132,290 @@ def read_root():
     return {"Hello": "World", "message": "Calendar API is running"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """
+    Agent latency, token, tool and cache metrics in the Prometheus text format.
+    """
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+async def serve_ai_insights(user_id: str, response: Response, enrich: bool = False):
+    """
+    Serve the precomputed insights, computing them on a cache miss.
+
+    Insights come from the health rules; enrich adds a narrative written by the agent.
+    """
+    kind = "insights_narrative" if enrich else "insights"
+    try:
+        result = await insight_precomputer.get(kind, user_id)
+    except (CircuitOpenError, TimeoutError) as exc:
+        if not enrich:
+            raise HTTPException(
+                status_code=503, detail=f"Insights are temporarily unavailable: {exc}"
+            )
+        # Without the model, fall back to the rule-based insights
+        result = await insight_precomputer.get("insights", user_id)
+        response.headers["X-Fallback"] = "rules"
+
+    response.headers["X-Generated-At"] = result.generated_at.isoformat()
+    return result.value
+
+
 @app.get("/health/insights")
-async def health_insights(user_id: str = Depends(get_current_user)):
-    return create_ai_insights(user_id=user_id)
-
-
-@app.get("health/data")
-async def health_data(user_id: str = Depends(get_current_user)):
-    mock_data = get_persisted_mock_health_data("realistic")
-
-    return json.dumps(
-        {
-            "steps": mock_data["steps"],
-            "distance_meters": mock_data["distance_meters"],
-            "calories_burned": mock_data["calories_burned"],
-            "sleep_duration": mock_data["sleep_duration"],
-            "sleep_quality": mock_data["sleep_quality"],
-            "heart_rate": mock_data["heart_rate"],
-            "stress_score": mock_data["stress_score"],
-            "bp_systolic": mock_data["bp_systolic"],
-            "bp_diastolic": mock_data["bp_diastolic"],
-            "blood_glucose": mock_data["blood_glucose"],
-            "blood_oxygen": mock_data["blood_oxygen"],
-            "blood_pressure": mock_data["blood_pressure"],
-            "timestamp": mock_data["timestamp"],
-            "weekly_workouts": mock_data["weekly_workouts"],
-        }
+async def health_insights(
+    response: Response, enrich: bool = False, user_id: str = Depends(get_current_user)
+):
+    return await serve_ai_insights(user_id=user_id, response=response, enrich=enrich)
+
+
+HEALTH_DATA_DEFAULT_WINDOW_SEC = 24 * 3600
+HEALTH_CHART_DEFAULT_POINTS = 200
+
+
+def _time_range(from_: Optional[str], to: Optional[str]) -> tuple[float, float]:
+    """Parse from/to query parameters, defaulting to the last 24 hours"""
+    try:
+        end = ensure_unix_timestamp(to) or time.time()
+        start = ensure_unix_timestamp(from_)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if start is None:
+        start = end - HEALTH_DATA_DEFAULT_WINDOW_SEC
+    if start >= end:
+        raise HTTPException(status_code=400, detail="from must be before to")
+    return start, end
+
+
+@app.get("/health/data")
+async def health_data(
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    metric: Optional[list[str]] = Query(None),
+    user_id: str = Depends(get_current_user),
+):
+    """
+    Health metric samples recorded between from and to
+
+    Query Parameters:
+    - from, to: Unix seconds or ISO 8601 timestamps (default: the last 24 hours)
+    - metric: Metrics to return, repeated or comma separated (default: all)
+    """
+    start, end = _time_range(from_, to)
+
+    selected = _split_query_list(metric) if metric else list(HEALTH_METRICS)
+    unknown = sorted(set(selected) - set(HEALTH_METRICS))
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown metrics: {', '.join(unknown)}"
+        )
+
+    def read_series() -> dict[str, dict[str, list[float]]]:
+        series = {}
+        for name in dict.fromkeys(selected):
+            timestamps, values = health_store.query(user_id, name, start, end)
+            series[name] = {"timestamps": timestamps.tolist(), "values": values.tolist()}
+        return series
+
+    return {
+        "from": start,
+        "to": end,
+        "metrics": await asyncio.to_thread(read_series),
+    }
+
+
+@app.get("/health/rollups")
+async def health_rollups_chart(
+    metric: str,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    resolution: Optional[str] = None,
+    points: int = Query(HEALTH_CHART_DEFAULT_POINTS, ge=1, le=10000),
+    user_id: str = Depends(get_current_user),
+):
+    """
+    Aggregated buckets (count, sum, min, max, mean) of one metric for charts
+
+    Query Parameters:
+    - from, to: Unix seconds or ISO 8601 timestamps (default: the last 24 hours)
+    - resolution: minute, hour, day, week or seconds per bucket
+      (default: the range split into about `points` buckets, at least a minute)
+
+    Widths are rounded up to whole minutes, or whole hours above half an hour;
+    the response's resolution is the width used.
+    """
+    start, end = _time_range(from_, to)
+    if metric not in HEALTH_METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric: {metric}")
+
+    if resolution is None:
+        width = max(ROLLUP_RESOLUTIONS["minute"], (end - start) / points)
+    elif resolution in ROLLUP_RESOLUTIONS:
+        width = ROLLUP_RESOLUTIONS[resolution]
+    else:
+        try:
+            width = float(resolution)
+        except ValueError:
+            width = 0
+        # Minute buckets are the finest the store aggregates to
+        if not (math.isfinite(width) and width >= ROLLUP_RESOLUTIONS["minute"]):
+            raise HTTPException(
+                status_code=400,
+                detail=f"resolution must be one of {', '.join(ROLLUP_RESOLUTIONS)} "
+                f"or at least {ROLLUP_RESOLUTIONS['minute']} seconds",
+            )
+
+    # Rounded up to whole source buckets, e.g. 5400 seconds become two hours
+    source, width, buckets = await asyncio.to_thread(
+        health_rollups.query, user_id, metric, start, end, width
+    )
+    return {
+        "metric": metric,
+        "from": start,
+        "to": end,
+        "resolution": width,
+        "source": source,
+        "buckets": {stat: column.tolist() for stat, column in buckets.items()},
+    }
+
+
+@app.get("/health/percentiles")
+async def health_percentiles(
+    metric: Optional[list[str]] = Query(None),
+    value: Optional[float] = None,
+    user_id: str = Depends(get_current_user),
+):
+    """
+    Rank the user's daily metrics against peers of the same age band, gender and activity level
+
+    Query Parameters:
+    - metric: Metrics to rank, repeated or comma separated (default: all)
+    - value: Rank this value instead of the user's own (only with a single metric)
+
+    Without value, each metric's latest complete day of ingested samples in
+    the past week is ranked, and its day is returned with the rank. A
+    metric's cohort is widened when it has too few user-days; its rank is
+    null when even all users together have too few, or the user has no
+    samples of it.
+    """
+    selected = _split_query_list(metric) if metric else list(HEALTH_METRICS)
+    unknown = sorted(set(selected) - set(HEALTH_METRICS))
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown metrics: {', '.join(unknown)}"
+        )
+    if value is not None and len(selected) != 1:
+        raise HTTPException(
+            status_code=400, detail="value can only be given with a single metric"
+        )
+
+    cohort = cohort_of(await get_user_profile(user_id))
+    if cohort is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Profile needs dob, gender and activity_level to find peers",
+        )
+
+    names = list(dict.fromkeys(selected))
+    if value is not None:
+        ranks = population_sketches.rank_values(cohort, {names[0]: value})
+    else:
+        daily = await asyncio.to_thread(latest_daily_values, user_id, names)
+        ranks = population_sketches.rank_values(
+            cohort, {name: daily_value for name, (_, daily_value) in daily.items()}
+        )
+        for name, (day, _) in daily.items():
+            if ranks[name] is not None:
+                ranks[name]["day"] = day.isoformat()
+
+    return {
+        "cohort": dict(zip(COHORT_FIELDS, cohort)),
+        "metrics": {name: ranks.get(name) for name in names},
+    }
+
+
+@app.post("/health/samples", status_code=202)
+async def ingest_health_samples(
+    request: Request, user_id: str = Depends(get_current_user)
+):
+    """
+    Stream wearable samples as NDJSON; each line is one sample or a list of them:
+    {"metric": "heart_rate", "value": 72, "timestamp": 1761350400}
+
+    Lines are parsed as they arrive. Invalid samples are skipped and reported.
+    When the ingest buffer is full the response is 429 with Retry-After, and
+    lines tells the client how many lines were consumed so it can resume after them.
+    A worker that does not write the health store answers 503 without reading the body.
+    """
+    result = IngestResult()
+    try:
+        await sample_ingestor.ingest(user_id, iter_lines(request.stream()), result)
+    except IngestBufferFull as exc:
+        raise HTTPException(
+            status_code=429,
+            detail=asdict(result),
+            headers={"Retry-After": str(exc.retry_after_sec)},
+        )
+    except InvalidSample as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except StoreLockedError as exc:
+        raise HTTPException(
+            status_code=503,
+            detail=f"{exc}; send samples to the ingesting worker",
+            headers={"Retry-After": str(sample_ingestor.retry_after())},
+        )
+
+    return asdict(result)
+
+
+@app.get("/health/export")
+async def export_health_data(
+    user_ids: Optional[list[str]] = Query(None),
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    format: str = "parquet",
+    dataset: str = "samples",
+):
+    """
+    Stream health history for analysis as Parquet, Arrow IPC stream or CSV
+
+    Query Parameters:
+    - user_ids: Users to export, repeated or comma separated (default: every stored user)
+    - from, to: Unix seconds or ISO 8601 timestamps (default: the last 24 hours)
+    - format: parquet, arrow or csv (default: parquet)
+    - dataset: samples (user_id, metric, timestamp, value) or workouts
+      (one row per user and day, sport dictionary encoded)
+    """
+    start, end = _time_range(from_, to)
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}"
+        )
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"dataset must be one of {', '.join(EXPORT_DATASETS)}",
+        )
+
+    if user_ids:
+        selected = list(dict.fromkeys(_split_query_list(user_ids)))
+    else:
+        selected = await asyncio.to_thread(health_store.user_ids)
+
+    try:
+        chunks = stream_export(dataset, format, selected, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="health-{dataset}.{extension}"'
+        },
     )
 
 
@@ -184,7 +512,66 @@ async def get_today_events():
 
 @app.post("/users")
 async def create_profile(profile_data: dict):
-    return await create_user_profile(profile_data=profile_data)
+    profile = await create_user_profile(profile_data=profile_data)
+    if profile is not None:
+        tool_results.invalidate_users([profile["id"]])
+        insight_precomputer.invalidate(profile["id"])
+    return profile
+
+
+def _split_query_list(values: list[str]) -> list[str]:
+    """Accept both ?ids=a,b and ?ids=a&ids=b"""
+    return [item.strip() for value in values for item in value.split(",") if item.strip()]
+
+
+@app.get("/users")
+async def read_profiles(
+    ids: list[str] = Query(...), columns: Optional[list[str]] = Query(None)
+):
+    """Fetch many profiles at once, optionally only the given columns"""
+    user_ids = _split_query_list(ids)
+    selected = _split_query_list(columns) if columns else None
+
+    if not user_ids:
+        raise HTTPException(status_code=400, detail="ids must not be empty")
+    unknown = sorted(set(selected or []) - set(USER_COLUMNS))
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown columns: {', '.join(unknown)}"
+        )
+
+    profiles = await get_user_profiles(user_ids, columns=selected)
+    ordered = list(dict.fromkeys(user_ids))
+    return {
+        "users": [profiles[user_id] for user_id in ordered if user_id in profiles],
+        "missing": [user_id for user_id in ordered if user_id not in profiles],
+    }
+
+
+class BulkUsersRequest(BaseModel):
+    users: list[dict[str, Any]]
+    upsert: bool = False
+
+
+@app.post("/users:bulk")
+async def create_profiles(request: BulkUsersRequest):
+    """
+    Create (or with upsert, create or replace) many profiles.
+
+    Rows are validated against the User model and written in chunked
+    batches; failures are reported per row by index.
+    """
+    if not request.users:
+        raise HTTPException(status_code=400, detail="users must not be empty")
+
+    result = await bulk_create_user_profiles(request.users, upsert=request.upsert)
+    user_ids = [
+        row["id"] for row in request.users if isinstance(row, dict) and row.get("id")
+    ]
+    tool_results.invalidate_users(user_ids)
+    for user_id in user_ids:
+        insight_precomputer.invalidate(user_id)
+    return result
 
 
 @app.get("/users/{user_id}")
@@ -195,23 +582,30 @@ async def read_profile(user_id: str):
 @app.put("/users/{user_id}")
 async def update_profile(user_id: str, profile_data: dict):
     print("Received profile data:", profile_data)
-    return await update_user_profile(user_id=user_id, profile_data=profile_data)
+    profile = await update_user_profile(user_id=user_id, profile_data=profile_data)
+    tool_results.invalidate_users([user_id])
+    insight_precomputer.invalidate(user_id)
+    return profile
 
 
 @app.get("/users/{user_id}/insights")
-async def read_user(user_id: str = Depends(get_current_user)):
-    return create_ai_insights(user_id=user_id)
+async def read_user(
+    response: Response, enrich: bool = False, user_id: str = Depends(get_current_user)
+):
+    return await serve_ai_insights(user_id=user_id, response=response, enrich=enrich)
 
 
 @app.get("/event-day-suggestion")
 async def get_event_day_suggestion(user_id: str = Depends(get_current_user)):
     try:
-        suggestion = ai_event_day_suggestions(user_id=user_id)
+        result = await insight_precomputer.get("event_day_suggestion", user_id)
+        suggestion = result.value
+        generated_at = result.generated_at.isoformat()
 
         if is_dataclass(suggestion):
-            return {"suggestion": asdict(suggestion)}
+            return {"suggestion": asdict(suggestion), "generated_at": generated_at}
 
-        return {"suggestion": suggestion}
+        return {"suggestion": suggestion, "generated_at": generated_at}
     except Exception as exc:
         raise HTTPException(
             status_code=500, detail=f"Error generating event suggestion: {exc}"
@@ -222,16 +616,62 @@ class ChatRequest(BaseModel):
     user_message: str
 
 
+async def fallback_chat_response(user_id: str) -> str:
+    """Reply used while the chatbot model is unavailable"""
+    reply = "I can't reach the assistant right now, please try again in a moment."
+    try:
+        insights = (await insight_precomputer.get("insights", user_id)).value
+        return f"{reply} Here is today's summary: {insights.response_text}"
+    except Exception:
+        return reply
+
+
 @app.post("/chat/message")
-async def chat_message(request: ChatRequest, user_id: str = Depends(get_current_user)):
+async def chat_message(
+    request: ChatRequest, response: Response, user_id: str = Depends(get_current_user)
+):
     try:
-        response = ai_health_chatbot_conversation(
-            user_id=user_id,
-            user_message=request.user_message,
+        reply = await agent_requests.do(
+            ("chatbot", user_id, normalize_input(request.user_message)),
+            lambda: ai_health_chatbot_conversation(
+                user_id=user_id, user_message=request.user_message
+            ),
         )
 
-        return {"response": response}
+        return {"response": reply}
+    except (CircuitOpenError, TimeoutError):
+        response.headers["X-Fallback"] = "rules"
+        return {"response": await fallback_chat_response(user_id)}
     except Exception as exc:
         raise HTTPException(
             status_code=500, detail=f"Error generating chatbot response: {exc}"
         )
+
+
+class BatchInsightsRequest(BaseModel):
+    user_ids: list[str]
+    enrich: bool = False
+
+
+@app.post("/admin/insights/batch", status_code=202)
+async def create_batch_insights(request: BatchInsightsRequest):
+    """
+    Generate insights for many users in the background.
+
+    Results are stored for the insights endpoints; poll the returned job_id for progress.
+    The model is only called for users the health rules cannot answer, unless enrich is set.
+    """
+    if not request.user_ids:
+        raise HTTPException(status_code=400, detail="user_ids must not be empty")
+
+    job = start_batch_insights(request.user_ids, enrich=request.enrich)
+    return job.progress()
+
+
+@app.get("/admin/insights/batch/{job_id}")
+async def read_batch_insights(job_id: str):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+
+    return job.progress()
@@ -9,7 +9,18 @@ class HealthData(BaseModel):
     stress_level: int
 
 
+class HealthFinding(BaseModel):
+    metric: str
+    status: str  # "good" or "attention"
+    value: float
+    target: str
+    message: str
+
+
 class HealthInsightsResponse(BaseModel):
+    response_text: str
+    findings: list[HealthFinding] = []
+    source: str = "rules"  # "rules" or "llm"
     ai_insights: str | None = None
 
 
@@ -0,0 +1,243 @@
+"""
+Cohort Generator - Vectorized synthetic health data for many users and days
+
+Usage (from apps/api):
+    python -m app.utils.cohort_generator --users 10000 --days 365 --seed 7 --out cohort.npz
+
+Produces one row per user and day with the same correlations as
+HealthDataGenerator.generate_realistic_health_data, plus a per-user
+activity baseline so users differ from each other.
+"""
+
+import argparse
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from app.utils.random_health_data import SPORT_OPTIONS
+
+ACTIVITY_LEVELS = ("sedentary", "light", "moderate", "active")
+GENDERS = ("female", "male")
+# Mean daily steps for each activity level
+ACTIVITY_STEPS = np.array([4500, 7000, 9500, 12000])
+DAILY_STEPS_SD = 2000
+# Calories burned per workout minute, in SPORT_OPTIONS order
+SPORT_BURN_RATES = np.array([9.0, 10.5, 11.5])
+
+
+@dataclass
+class Cohort:
+    """Synthetic users and their daily metrics as columns
+
+    profiles holds one entry per user; columns holds one entry per user-day
+    row, ordered by user then day, with "user" indexing into user_ids.
+    """
+
+    start: date
+    days: int
+    user_ids: np.ndarray
+    profiles: dict[str, np.ndarray]
+    columns: dict[str, np.ndarray]
+
+    @property
+    def rows(self) -> int:
+        return len(self.columns["user"])
+
+
+def _user_ids(rng: np.random.Generator, users: int) -> np.ndarray:
+    raw = rng.integers(0, 256, size=(users, 16), dtype=np.uint8)
+    return np.array([str(uuid.UUID(bytes=row.tobytes(), version=4)) for row in raw])
+
+
+def generate_cohort(
+    users: int, days: int, seed: int = 0, start: date | None = None
+) -> Cohort:
+    """Generate users × days of correlated metrics from a deterministic seed"""
+    rng = np.random.default_rng(seed)
+    start = start or date.today() - timedelta(days=days - 1)
+    shape = (users, days)
+
+    level = rng.integers(0, len(ACTIVITY_LEVELS), users)
+    birth_days = rng.integers(18 * 365, 80 * 365, users)
+    profiles = {
+        "activity_level": np.array(ACTIVITY_LEVELS)[level],
+        "gender": np.array(GENDERS)[rng.integers(0, len(GENDERS), users)],
+        "dob": np.datetime64(start, "D") - birth_days.astype("timedelta64[D]"),
+    }
+
+    steps = rng.normal(ACTIVITY_STEPS[level][:, None], DAILY_STEPS_SD, shape)
+    steps = np.clip(steps, 3000, 15000).astype(np.int32)
+    stress_score = rng.integers(20, 81, shape, dtype=np.int32)
+    stress_effect = (stress_score - 50) * 0.5
+    stress_factor = rng.integers(10, 51, shape)
+
+    sport = rng.integers(0, len(SPORT_OPTIONS), shape).astype(np.int8)
+    workout_minutes = rng.integers(30, 76, shape, dtype=np.int16)
+    workout_calories = (
+        workout_minutes * SPORT_BURN_RATES[sport] * rng.uniform(0.85, 1.15, shape)
+    ).astype(np.int16)
+
+    columns = {
+        "steps": steps,
+        "distance_meters": (steps * 0.7).astype(np.int32),
+        "calories_burned": (steps * 0.1 + rng.integers(500, 1001, shape)).astype(
+            np.int32
+        ),
+        "sleep_duration": np.round(rng.uniform(6.0, 9.0, shape), 1).astype(np.float32),
+        "sleep_quality": rng.integers(60, 96, shape, dtype=np.int32),
+        "heart_rate": (60 + steps / 10000 * 20 + stress_factor * 0.3).astype(np.int32),
+        "stress_score": stress_score,
+        "bp_systolic": (110 + stress_effect + rng.integers(-10, 11, shape)).astype(
+            np.int32
+        ),
+        "bp_diastolic": (70 + stress_effect * 0.6 + rng.integers(-5, 6, shape)).astype(
+            np.int32
+        ),
+        "blood_glucose": (90 + steps / 1000 * 5 + rng.integers(-20, 21, shape)).astype(
+            np.int32
+        ),
+        "blood_oxygen": rng.integers(95, 101, shape, dtype=np.int32),
+        "workout_sport": sport,
+        "workout_minutes": workout_minutes,
+        "workout_calories": workout_calories,
+    }
+    columns = {name: column.reshape(-1) for name, column in columns.items()}
+
+    # Rows are measured at local midnight of their day
+    day_start = datetime.combine(start, datetime.min.time()).timestamp()
+    columns["user"] = np.repeat(np.arange(users, dtype=np.int32), days)
+    columns["timestamp"] = np.tile(day_start + np.arange(days) * 86400.0, users)
+
+    return Cohort(start, days, _user_ids(rng, users), profiles, columns)
+
+
+def write_cohort(cohort: Cohort, path: Path) -> None:
+    """Write a cohort as an uncompressed .npz of columns"""
+    np.savez(
+        path,
+        start=np.datetime64(cohort.start, "D"),
+        days=cohort.days,
+        user_ids=cohort.user_ids,
+        sports=np.array(SPORT_OPTIONS),
+        **{f"profile_{name}": column for name, column in cohort.profiles.items()},
+        **cohort.columns,
+    )
+
+
+def read_cohort(path: Path) -> Cohort:
+    with np.load(path) as data:
+        return Cohort(
+            start=data["start"].item(),
+            days=int(data["days"]),
+            user_ids=data["user_ids"],
+            profiles={
+                name.removeprefix("profile_"): data[name]
+                for name in data.files
+                if name.startswith("profile_")
+            },
+            columns={
+                name: data[name]
+                for name in data.files
+                if name not in ("start", "days", "user_ids", "sports")
+                and not name.startswith("profile_")
+            },
+        )
+
+
+def load_into_store(cohort: Cohort, metrics: tuple[str, ...] | None = None) -> int:
+    """Append a cohort's daily metrics to the health store, returning the samples written"""
+    from app.utils.health_store import METRICS, health_store
+
+    metrics = metrics or METRICS
+    written = 0
+    for index, user_id in enumerate(cohort.user_ids.tolist()):
+        rows = slice(index * cohort.days, (index + 1) * cohort.days)
+        timestamps = cohort.columns["timestamp"][rows]
+        for metric in metrics:
+            written += health_store.append(
+                user_id, metric, timestamps, cohort.columns[metric][rows]
+            )
+
+    health_store.flush()
+    return written
+
+
+def load_into_sketches(cohort: Cohort) -> int:
+    """Replace the synthetic cohort's population sketches, returning the user-days added
+
+    They are saved to their own file, next to the servers' ones, so loading
+    again replaces the previous cohort instead of counting it twice.
+    """
+    from app.utils.health_store import METRICS
+    from app.utils.population_sketches import PopulationSketches, cohort_of
+
+    population_sketches = PopulationSketches(worker="synthetic-cohort")
+    population_sketches.path.unlink(missing_ok=True)
+
+    cohorts = [
+        cohort_of(
+            {name: column[index] for name, column in cohort.profiles.items()},
+            cohort.start,
+        )
+        for index in range(len(cohort.user_ids))
+    ]
+    groups: dict[tuple[str, str, str], list[int]] = {}
+    for index, key in enumerate(cohorts):
+        groups.setdefault(key, []).append(index)
+
+    for key, users in groups.items():
+        rows = np.isin(cohort.columns["user"], users)
+        for metric in METRICS:
+            population_sketches.add(key, metric, cohort.columns[metric][rows])
+
+    population_sketches.flush()
+    return cohort.rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, default=Path("cohort.npz"))
+    parser.add_argument(
+        "--store", action="store_true", help="Also load the rows into the health store"
+    )
+    parser.add_argument(
+        "--sketches",
+        action="store_true",
+        help="Also add the rows to the population sketches",
+    )
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    cohort = generate_cohort(args.users, args.days, seed=args.seed)
+    generated = time.perf_counter()
+    write_cohort(cohort, args.out)
+    written = time.perf_counter()
+
+    print(
+        f"{cohort.rows:,} rows ({args.users:,} users x {args.days} days): "
+        f"generated in {generated - started:.2f}s, written to {args.out} in {written - generated:.2f}s"
+    )
+
+    if args.store:
+        samples = load_into_store(cohort)
+        print(
+            f"Loaded {samples:,} samples into the health store in {time.perf_counter() - written:.2f}s"
+        )
+
+    if args.sketches:
+        started = time.perf_counter()
+        user_days = load_into_sketches(cohort)
+        print(
+            f"Added {user_days:,} user-days to the population sketches in {time.perf_counter() - started:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Context Encoder - Compact, token-budgeted encodings of tool outputs for the model
+"""
+
+import math
+from collections import Counter
+from datetime import date, datetime
+from typing import Any
+
+CHARS_PER_TOKEN = 4  # Same heuristic as langchain's count_tokens_approximately
+
+# Upper bound on the tokens each tool may add to the prompt
+TOOL_TOKEN_BUDGETS = {
+    "get_users_objectives": 120,
+    "get_today_health_data": 120,
+    "get_today_schedule": 200,
+    "get_health_percentiles": 120,
+}
+
+# Health metric abbreviations, in output order
+HEALTH_FIELDS = {
+    "steps": "steps",
+    "distance_meters": "dist_m",
+    "calories_burned": "kcal",
+    "sleep_duration": "sleep_h",
+    "sleep_quality": "sleep_q",
+    "heart_rate": "hr",
+    "stress_score": "stress",
+    "blood_glucose": "glucose",
+    "blood_oxygen": "spo2",
+}
+DESCRIPTION_MAX_CHARS = 40
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def fit_token_budget(lines: list[str], budget: int, separator: str = "; ") -> str:
+    """Join lines in order, dropping the ones that do not fit and noting how many"""
+    kept: list[str] = []
+    used = 0
+
+    for index, line in enumerate(lines):
+        cost = estimate_tokens(line + separator)
+        if used + cost > budget:
+            dropped = len(lines) - index
+            marker = f"+{dropped} more"
+            # Make room for the marker itself
+            while kept and used + estimate_tokens(marker) > budget:
+                used -= estimate_tokens(kept.pop() + separator)
+                dropped += 1
+                marker = f"+{dropped} more"
+            kept.append(marker)
+            break
+        kept.append(line)
+        used += cost
+
+    return separator.join(kept)
+
+
+def relative_time(moment: datetime, now: datetime) -> str:
+    """Format a moment relative to now, e.g. "in 2h", "35m ago" or "now\""""
+    minutes = round((moment - now).total_seconds() / 60)
+    if minutes == 0:
+        return "now"
+
+    span = abs(minutes)
+    text = f"{span}m" if span < 60 else f"{span / 60:.1f}".rstrip("0").rstrip(".") + "h"
+    return f"in {text}" if minutes > 0 else f"{text} ago"
+
+
+def relative_day(day: date, today: date) -> str:
+    days = (today - day).days
+    if days == 0:
+        return "today"
+    if days == 1:
+        return "yesterday"
+    return f"{days}d ago"
+
+
+def _format_number(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:g}"
+    return str(value)
+
+
+def summarize_workouts(workouts: list[dict[str, Any]], today: date) -> str:
+    """Pre-aggregate the weekly workout history into one line"""
+    if not workouts:
+        return "workouts_7d: none"
+
+    minutes = sum(workout.get("duration_minutes", 0) for workout in workouts)
+    calories = sum(workout.get("calories_burned", 0) for workout in workouts)
+    sports = Counter(workout.get("sport", "other") for workout in workouts)
+    by_sport = ",".join(f"{sport}x{count}" for sport, count in sports.most_common())
+
+    last = max(workouts, key=lambda workout: workout.get("date", ""))
+    last_day = relative_day(date.fromisoformat(last["date"]), today)
+
+    return (
+        f"workouts_7d: n={len(workouts)} min={minutes} kcal={calories} "
+        f"({by_sport}) last={last['sport']} {last_day}"
+    )
+
+
+def encode_health_data(data: dict[str, Any], now: datetime | None = None) -> str:
+    """Encode today's health metrics as abbreviated key=value pairs"""
+    now = now or datetime.now()
+
+    lines = [
+        " ".join(
+            f"{short}={_format_number(data[key])}"
+            for key, short in HEALTH_FIELDS.items()
+            if data.get(key) is not None
+        )
+    ]
+    if "bp_systolic" in data and "bp_diastolic" in data:
+        lines[0] += f" bp={data['bp_systolic']}/{data['bp_diastolic']}"
+
+    if data.get("timestamp"):
+        measured = datetime.fromisoformat(data["timestamp"])
+        lines[0] += f" (measured {relative_time(measured, now)})"
+
+    if "weekly_workouts" in data:
+        lines.append(summarize_workouts(data["weekly_workouts"], now.date()))
+
+    return fit_token_budget(lines, TOOL_TOKEN_BUDGETS["get_today_health_data"])
+
+
+def _shorten(text: str | None, limit: int = DESCRIPTION_MAX_CHARS) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[: limit - 1] + "…"
+
+
+def encode_schedule(events: list[Any], now: datetime | None = None) -> str:
+    """
+    Encode calendar events as one short line each, soonest first.
+
+    Events are written as start time plus duration; only the event in
+    progress or up next gets a time relative to now.
+    """
+    now = now or datetime.now()
+    if not events:
+        return "schedule: no events today"
+
+    timed = []
+    for event in events:
+        start = getattr(event.when, "start_time", None)
+        end = getattr(event.when, "end_time", None)
+        timed.append((start or 0, end, event))
+    timed.sort(key=lambda item: item[0])
+
+    lines = []
+    marked_next = False
+    for start, end, event in timed:
+        if start:
+            starts_at = datetime.fromtimestamp(start)
+            span = starts_at.strftime("%H:%M")
+            if end:
+                span += f"+{round((end - start) / 60)}m"
+            if not marked_next and (end or start) > now.timestamp():
+                marked_next = True
+                if start <= now.timestamp():
+                    span += " (now)"
+                else:
+                    span += f" (next, {relative_time(starts_at, now)})"
+        else:
+            span = "all day"
+
+        line = f"{span} {_shorten(event.title, 30)}"
+        description = _shorten(event.description)
+        if description:
+            line += f" - {description}"
+        lines.append(line)
+
+    prefix = "schedule: "
+    budget = TOOL_TOKEN_BUDGETS["get_today_schedule"] - estimate_tokens(prefix)
+    return prefix + fit_token_budget(lines, budget)
+
+
+def encode_objectives(user_data: dict[str, Any]) -> str:
+    """Encode a profile row's step goal and custom goals"""
+    goals = user_data.get("custom_goals")
+    if isinstance(goals, (list, tuple)):
+        goals = "; ".join(str(goal) for goal in goals)
+
+    lines = [f"step_goal={user_data.get('step_goal')}"]
+    if goals:
+        lines.append(f"goals: {' '.join(str(goals).split())}")
+
+    budget = TOOL_TOKEN_BUDGETS["get_users_objectives"]
+    text = " ".join(lines)
+    if estimate_tokens(text) <= budget:
+        return text
+    return text[: budget * CHARS_PER_TOKEN - 1] + "…"
+
+
+def encode_percentiles(ranks: dict[str, dict[str, Any] | None]) -> str:
+    """Encode percentile ranks against peers as abbreviated key=pNN pairs"""
+    ranked = {key: rank for key, rank in ranks.items() if rank}
+    if not ranked:
+        return "percentiles: not enough peer data yet"
+
+    def describe(cohort: dict[str, str]) -> str:
+        return " ".join("any" if value == "*" else value for value in cohort.values())
+
+    peers = next(iter(ranked.values()))["cohort"]
+    lines = [f"peers: {describe(peers)}"]
+    for key, rank in ranked.items():
+        line = f"{HEALTH_FIELDS.get(key, key)}={_format_number(rank['value'])} p{rank['percentile']:.0f}"
+        if rank["cohort"] != peers:
+            line += f" (vs {describe(rank['cohort'])})"
+        lines.append(line)
+
+    return fit_token_budget(lines, TOOL_TOKEN_BUDGETS["get_health_percentiles"])
@@ -27,6 +27,61 @@ API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 SUGGESTION_FILE = Path(__file__).with_name("event_suggestions.json")
 
 
+def broadcast_realtime(payloads: list[dict[str, Any]], per_user: bool = False) -> None:
+    """Send payloads to the Supabase realtime channel in one request
+
+    With per_user, each payload goes to the "<topic>:<user_id>" channel of
+    the user it names instead of the channel every client listens on.
+    """
+    token = os.getenv("SUPABASE_KEY")
+    url = os.getenv("SUPABASE_URL")
+
+    if not token or not url:
+        logger.warning("Supabase credentials missing; skipping realtime broadcast")
+        return
+
+    broadcast_url = url.rstrip("/") + "/realtime/v1/api/broadcast"
+    topic = os.getenv("SUPABASE_BROADCAST_TOPIC", "event-changes")
+    event_name = os.getenv("SUPABASE_BROADCAST_EVENT", "shout")
+
+    message = {
+        "messages": [
+            {
+                "topic": f"{topic}:{payload['user_id']}" if per_user else topic,
+                "event": event_name,
+                "payload": payload,
+            }
+            for payload in payloads
+        ]
+    }
+
+    curl_cmd = [
+        "curl",
+        "-v",
+        "-H",
+        f"apikey: {token}",
+        "-H",
+        "Content-Type: application/json",
+        "--data-raw",
+        json.dumps(message),
+        broadcast_url,
+    ]
+
+    try:
+        result = subprocess.run(
+            curl_cmd,
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+    except subprocess.CalledProcessError as exc:
+        stderr = (exc.stderr or "").replace(token, "***")
+        logger.error("Supabase broadcast failed: %s", stderr or exc)
+    else:
+        if result.returncode == 0:
+            logger.info("Supabase broadcast succeeded")
+
+
 class EventPoller:
     """Event poller that monitors calendar events for changes"""
 
@@ -250,16 +305,20 @@ class EventPoller:
         try:
             from app.dependencies.auth import get_current_user
             from app.dependencies.langchain import ai_event_changed_suggestions
+            from app.dependencies.tool_cache import tool_results
+            from app.utils.insight_precomputer import insight_precomputer
         except Exception as exc:  # pragma: no cover - import errors logged
             logger.error("Unable to import dependencies for AI suggestions: %s", exc)
             return
 
         user_id = get_current_user()
 
+        # Today's schedule feeds both insights and day suggestions
+        tool_results.invalidate("get_today_schedule")
+        insight_precomputer.invalidate(user_id)
+
         try:
-            suggestion = await asyncio.to_thread(
-                ai_event_changed_suggestions, user_id, descriptions
-            )
+            suggestion = await ai_event_changed_suggestions(user_id, descriptions)
         except Exception as exc:  # pragma: no cover - defensive logging
             logger.error("AI suggestion generation failed: %s", exc)
             return
@@ -379,54 +438,7 @@ class EventPoller:
 
     def _broadcast_suggestion(self, payload: dict[str, Any]) -> None:
         """Notify Supabase realtime service about updated suggestions"""
-        token = (
-            os.getenv("SUPABASE_KEY")
-        )
-        url = os.getenv("SUPABASE_URL")
-
-        if not token or not url:
-            logger.warning("Supabase credentials missing; skipping realtime broadcast")
-            return
-
-        broadcast_url = url.rstrip("/") + "/realtime/v1/api/broadcast"
-        topic = os.getenv("SUPABASE_BROADCAST_TOPIC", "event-changes")
-        event_name = os.getenv("SUPABASE_BROADCAST_EVENT", "shout")
-
-        message = {
-            "messages": [
-                {
-                    "topic": topic,
-                    "event": event_name,
-                    "payload": payload,
-                }
-            ]
-        }
-
-        curl_cmd = [
-            "curl",
-            "-v",
-            "-H",
-            f"apikey: {token}",
-            "-H",
-            "Content-Type: application/json",
-            "--data-raw",
-            json.dumps(message),
-            broadcast_url,
-        ]
-
-        try:
-            result = subprocess.run(
-                curl_cmd,
-                check=True,
-                capture_output=True,
-                text=True,
-            )
-        except subprocess.CalledProcessError as exc:
-            stderr = (exc.stderr or "").replace(token, "***")
-            logger.error("Supabase broadcast failed: %s", stderr or exc)
-        else:
-            if result.returncode == 0:
-                logger.info("Supabase broadcast succeeded")
+        broadcast_realtime([payload])
 
     async def poller_loop(self):
         """Main polling loop"""
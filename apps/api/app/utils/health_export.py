@@ -0,0 +1,288 @@
+"""
+Health Export - Streams health history as Parquet, Arrow IPC or CSV in bounded batches
+"""
+
+import csv
+import io
+from collections.abc import Iterator
+from datetime import UTC, date, datetime, timedelta
+
+import numpy as np
+
+from app.utils.health_store import METRICS, USER_ID_PATTERN, health_store
+from app.utils.random_health_data import SPORT_OPTIONS, get_mock_workout
+
+EXPORT_BATCH_ROWS = 65536
+EXPORT_FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "csv": ("text/csv", "csv"),
+}
+EXPORT_DATASETS = ("samples", "workouts")
+
+
+def has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to the response stream"""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _sample_columns(
+    user_ids: list[str], start: float, end: float
+) -> Iterator[dict[str, np.ndarray]]:
+    """Long-format sample columns, at most EXPORT_BATCH_ROWS rows at a time
+
+    user and metric are indices into user_ids and METRICS, so they can be
+    written dictionary encoded.
+    """
+    pending: list[dict[str, np.ndarray]] = []
+    rows = 0
+
+    for user_index, user_id in enumerate(user_ids):
+        for metric_index, metric in enumerate(METRICS):
+            timestamps, values = health_store.scan(user_id, metric, start, end)
+            for offset in range(0, len(timestamps), EXPORT_BATCH_ROWS):
+                chunk = slice(offset, offset + EXPORT_BATCH_ROWS)
+                count = len(timestamps[chunk])
+                pending.append(
+                    {
+                        "user": np.full(count, user_index, dtype=np.int32),
+                        "metric": np.full(count, metric_index, dtype=np.int8),
+                        "timestamp": timestamps[chunk],
+                        "value": values[chunk],
+                    }
+                )
+                rows += count
+                if rows >= EXPORT_BATCH_ROWS:
+                    yield _concat(pending)
+                    pending, rows = [], 0
+
+    if pending:
+        yield _concat(pending)
+
+
+def _workout_columns(
+    user_ids: list[str], start: float, end: float
+) -> Iterator[dict[str, np.ndarray]]:
+    """Workout columns from the mock workout history, at most about EXPORT_BATCH_ROWS rows at a time; rest days have no row"""
+    first = datetime.fromtimestamp(start).date()
+    days = [
+        first + timedelta(days=offset)
+        for offset in range((datetime.fromtimestamp(end).date() - first).days + 1)
+    ]
+    sport_index = {sport: index for index, sport in enumerate(SPORT_OPTIONS)}
+    pending: list[dict[str, np.ndarray]] = []
+    rows = 0
+
+    for user_index in range(len(user_ids)):
+        workouts = [
+            workout
+            for workout in (get_mock_workout(user_ids[user_index], day) for day in days)
+            if workout is not None
+        ]
+        if not workouts:
+            continue
+        pending.append(
+            {
+                "user": np.full(len(workouts), user_index, dtype=np.int32),
+                "date": np.array(
+                    [workout["date"] for workout in workouts], dtype="datetime64[D]"
+                ),
+                "sport": np.array(
+                    [sport_index[workout["sport"]] for workout in workouts],
+                    dtype=np.int8,
+                ),
+                "duration_minutes": np.array(
+                    [workout["duration_minutes"] for workout in workouts],
+                    dtype=np.int32,
+                ),
+                "calories_burned": np.array(
+                    [workout["calories_burned"] for workout in workouts],
+                    dtype=np.int32,
+                ),
+            }
+        )
+        rows += len(workouts)
+        if rows >= EXPORT_BATCH_ROWS:
+            yield _concat(pending)
+            pending, rows = [], 0
+
+    if pending:
+        yield _concat(pending)
+
+
+def _concat(parts: list[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def _schema(dataset: str):
+    import pyarrow as pa
+
+    if dataset == "samples":
+        return pa.schema(
+            {
+                "user_id": pa.dictionary(pa.int32(), pa.string()),
+                "metric": pa.dictionary(pa.int8(), pa.string()),
+                "timestamp": pa.timestamp("ms", tz="UTC"),
+                "value": pa.float64(),
+            }
+        )
+    return pa.schema(
+        {
+            "user_id": pa.dictionary(pa.int32(), pa.string()),
+            "date": pa.date32(),
+            "sport": pa.dictionary(pa.int8(), pa.string()),
+            "duration_minutes": pa.int32(),
+            "calories_burned": pa.int32(),
+        }
+    )
+
+
+def _record_batches(dataset: str, user_ids: list[str], start: float, end: float):
+    import pyarrow as pa
+
+    users = pa.array(user_ids, pa.string())
+    if dataset == "samples":
+        names = pa.array(METRICS, pa.string())
+        for columns in _sample_columns(user_ids, start, end):
+            yield pa.record_batch(
+                {
+                    "user_id": pa.DictionaryArray.from_arrays(columns["user"], users),
+                    "metric": pa.DictionaryArray.from_arrays(columns["metric"], names),
+                    "timestamp": pa.array(
+                        (columns["timestamp"] * 1000).astype(np.int64),
+                        pa.timestamp("ms", tz="UTC"),
+                    ),
+                    "value": pa.array(columns["value"]),
+                }
+            )
+    else:
+        sports = pa.array(SPORT_OPTIONS, pa.string())
+        for columns in _workout_columns(user_ids, start, end):
+            yield pa.record_batch(
+                {
+                    "user_id": pa.DictionaryArray.from_arrays(columns["user"], users),
+                    "date": pa.array(columns["date"]),
+                    "sport": pa.DictionaryArray.from_arrays(columns["sport"], sports),
+                    "duration_minutes": pa.array(columns["duration_minutes"]),
+                    "calories_burned": pa.array(columns["calories_burned"]),
+                }
+            )
+
+
+def _stream_with_pyarrow(
+    dataset: str, output: str, user_ids: list[str], start: float, end: float
+) -> Iterator[bytes]:
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+
+    # Opened before the first batch so an empty export is still a valid file
+    sink = _ChunkSink()
+    schema = _schema(dataset)
+    if output == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    elif output == "arrow":
+        writer = pa_ipc.new_stream(sink, schema)
+    else:
+        writer = pa_csv.CSVWriter(sink, schema)
+
+    for batch in _record_batches(dataset, user_ids, start, end):
+        writer.write_batch(batch)
+        if sink.chunks:
+            yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
+
+
+def _stream_csv(
+    dataset: str, user_ids: list[str], start: float, end: float
+) -> Iterator[bytes]:
+    """CSV without pyarrow, written batch by batch with the csv module"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if dataset == "samples":
+        writer.writerow(("user_id", "metric", "timestamp", "value"))
+        for columns in _sample_columns(user_ids, start, end):
+            writer.writerows(
+                (
+                    user_ids[user],
+                    METRICS[metric],
+                    datetime.fromtimestamp(timestamp, UTC).isoformat(),
+                    value,
+                )
+                for user, metric, timestamp, value in zip(
+                    columns["user"].tolist(),
+                    columns["metric"].tolist(),
+                    columns["timestamp"].tolist(),
+                    columns["value"].tolist(),
+                )
+            )
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    else:
+        writer.writerow(
+            ("user_id", "date", "sport", "duration_minutes", "calories_burned")
+        )
+        for columns in _workout_columns(user_ids, start, end):
+            writer.writerows(
+                (user_ids[user], day, SPORT_OPTIONS[sport], minutes, calories)
+                for user, day, sport, minutes, calories in zip(
+                    columns["user"].tolist(),
+                    columns["date"].astype(date).tolist(),
+                    columns["sport"].tolist(),
+                    columns["duration_minutes"].tolist(),
+                    columns["calories_burned"].tolist(),
+                )
+            )
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+
+def stream_export(
+    dataset: str, output: str, user_ids: list[str], start: float, end: float
+) -> Iterator[bytes]:
+    """
+    Stream one dataset ("samples" or "workouts") in the given format.
+
+    Rows are produced about EXPORT_BATCH_ROWS at a time and written as they
+    are built, so memory stays bounded however
+    many users and days are exported. Parquet and Arrow need pyarrow; CSV
+    falls back to the csv module without it.
+    """
+    invalid = [
+        user_id for user_id in user_ids if not USER_ID_PATTERN.fullmatch(user_id)
+    ]
+    if invalid:
+        # Checked up front; once streaming has started errors can no longer be reported
+        raise ValueError(f"Invalid user ids: {', '.join(invalid)}")
+
+    if has_pyarrow():
+        return _stream_with_pyarrow(dataset, output, user_ids, start, end)
+    if output != "csv":
+        raise ValueError(f"{output} export requires pyarrow; use format=csv")
+    return _stream_csv(dataset, user_ids, start, end)
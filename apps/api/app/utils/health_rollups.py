@@ -0,0 +1,273 @@
+"""
+Health Rollups - Incrementally maintained hour/day/week aggregates of health metrics
+"""
+
+import bisect
+import math
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from app.utils.health_store import health_store
+from app.utils.metrics import metrics
+
+# Configuration
+ROLLUP_MAX_SERIES = int(os.getenv("ROLLUP_MAX_SERIES", "10000"))
+# Buckets follow local days; weeks start on Monday
+ROLLUP_UTC_OFFSET_SEC = int(
+    os.getenv(
+        "ROLLUP_UTC_OFFSET_SEC",
+        str(int(datetime.now().astimezone().utcoffset().total_seconds())),
+    )
+)
+EPOCH_TO_MONDAY_SEC = 3 * 86400  # 1970-01-01 was a Thursday
+
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400, "week": 7 * 86400}
+# Levels kept in memory; minute buckets are aggregated from raw samples on
+# demand, which costs about as much as the points returned for minute data
+MAINTAINED_LEVELS = ("hour", "day", "week")
+STATS = ("start", "count", "sum", "min", "max")
+
+
+def snap_resolution(width: float) -> tuple[str, float]:
+    """
+    The level to serve buckets of about width seconds from, and the width
+    rounded up so each bucket is a whole number of that level's buckets.
+
+    Widths over half an hour snap to whole hours so they are served from
+    maintained levels (a week split into 200 points gets hourly buckets);
+    shorter ones snap to whole minutes aggregated from raw samples, so raw
+    scans stay within about 30 samples per minute-level point.
+    """
+    coarse = width > RESOLUTIONS["hour"] / 2
+    unit = RESOLUTIONS["hour" if coarse else "minute"]
+    width = math.ceil(width / unit) * unit
+    source = max(
+        (name for name in RESOLUTIONS if width % RESOLUTIONS[name] == 0),
+        key=RESOLUTIONS.__getitem__,
+    )
+    return source, float(width)
+
+
+def bucket_starts(timestamps: np.ndarray, width: float) -> np.ndarray:
+    """Start of the bucket of the given width that each timestamp falls in"""
+    shift = ROLLUP_UTC_OFFSET_SEC + EPOCH_TO_MONDAY_SEC
+    return np.floor((timestamps + shift) / width) * width - shift
+
+
+def aggregate(
+    starts: np.ndarray,
+    counts: np.ndarray,
+    sums: np.ndarray,
+    lows: np.ndarray,
+    highs: np.ndarray,
+    width: float,
+) -> dict[str, np.ndarray]:
+    """Combine rows (raw samples or finer buckets) into buckets of the given width"""
+    if not len(starts):
+        return {stat: np.empty(0) for stat in STATS}
+
+    if (np.diff(starts) < 0).any():
+        order = np.argsort(starts, kind="stable")
+        starts, counts, sums, lows, highs = (
+            column[order] for column in (starts, counts, sums, lows, highs)
+        )
+
+    buckets = bucket_starts(starts, width)
+    first = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    return {
+        "start": buckets[first],
+        "count": np.add.reduceat(counts, first),
+        "sum": np.add.reduceat(sums, first),
+        "min": np.minimum.reduceat(lows, first),
+        "max": np.maximum.reduceat(highs, first),
+    }
+
+
+def aggregate_samples(
+    timestamps: np.ndarray, values: np.ndarray, width: float
+) -> dict[str, np.ndarray]:
+    return aggregate(
+        timestamps, np.ones(len(values)), values, values, values, width
+    )
+
+
+class Rollup:
+    """Buckets of one width for one series, as sorted columns"""
+
+    def __init__(self, width: float):
+        self.width = width
+        self.columns = {stat: array("d") for stat in STATS}
+
+    def __len__(self) -> int:
+        return len(self.columns["start"])
+
+    def add(self, buckets: dict[str, np.ndarray]) -> None:
+        """Merge aggregated buckets of this width into the rollup"""
+        starts = self.columns["start"]
+        for index, start in enumerate(buckets["start"].tolist()):
+            position = bisect.bisect_left(starts, start)
+            count, total, low, high = (
+                float(buckets[stat][index]) for stat in ("count", "sum", "min", "max")
+            )
+
+            if position < len(starts) and starts[position] == start:
+                self.columns["count"][position] += count
+                self.columns["sum"][position] += total
+                self.columns["min"][position] = min(self.columns["min"][position], low)
+                self.columns["max"][position] = max(self.columns["max"][position], high)
+                continue
+
+            # Almost always the newest bucket, so this is an append
+            for stat, value in zip(STATS, (start, count, total, low, high)):
+                self.columns[stat].insert(position, value)
+
+    def slice(self, start: float, end: float) -> dict[str, np.ndarray]:
+        starts = self.columns["start"]
+        low = bisect.bisect_left(starts, bucket_starts(np.float64(start), self.width))
+        high = bisect.bisect_left(starts, end)
+        return {
+            stat: np.frombuffer(column[low:high]) for stat, column in self.columns.items()
+        }
+
+
+class SeriesRollups:
+    def __init__(self, timestamps: np.ndarray, values: np.ndarray):
+        self.lock = threading.Lock()
+        self.levels = {name: Rollup(RESOLUTIONS[name]) for name in MAINTAINED_LEVELS}
+        self.add(timestamps, values)
+
+    def add(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        if not len(timestamps):
+            return
+        for rollup in self.levels.values():
+            rollup.add(aggregate_samples(timestamps, values, rollup.width))
+
+
+class HealthRollups:
+    """Keeps hour/day/week rollups of recently used series up to date
+
+    A series' rollups are built from the health store on first use, then
+    updated with every batch written through append, so queries cost
+    O(buckets returned) rather than O(raw samples). Least recently used
+    series are dropped beyond ROLLUP_MAX_SERIES and rebuilt when needed.
+    """
+
+    def __init__(self, max_series: int = ROLLUP_MAX_SERIES):
+        self.max_series = max_series
+        self.series: OrderedDict[tuple[str, str], SeriesRollups] = OrderedDict()
+        # Per-series lock and how many threads hold or wait for it
+        self.locks: dict[tuple[str, str], tuple[threading.Lock, list[int]]] = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def _key_lock(self, key: tuple[str, str]):
+        """Hold the series' lock; it is dropped once no thread uses it"""
+        with self.lock:
+            lock, users = self.locks.setdefault(key, (threading.Lock(), [0]))
+            users[0] += 1
+        try:
+            with lock:
+                yield
+        finally:
+            with self.lock:
+                users[0] -= 1
+                if not users[0]:
+                    del self.locks[key]
+
+    def _loaded(self, key: tuple[str, str]) -> SeriesRollups | None:
+        with self.lock:
+            rollups = self.series.get(key)
+            if rollups is not None:
+                self.series.move_to_end(key)
+            return rollups
+
+    def _rollups(self, user_id: str, metric: str) -> SeriesRollups:
+        key = (user_id, metric)
+        rollups = self._loaded(key)
+        if rollups is not None:
+            return rollups
+
+        with self._key_lock(key):
+            rollups = self._loaded(key)
+            if rollups is None:
+                timestamps, values = health_store.query(
+                    user_id, metric, float("-inf"), float("inf")
+                )
+                rollups = SeriesRollups(timestamps, values)
+                with self.lock:
+                    self.series[key] = rollups
+                    while len(self.series) > self.max_series:
+                        self.series.popitem(last=False)
+        return rollups
+
+    def append(
+        self, user_id: str, metric: str, timestamps: np.ndarray, values: np.ndarray
+    ) -> int:
+        """Write samples to the health store and fold them into loaded rollups"""
+        key = (user_id, metric)
+        with self._key_lock(key):
+            # Samples the store drops as too late must not be counted either
+            keep = timestamps > health_store.sealed_until(user_id, metric)
+            timestamps, values = timestamps[keep], values[keep]
+            kept = health_store.append(user_id, metric, timestamps, values)
+
+            rollups = self._loaded(key)
+            if rollups is not None:
+                with rollups.lock:
+                    rollups.add(timestamps, values)
+        return kept
+
+    def query(
+        self,
+        user_id: str,
+        metric: str,
+        start: float,
+        end: float,
+        resolution: float,
+    ) -> tuple[str, float, dict[str, np.ndarray]]:
+        """
+        Buckets of about the requested resolution (seconds) covering start to end.
+
+        The resolution is rounded up by snap_resolution, so buckets never
+        cover part of a source bucket; returns the source level's name, the
+        width used and the bucket columns including mean.
+        """
+        source, resolution = snap_resolution(resolution)
+
+        if source == "minute":
+            timestamps, values = health_store.query(user_id, metric, start, end)
+            buckets = aggregate_samples(timestamps, values, RESOLUTIONS["minute"])
+        else:
+            rollups = self._rollups(user_id, metric)
+            with rollups.lock:
+                buckets = rollups.levels[source].slice(start, end)
+
+        if resolution > RESOLUTIONS[source]:
+            buckets = aggregate(
+                buckets["start"],
+                buckets["count"],
+                buckets["sum"],
+                buckets["min"],
+                buckets["max"],
+                resolution,
+            )
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            buckets["mean"] = buckets["sum"] / buckets["count"]
+        return source, resolution, buckets
+
+
+# Global rollups over the health store
+health_rollups = HealthRollups()
+
+metrics.gauge(
+    "health_rollup_series",
+    "Series whose hour/day/week rollups are held in memory",
+    lambda: len(health_rollups.series),
+)
@@ -0,0 +1,151 @@
+"""
+Health Rules - Deterministic insights from today's health metrics
+"""
+
+from typing import Any
+
+from app.models.health_models import HealthFinding, HealthInsightsResponse
+
+# Thresholds, kept in line with SYSTEM_PROMPT
+HEALTHY_SLEEP_HOURS = (7.0, 9.0)
+GOOD_SLEEP_QUALITY = 80
+LOW_STRESS_SCORE = 50
+
+# Plausible bounds for a single device reading. HealthDataGenerator's ranges
+# describe typical daily values and are too narrow for raw samples.
+SAMPLE_RANGES = {
+    "steps": (0, 100_000),
+    "distance_meters": (0, 100_000),
+    "calories_burned": (0, 10_000),
+    "sleep_duration": (0, 24),
+    "sleep_quality": (0, 100),
+    "heart_rate": (20, 250),
+    "stress_score": (0, 100),
+    "bp_systolic": (50, 260),
+    "bp_diastolic": (30, 160),
+    "blood_glucose": (20, 600),
+    "blood_oxygen": (50, 100),
+}
+
+# Vital sign limits for the streaming vitals detector (warning, critical)
+VITAL_LIMITS = {
+    "blood_oxygen": {"low": (92, 88)},
+    "bp_systolic": {"high": (140, 180)},
+    "bp_diastolic": {"high": (90, 120)},
+    "heart_rate": {"high": (100, 130)},
+    "blood_glucose": {"low": (70, 54), "high": (180, 250)},
+}
+
+
+def _number(health_data: dict[str, Any], key: str) -> float | None:
+    value = health_data.get(key)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
+
+
+def _sleep_duration(hours: float) -> HealthFinding:
+    low, high = HEALTHY_SLEEP_HOURS
+    target = f"{low:g}-{high:g} h"
+
+    if hours < low:
+        status = "attention"
+        message = f"You slept {hours:g} h, {low - hours:.1f} h short of the healthy {target} range. An earlier bedtime tonight would help you recover."
+    elif hours > high:
+        status = "attention"
+        message = f"You slept {hours:g} h, above the healthy {target} range. Oversleeping can leave you groggy, so aim for a consistent wake-up time."
+    else:
+        status = "good"
+        message = f"You slept {hours:g} h, within the healthy {target} range."
+
+    return HealthFinding(
+        metric="sleep_duration", status=status, value=hours, target=target, message=message
+    )
+
+
+def _sleep_quality(score: float) -> HealthFinding:
+    target = f"> {GOOD_SLEEP_QUALITY}"
+
+    if score > GOOD_SLEEP_QUALITY:
+        status = "good"
+        message = f"Your sleep quality score of {score:g} is good."
+    else:
+        status = "attention"
+        message = f"Your sleep quality score of {score:g} is below {GOOD_SLEEP_QUALITY}. Limiting screens and caffeine in the evening can improve it."
+
+    return HealthFinding(
+        metric="sleep_quality", status=status, value=score, target=target, message=message
+    )
+
+
+def _stress(score: float) -> HealthFinding:
+    target = f"< {LOW_STRESS_SCORE}"
+
+    if score < LOW_STRESS_SCORE:
+        status = "good"
+        message = f"Your stress score of {score:g} is low."
+    else:
+        status = "attention"
+        message = f"Your stress score of {score:g} is elevated. A short walk or breathing break could help you unwind."
+
+    return HealthFinding(
+        metric="stress_score", status=status, value=score, target=target, message=message
+    )
+
+
+def _steps(steps: float, step_goal: int) -> HealthFinding:
+    target = f">= {step_goal} steps"
+    progress = steps / step_goal * 100
+
+    if steps >= step_goal:
+        status = "good"
+        message = f"You reached your step goal with {steps:,.0f} steps ({progress:.0f}%)."
+    else:
+        status = "attention"
+        message = f"You are at {steps:,.0f} of {step_goal:,} steps ({progress:.0f}%). {step_goal - steps:,.0f} more steps will reach your goal."
+
+    return HealthFinding(
+        metric="steps", status=status, value=steps, target=target, message=message
+    )
+
+
+def evaluate_health_rules(
+    health_data: dict[str, Any], step_goal: int | None = None
+) -> list[HealthFinding]:
+    """Evaluate the health thresholds and step goal progress; missing metrics are skipped"""
+    findings = []
+
+    sleep_hours = _number(health_data, "sleep_duration")
+    if sleep_hours is not None:
+        findings.append(_sleep_duration(sleep_hours))
+
+    sleep_quality = _number(health_data, "sleep_quality")
+    if sleep_quality is not None:
+        findings.append(_sleep_quality(sleep_quality))
+
+    stress = _number(health_data, "stress_score")
+    if stress is not None:
+        findings.append(_stress(stress))
+
+    steps = _number(health_data, "steps")
+    if steps is not None and step_goal:
+        findings.append(_steps(steps, step_goal))
+
+    return findings
+
+
+def rule_based_insights(
+    health_data: dict[str, Any], step_goal: int | None = None
+) -> HealthInsightsResponse | None:
+    """Build insights from the rules alone, or None when nothing conclusive was found"""
+    findings = evaluate_health_rules(health_data, step_goal)
+    if not findings:
+        return None
+
+    # Things to act on first, then what is going well
+    ordered = sorted(findings, key=lambda finding: finding.status != "attention")
+    return HealthInsightsResponse(
+        response_text=" ".join(finding.message for finding in ordered),
+        findings=findings,
+        source="rules",
+    )
@@ -0,0 +1,356 @@
+"""
+Health Store - Per-user columnar time series of health metrics on memory-mapped segments
+
+A store directory has a single writer: the first process to append takes an
+exclusive lock on it, and appends from any other process fail with
+StoreLockedError. Run ingestion on one worker, or give each worker its own
+HEALTH_STORE_DIR.
+"""
+
+import bisect
+import fcntl
+import os
+import re
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from app.utils.metrics import metrics
+from app.utils.random_health_data import HealthDataGenerator
+
+# Configuration
+HEALTH_STORE_DIR = Path(
+    os.getenv(
+        "HEALTH_STORE_DIR",
+        Path(__file__).resolve().parents[2] / "data" / "health_store",
+    )
+)
+# About 45 days of minute-level samples per segment
+SEGMENT_MAX_SAMPLES = int(os.getenv("HEALTH_SEGMENT_MAX_SAMPLES", "65536"))
+# Series kept open in memory; the least recently used are flushed and closed
+HEALTH_STORE_MAX_OPEN_SERIES = int(os.getenv("HEALTH_STORE_MAX_OPEN_SERIES", "4096"))
+
+METRICS = tuple(HealthDataGenerator.HEALTH_RANGES)
+HEAD_FILE = "head.npy"
+WRITER_LOCK_FILE = ".writer.lock"
+SEGMENT_FILE_PATTERN = re.compile(r"seg-(\d+(?:\.\d+)?)-(\d+(?:\.\d+)?)\.npy")
+USER_ID_PATTERN = re.compile(r"[\w-]+")
+
+
+class StoreLockedError(RuntimeError):
+    """Raised when another process is already writing to the store directory"""
+
+
+def _write_atomic(path: Path, data: np.ndarray) -> None:
+    """Write an array with np.save through a temporary file and rename"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=path.parent, prefix=f".{path.name}.", delete=False
+    ) as temp_file:
+        np.save(temp_file, data)
+    os.replace(temp_file.name, path)
+
+
+@dataclass
+class Segment:
+    """An immutable, sorted block of samples stored as a (2, n) float64 array
+
+    Row 0 holds Unix timestamps and row 1 the values, so each column is
+    contiguous on disk and can be binary searched through the memory map.
+    """
+
+    start: float
+    end: float
+    path: Path
+    _data: np.ndarray | None = field(default=None, repr=False)
+
+    @property
+    def data(self) -> np.ndarray:
+        if self._data is None:
+            self._data = np.load(self.path, mmap_mode="r")
+        return self._data
+
+    def slice(self, start: float, end: float) -> tuple[np.ndarray, np.ndarray]:
+        timestamps = self.data[0]
+        low = int(np.searchsorted(timestamps, start, side="left"))
+        high = int(np.searchsorted(timestamps, end, side="left"))
+        return np.array(timestamps[low:high]), np.array(self.data[1, low:high])
+
+
+class Series:
+    """Samples of one metric for one user, ordered by timestamp
+
+    Recent samples live in an in-memory head (array-backed columns) that is
+    persisted on flush. Once the head holds SEGMENT_MAX_SAMPLES samples the
+    oldest of them are sealed into a segment file, which is only read back
+    through a memory map.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.segments: list[Segment] = []
+        self.head_timestamps = array("d")
+        self.head_values = array("d")
+        self.dirty = False
+        self.closed = False
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+
+        for entry in self.path.iterdir():
+            match = SEGMENT_FILE_PATTERN.fullmatch(entry.name)
+            if match:
+                start, end = float(match.group(1)), float(match.group(2))
+                self.segments.append(Segment(start, end, entry))
+        self.segments.sort(key=lambda segment: segment.start)
+
+        head_path = self.path / HEAD_FILE
+        if head_path.exists():
+            head = np.load(head_path)
+            # A crash between sealing and rewriting the head leaves sealed samples behind
+            keep = head[0] > self.sealed_until
+            self.head_timestamps.frombytes(head[0][keep].tobytes())
+            self.head_values.frombytes(head[1][keep].tobytes())
+
+    @property
+    def sealed_until(self) -> float:
+        return self.segments[-1].end if self.segments else float("-inf")
+
+    def __len__(self) -> int:
+        return len(self.head_timestamps)
+
+    def append(self, timestamps: np.ndarray, values: np.ndarray) -> int | None:
+        """Add samples, returning how many were kept, or None once closed
+
+        Samples at or before the end of the last sealed segment are dropped,
+        since sealed segments are immutable.
+        """
+        with self.lock:
+            if self.closed:
+                return None
+            keep = timestamps > self.sealed_until
+            if not keep.all():
+                timestamps, values = timestamps[keep], values[keep]
+            if not len(timestamps):
+                return 0
+
+            if len(timestamps) > 1 and (np.diff(timestamps) < 0).any():
+                order = np.argsort(timestamps, kind="stable")
+                timestamps, values = timestamps[order], values[order]
+
+            if self.head_timestamps and timestamps[0] < self.head_timestamps[-1]:
+                # Out of order: merge with the head instead of appending
+                merged_timestamps = np.concatenate(
+                    (np.frombuffer(self.head_timestamps), timestamps)
+                )
+                merged_values = np.concatenate(
+                    (np.frombuffer(self.head_values), values)
+                )
+                order = np.argsort(merged_timestamps, kind="stable")
+                self.head_timestamps = array("d", merged_timestamps[order].tobytes())
+                self.head_values = array("d", merged_values[order].tobytes())
+            else:
+                self.head_timestamps.frombytes(timestamps.astype(np.float64).tobytes())
+                self.head_values.frombytes(values.astype(np.float64).tobytes())
+
+            self.dirty = True
+            while len(self.head_timestamps) >= SEGMENT_MAX_SAMPLES:
+                self._seal()
+
+            return len(timestamps)
+
+    def _seal(self) -> None:
+        # Cut after the last sample sharing the boundary timestamp, so equal
+        # timestamps never straddle a segment and a head
+        cut = bisect.bisect_right(
+            self.head_timestamps, self.head_timestamps[SEGMENT_MAX_SAMPLES - 1]
+        )
+        data = np.array(
+            (
+                np.frombuffer(self.head_timestamps, count=cut),
+                np.frombuffer(self.head_values, count=cut),
+            )
+        )
+        start, end = float(data[0, 0]), float(data[0, -1])
+        path = self.path / f"seg-{start!r}-{end!r}.npy"
+
+        _write_atomic(path, data)
+        self.segments.append(Segment(start, end, path))
+        del self.head_timestamps[:cut]
+        del self.head_values[:cut]
+        self._write_head()
+
+    def _write_head(self) -> None:
+        _write_atomic(
+            self.path / HEAD_FILE,
+            np.array((np.frombuffer(self.head_timestamps), np.frombuffer(self.head_values))),
+        )
+        self.dirty = False
+
+    def flush(self) -> None:
+        with self.lock:
+            if self.dirty:
+                self._write_head()
+
+    def close(self) -> None:
+        """Persist the head and refuse further appends; reads keep working"""
+        with self.lock:
+            if self.dirty:
+                self._write_head()
+            self.closed = True
+
+    def query(self, start: float, end: float) -> tuple[np.ndarray, np.ndarray]:
+        """Samples with start <= timestamp < end, oldest first"""
+        with self.lock:
+            segments = list(self.segments)
+            low = bisect.bisect_left(self.head_timestamps, start)
+            high = bisect.bisect_left(self.head_timestamps, end)
+            head = (
+                np.frombuffer(self.head_timestamps[low:high]),
+                np.frombuffer(self.head_values[low:high]),
+            )
+
+        # Segments are sorted and disjoint; skip straight to the first that can overlap
+        first = max(0, bisect.bisect_right([s.start for s in segments], start) - 1)
+        parts = [
+            segment.slice(start, end)
+            for segment in segments[first:]
+            if segment.start < end and segment.end >= start
+        ]
+        parts.append(head)
+
+        return (
+            np.concatenate([timestamps for timestamps, _ in parts]),
+            np.concatenate([values for _, values in parts]),
+        )
+
+
+class HealthStore:
+    """Health metric time series keyed by user and metric
+
+    At most max_open_series series are kept in memory. Evicting one flushes
+    its head, so it is reloaded from disk unchanged the next time it is used.
+    """
+
+    def __init__(
+        self,
+        root: Path = HEALTH_STORE_DIR,
+        max_open_series: int = HEALTH_STORE_MAX_OPEN_SERIES,
+    ):
+        self.root = root
+        self.max_open_series = max_open_series
+        self.series: OrderedDict[tuple[str, str], Series] = OrderedDict()
+        self.lock = threading.Lock()
+        self.writer_lock = None
+
+    def claim_writer(self) -> None:
+        """Take the store directory's writer lock, held until the process exits"""
+        if self.writer_lock is not None:
+            return
+
+        with self.lock:
+            if self.writer_lock is not None:
+                return
+            self.root.mkdir(parents=True, exist_ok=True)
+            handle = open(self.root / WRITER_LOCK_FILE, "a")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()
+                raise StoreLockedError(
+                    f"Health store {self.root} is written by another process"
+                ) from None
+            self.writer_lock = handle
+
+    def _series(self, user_id: str, metric: str) -> Series:
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        if not USER_ID_PATTERN.fullmatch(user_id):
+            raise ValueError(f"Invalid user id: {user_id}")
+
+        key = (user_id, metric)
+        with self.lock:
+            series = self.series.get(key)
+            if series is not None:
+                self.series.move_to_end(key)
+                return series
+
+            # Closed under the lock, so the series is not reopened before its head is saved
+            while len(self.series) >= self.max_open_series:
+                self.series.popitem(last=False)[1].close()
+            series = Series(self.root / user_id / metric)
+            self.series[key] = series
+            return series
+
+    def append(
+        self, user_id: str, metric: str, timestamps: np.ndarray, values: np.ndarray
+    ) -> int:
+        """Add samples (Unix seconds and values) to a series; returns how many were kept"""
+        self.claim_writer()
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        while True:
+            # None means the series was evicted meanwhile; append to its reopened copy
+            kept = self._series(user_id, metric).append(timestamps, values)
+            if kept is not None:
+                return kept
+
+    def sealed_until(self, user_id: str, metric: str) -> float:
+        """Samples at or before this timestamp can no longer be added to the series"""
+        return self._series(user_id, metric).sealed_until
+
+    def query(
+        self, user_id: str, metric: str, start: float, end: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Timestamps and values of a series between start (inclusive) and end (exclusive)"""
+        return self._series(user_id, metric).query(start, end)
+
+    def scan(
+        self, user_id: str, metric: str, start: float, end: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Like query, but series that are not open are read without being kept open
+
+        Meant for bulk reads over many users, which should not pin every
+        series' head in memory.
+        """
+        series = self.series.get((user_id, metric))
+        if series is None:
+            if metric not in METRICS or not USER_ID_PATTERN.fullmatch(user_id):
+                raise ValueError(f"Unknown series: {user_id}/{metric}")
+            series = Series(self.root / user_id / metric)
+        return series.query(start, end)
+
+    def user_ids(self) -> list[str]:
+        """Every user with stored or buffered samples"""
+        users = {user_id for user_id, _ in list(self.series)}
+        if self.root.exists():
+            users.update(entry.name for entry in self.root.iterdir() if entry.is_dir())
+        return sorted(users)
+
+    def flush(self) -> None:
+        """Persist the in-memory heads of every series"""
+        for series in list(self.series.values()):
+            series.flush()
+
+
+# Global health metric store
+health_store = HealthStore()
+
+metrics.gauge(
+    "health_store_series",
+    "Health metric series (user, metric) opened in this process",
+    lambda: len(health_store.series),
+)
+metrics.gauge(
+    "health_store_head_samples",
+    "Samples held in memory and not yet sealed into segment files",
+    lambda: sum(len(series) for series in list(health_store.series.values())),
+)
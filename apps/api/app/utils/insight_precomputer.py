@@ -0,0 +1,252 @@
+"""
+Insight Precomputer - Precomputes daily insights and event-day suggestions in the background
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Any, Callable
+
+from app.utils.metrics import cache_requests
+from app.utils.single_flight import agent_requests
+
+logger = logging.getLogger("insight_precomputer")
+
+# Configuration
+PRECOMPUTE_ENABLED = os.getenv("ENABLE_INSIGHT_PRECOMPUTE", "1") == "1"
+PRECOMPUTE_TICK_SEC = 30  # How often due jobs are collected
+PRECOMPUTE_OFF_PEAK_START_HOUR = int(os.getenv("PRECOMPUTE_OFF_PEAK_START_HOUR", "2"))
+PRECOMPUTE_OFF_PEAK_END_HOUR = int(os.getenv("PRECOMPUTE_OFF_PEAK_END_HOUR", "6"))
+PRECOMPUTE_MAX_CONCURRENCY = int(os.getenv("PRECOMPUTE_MAX_CONCURRENCY", "2"))
+PRECOMPUTE_MIN_INTERVAL_SEC = float(os.getenv("PRECOMPUTE_MIN_INTERVAL_SEC", "2"))
+PRECOMPUTE_USER_IDS = [
+    user_id.strip()
+    for user_id in os.getenv("PRECOMPUTE_USER_IDS", "").split(",")
+    if user_id.strip()
+]
+ACTIVE_USER_TTL = timedelta(days=7)
+
+JOB_KINDS = ("insights", "event_day_suggestion")
+# Results computed only on request, never in the background
+ON_DEMAND_KINDS = ("insights_narrative",)
+
+
+@dataclass
+class PrecomputedResult:
+    """A stored agent result and when it was generated"""
+
+    value: Any
+    generated_at: datetime
+
+
+class InsightPrecomputer:
+    """Keeps per-user insights and day suggestions warm for interactive requests
+
+    A job (kind, user_id) is recomputed when its inputs changed, when it has
+    not been attempted since the process started, or during the off-peak
+    window when the stored result is from a previous day and the job was
+    last attempted on a previous day too.
+    """
+
+    def __init__(self):
+        self.running = False
+        self.task = None
+        self.store: dict[tuple[str, str], PrecomputedResult] = {}
+        self.active_users: dict[str, datetime] = {
+            user_id: datetime.now() for user_id in PRECOMPUTE_USER_IDS
+        }
+        self.dirty: set[tuple[str, str]] = set()
+        # When each job last ran, even if it failed or produced no result
+        self.attempted: dict[tuple[str, str], datetime] = {}
+        self.semaphore = asyncio.Semaphore(PRECOMPUTE_MAX_CONCURRENCY)
+        self.rate_lock = asyncio.Lock()
+        self.last_started = 0.0
+
+    def _job_functions(self) -> dict[str, Callable[..., Any]]:
+        from app.dependencies.langchain import (
+            ai_event_day_suggestions,
+            create_ai_insights,
+        )
+
+        return {
+            "insights": create_ai_insights,
+            "insights_narrative": partial(create_ai_insights, enrich=True),
+            "event_day_suggestion": ai_event_day_suggestions,
+        }
+
+    def mark_active(self, user_id: str) -> None:
+        """Record that a user is using the app so their results are kept warm"""
+        self.active_users[user_id] = datetime.now()
+
+    def invalidate(
+        self, user_id: str, kinds: tuple[str, ...] = JOB_KINDS + ON_DEMAND_KINDS
+    ) -> None:
+        """Drop stored results whose inputs changed and schedule a recompute"""
+        for kind in kinds:
+            self.store.pop((kind, user_id), None)
+            # Inactive users are recomputed when they come back anyway
+            if kind in JOB_KINDS and user_id in self.active_users:
+                self.dirty.add((kind, user_id))
+
+    def put(self, kind: str, user_id: str, value: Any) -> PrecomputedResult:
+        """Store a freshly generated result"""
+        result = PrecomputedResult(value=value, generated_at=datetime.now())
+        if value is not None:
+            self.store[(kind, user_id)] = result
+            self.dirty.discard((kind, user_id))
+        return result
+
+    def is_fresh(self, result: PrecomputedResult) -> bool:
+        return result.generated_at.date() == datetime.now().date()
+
+    async def get(self, kind: str, user_id: str) -> PrecomputedResult:
+        """
+        Serve the stored result when fresh, otherwise compute it now.
+
+        If computing fails (e.g. the model is timing out or its circuit
+        breaker is open) the last good result is served even when stale.
+        """
+        self.mark_active(user_id)
+
+        cached = self.store.get((kind, user_id))
+        if cached is not None and self.is_fresh(cached):
+            cache_requests.inc(cache=f"precomputed_{kind}", result="hit")
+            return cached
+
+        cache_requests.inc(cache=f"precomputed_{kind}", result="miss")
+        try:
+            return await self.compute(kind, user_id)
+        except Exception as exc:
+            if cached is None:
+                raise
+            logger.warning(f"Serving stale {kind} for user {user_id}: {exc}")
+            cache_requests.inc(cache=f"precomputed_{kind}", result="stale")
+            return cached
+
+    async def compute(self, kind: str, user_id: str) -> PrecomputedResult:
+        """Run the agent for a job, sharing the run with concurrent requests"""
+        func = self._job_functions()[kind]
+
+        async def run() -> PrecomputedResult:
+            value = await func(user_id=user_id)
+            return self.put(kind, user_id, value)
+
+        return await agent_requests.do((kind, user_id, ""), run)
+
+    def due_jobs(self) -> list[tuple[str, str]]:
+        """Collect jobs that should be recomputed now"""
+        now = datetime.now()
+        off_peak = (
+            PRECOMPUTE_OFF_PEAK_START_HOUR <= now.hour < PRECOMPUTE_OFF_PEAK_END_HOUR
+        )
+
+        for user_id, last_seen in list(self.active_users.items()):
+            if now - last_seen > ACTIVE_USER_TTL:
+                del self.active_users[user_id]
+                for kind in JOB_KINDS:
+                    self.attempted.pop((kind, user_id), None)
+                    self.dirty.discard((kind, user_id))
+
+        # Batch runs also store results, for users who may never be active
+        for job, result in list(self.store.items()):
+            if (
+                job[1] not in self.active_users
+                and now - result.generated_at > ACTIVE_USER_TTL
+            ):
+                del self.store[job]
+
+        jobs = []
+        for user_id in self.active_users:
+            for kind in JOB_KINDS:
+                job = (kind, user_id)
+                cached = self.store.get(job)
+                stale = cached is None or not self.is_fresh(cached)
+                attempted = self.attempted.get(job)
+
+                if (
+                    job in self.dirty
+                    or (stale and attempted is None)
+                    or (stale and off_peak and attempted.date() < now.date())
+                ):
+                    jobs.append(job)
+
+        return jobs
+
+    async def _wait_for_rate_limit(self) -> None:
+        async with self.rate_lock:
+            delay = self.last_started + PRECOMPUTE_MIN_INTERVAL_SEC - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.last_started = time.monotonic()
+
+    async def run_job(self, kind: str, user_id: str) -> None:
+        """Compute a single job within the concurrency and rate limits"""
+        async with self.semaphore:
+            await self._wait_for_rate_limit()
+            self.attempted[(kind, user_id)] = datetime.now()
+            self.dirty.discard((kind, user_id))
+
+            try:
+                await self.compute(kind, user_id)
+                logger.info(f"Precomputed {kind} for user {user_id}")
+            except Exception as exc:
+                logger.error(f"Precompute of {kind} for user {user_id} failed: {exc}")
+
+    async def run_once(self) -> None:
+        """Run every job that is currently due"""
+        jobs = self.due_jobs()
+        if not jobs:
+            return
+
+        logger.info(f"Precomputing {len(jobs)} jobs")
+        await asyncio.gather(*(self.run_job(kind, user_id) for kind, user_id in jobs))
+
+    async def scheduler_loop(self):
+        """Main scheduling loop"""
+        logger.info("Insight precomputer started")
+
+        while self.running:
+            try:
+                await self.run_once()
+            except Exception as exc:
+                logger.warning(f"Precompute pass failed: {exc}")
+
+            await asyncio.sleep(PRECOMPUTE_TICK_SEC)
+
+        logger.info("Insight precomputer stopped")
+
+    async def start(self):
+        """Start the scheduler"""
+        if not PRECOMPUTE_ENABLED:
+            logger.info("Insight precomputer disabled via ENABLE_INSIGHT_PRECOMPUTE env var")
+            return
+
+        if self.running:
+            logger.warning("Precomputer already running")
+            return
+
+        self.running = True
+        self.task = asyncio.create_task(self.scheduler_loop())
+
+    async def stop(self):
+        """Stop the scheduler"""
+        if not self.running:
+            return
+
+        self.running = False
+
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+# Global precomputer instance
+insight_precomputer = InsightPrecomputer()
@@ -0,0 +1,173 @@
+"""
+Metrics - In-process counters and histograms rendered in the Prometheus text format
+"""
+
+import math
+import threading
+from typing import Callable
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+LabelValues = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, **extra: str) -> str:
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values: dict[LabelValues, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        return self.values.get(key, 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(
+                    f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                )
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at render time"""
+
+    def __init__(self, name: str, description: str, func: Callable[[], float]):
+        self.name = name
+        self.description = description
+        self.func = func
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {_format_value(self.func())}",
+        ]
+
+
+class Histogram:
+    """Fixed-bucket histogram with optional labels"""
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self.series: dict[LabelValues, list[float]] = {}  # bucket counts + [sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0.0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _format_labels(self.labels, key, le=_format_value(bound))
+                    lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+                labels = _format_labels(self.labels, key, le="+Inf")
+                lines.append(f"{self.name}_bucket{labels} {_format_value(series[-1])}")
+                labels = _format_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_count{labels} {_format_value(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric of the process, created on first use"""
+
+    def __init__(self):
+        self.metrics: dict[str, Counter | Gauge | Histogram] = {}
+        self.lock = threading.Lock()
+
+    def counter(
+        self, name: str, description: str, labels: tuple[str, ...] = ()
+    ) -> Counter:
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = Counter(name, description, labels)
+            return self.metrics[name]  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = Histogram(name, description, labels, buckets)
+            return self.metrics[name]  # type: ignore[return-value]
+
+    def gauge(self, name: str, description: str, func: Callable[[], float]) -> Gauge:
+        with self.lock:
+            self.metrics[name] = Gauge(name, description, func)
+            return self.metrics[name]  # type: ignore[return-value]
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for name in sorted(self.metrics):
+            lines.extend(self.metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+# Global registry exposed on /metrics
+metrics = MetricsRegistry()
+
+cache_requests = metrics.counter(
+    "cache_requests_total", "Cache lookups by cache and result", ("cache", "result")
+)
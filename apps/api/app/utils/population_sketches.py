@@ -0,0 +1,489 @@
+"""
+Population Sketches - Mergeable per-cohort quantile sketches for ranking users against their peers
+"""
+
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from app.utils.health_rollups import RESOLUTIONS, bucket_starts, health_rollups
+from app.utils.health_rules import SAMPLE_RANGES
+from app.utils.metrics import metrics
+
+logger = logging.getLogger("population_sketches")
+
+# Configuration
+POPULATION_SKETCHES_ENABLED = os.getenv("ENABLE_POPULATION_SKETCHES", "1") == "1"
+POPULATION_SKETCH_DIR = Path(
+    os.getenv(
+        "POPULATION_SKETCH_DIR",
+        Path(__file__).resolve().parents[2] / "data" / "population_sketches",
+    )
+)
+# Each host saves its own file, picked up again after a restart
+POPULATION_SKETCH_WORKER = os.getenv("POPULATION_SKETCH_WORKER", socket.gethostname())
+POPULATION_REFRESH_SEC = float(os.getenv("POPULATION_REFRESH_SEC", "60"))
+# Smaller cohorts are widened so a rank never describes just a few people
+POPULATION_MIN_COUNT = int(os.getenv("POPULATION_MIN_COUNT", "20"))
+SKETCH_BINS = 2048
+DAILY_VALUE_LOOKBACK_DAYS = 7
+
+AGE_BANDS = (
+    (70, "70+"),
+    (60, "60-69"),
+    (50, "50-59"),
+    (40, "40-49"),
+    (30, "30-39"),
+    (18, "18-29"),
+)
+# Ranked by daily total; every other metric by its daily mean
+ADDITIVE_METRICS = ("steps", "distance_meters", "calories_burned")
+ANY = "*"
+COHORT_FIELDS = ("age_band", "gender", "activity_level")
+
+Cohort = tuple[str, str, str]  # (age band, gender, activity level)
+SketchKey = tuple[Cohort, str]
+DayKey = tuple[str, str]  # (user, metric)
+
+
+def age_band(dob: Any, on: date) -> str:
+    if isinstance(dob, np.datetime64):
+        dob = dob.astype("datetime64[D]").item()
+    elif isinstance(dob, str):
+        dob = date.fromisoformat(dob[:10])
+    elif isinstance(dob, datetime):
+        dob = dob.date()
+
+    age = on.year - dob.year - ((on.month, on.day) < (dob.month, dob.day))
+    for lowest, band in AGE_BANDS:
+        if age >= lowest:
+            return band
+    return "under 18"
+
+
+def cohort_of(profile: dict[str, Any] | None, on: date | None = None) -> Cohort | None:
+    """The (age band, gender, activity level) cohort of a profile, if it has them"""
+    if not profile or not all(
+        profile.get(field) for field in ("dob", "gender", "activity_level")
+    ):
+        return None
+    try:
+        band = age_band(profile["dob"], on or date.today())
+    except (TypeError, ValueError):
+        return None
+    return band, str(profile["gender"]).lower(), str(profile["activity_level"]).lower()
+
+
+def _widen(cohort: Cohort) -> list[Cohort]:
+    band, gender, _ = cohort
+    return [cohort, (band, gender, ANY), (band, ANY, ANY), (ANY, ANY, ANY)]
+
+
+def _matches(pattern: Cohort, cohort: Cohort) -> bool:
+    return all(want in (ANY, have) for want, have in zip(pattern, cohort))
+
+
+class QuantileSketch:
+    """Fixed-bin histogram over a metric's SAMPLE_RANGES
+
+    Ranks and quantiles are exact to within one bin (1/SKETCH_BINS of the
+    range, e.g. 0.1 bpm of heart rate). Sketches merge by adding counts, so
+    they can be combined in any order, across cohorts and across workers.
+    """
+
+    __slots__ = ("low", "width", "counts", "_cumulative")
+
+    def __init__(self, metric: str, counts: np.ndarray | None = None):
+        low, high = SAMPLE_RANGES[metric]
+        self.low = float(low)
+        self.width = (high - low) / SKETCH_BINS
+        self.counts = (
+            np.zeros(SKETCH_BINS, dtype=np.uint64) if counts is None else counts
+        )
+        self._cumulative: np.ndarray | None = None
+
+    @property
+    def total(self) -> int:
+        cumulative = self.cumulative()
+        return int(cumulative[-1])
+
+    def cumulative(self) -> np.ndarray:
+        if self._cumulative is None:
+            self._cumulative = np.cumsum(self.counts)
+        return self._cumulative
+
+    def _bins(self, values: np.ndarray) -> np.ndarray:
+        positions = (np.asarray(values, dtype=np.float64) - self.low) / self.width
+        return np.clip(positions, 0, SKETCH_BINS - 1).astype(np.intp)
+
+    def add(self, values: np.ndarray) -> None:
+        self.counts += np.bincount(self._bins(values), minlength=SKETCH_BINS).astype(
+            np.uint64
+        )
+        self._cumulative = None
+
+    def merge(self, other: "QuantileSketch") -> None:
+        self.counts += other.counts
+        self._cumulative = None
+
+    def rank(self, value: float) -> float:
+        """Percentage of recorded values below value"""
+        cumulative = self.cumulative()
+        position = min(max((value - self.low) / self.width, 0.0), SKETCH_BINS)
+        index = min(int(position), SKETCH_BINS - 1)
+        in_bin = float(self.counts[index])
+        below = float(cumulative[index]) - in_bin
+        return 100 * (below + in_bin * (position - index)) / float(cumulative[-1])
+
+    def quantile(self, q: float) -> float:
+        """Value below which a fraction q of recorded values fall"""
+        cumulative = self.cumulative()
+        target = q * float(cumulative[-1])
+        index = min(int(np.searchsorted(cumulative, target)), SKETCH_BINS - 1)
+        in_bin = float(self.counts[index])
+        below = float(cumulative[index]) - in_bin
+        fraction = (target - below) / in_bin if in_bin else 0.0
+        return self.low + (index + fraction) * self.width
+
+
+class PopulationSketches:
+    """Quantile sketches of daily metric values per cohort
+
+    Ingested samples are folded into a running daily total (or mean) per
+    user and metric; when a user's next day starts, the finished day is
+    added to their cohort's sketch, so every user-day counts once. Samples
+    only reach the sketches through the process writing the health store,
+    which has a single writer, so a user's days are tracked in one place.
+    The sketches and the days in progress are saved to the host's file
+    together, so a restart resumes from the last flush without losing or
+    re-adding days. Other hosts' files are merged on refresh. Ranks for
+    broad cohorts merge the narrow ones and are cached until their metric
+    changes.
+    """
+
+    def __init__(
+        self, root: Path = POPULATION_SKETCH_DIR, worker: str = POPULATION_SKETCH_WORKER
+    ):
+        self.root = root
+        self.path = root / f"{worker}.npz"
+        self.local: dict[SketchKey, QuantileSketch] = {}
+        self.peers: dict[Path, tuple[float, dict[SketchKey, np.ndarray]]] = {}
+        self.merged: dict[str, dict[Cohort, QuantileSketch]] = {}
+        # (user, metric) -> [day start, sum, count, cohort] of the day in progress
+        self.days: dict[DayKey, list] = {}
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.dirty = False
+        self.mtime: float | None = None  # Of our file when last read or written
+        self.refreshed = 0.0
+
+    def _ensure_loaded(self) -> None:
+        if self.loaded:
+            return
+        with self.lock:
+            if not self.loaded:
+                self._load_own()
+                self._refresh_peers()
+                self.loaded = True
+                self.refreshed = time.monotonic()
+
+    def _load_own(self) -> None:
+        """Read our file if another process saved it since we last did
+
+        Only while nothing is unsaved here; that happens when the health
+        store writer moved to this process, or in processes that only rank.
+        """
+        if self.dirty:
+            return
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self.mtime:
+            return
+
+        sketches, self.days = _read(self.path)
+        self.local = {
+            key: QuantileSketch(key[1], counts) for key, counts in sketches.items()
+        }
+        self.mtime = mtime
+        self.merged.clear()
+
+    def _maybe_refresh(self) -> None:
+        if time.monotonic() - self.refreshed < POPULATION_REFRESH_SEC:
+            return
+        with self.lock:
+            self._load_own()
+            self._refresh_peers()
+            self.refreshed = time.monotonic()
+
+    def add(self, cohort: Cohort, metric: str, values: np.ndarray) -> None:
+        """Add daily values of a metric for one cohort"""
+        self._ensure_loaded()
+        with self.lock:
+            sketch = self.local.get((cohort, metric))
+            if sketch is None:
+                sketch = self.local[(cohort, metric)] = QuantileSketch(metric)
+            sketch.add(values)
+            self.merged.pop(metric, None)
+            self.dirty = True
+
+    def observe(
+        self,
+        user_id: str,
+        profile: dict[str, Any] | None,
+        metric: str,
+        timestamps: np.ndarray,
+        values: np.ndarray,
+    ) -> None:
+        """Fold a user's samples into their daily values and add finished days"""
+        if metric not in SAMPLE_RANGES or not len(timestamps):
+            return
+        self._ensure_loaded()
+        with self.lock:
+            # Pick up days saved by a previous writer before building on them
+            self._load_own()
+
+        days = bucket_starts(timestamps, RESOLUTIONS["day"])
+        order = np.argsort(days, kind="stable")
+        days, values = days[order], values[order]
+        first = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        sums = np.add.reduceat(values, first).tolist()
+        counts = np.diff(np.r_[first, len(days)]).tolist()
+
+        finished: dict[Cohort, list[float]] = {}
+        state = self.days.get((user_id, metric))
+        if state is not None and state[3] is None:
+            # The profile may only have been known after the day started
+            state[3] = cohort_of(profile, datetime.fromtimestamp(state[0]).date())
+        for day, total, count in zip(days[first].tolist(), sums, counts):
+            if state is not None and day < state[0]:
+                # Days already added to a sketch are not revisited
+                continue
+            if state is not None and day == state[0]:
+                state[1] += total
+                state[2] += count
+                continue
+
+            if state is not None and state[3] is not None:
+                finished.setdefault(state[3], []).append(_daily_value(metric, state))
+            cohort = cohort_of(profile, datetime.fromtimestamp(day).date())
+            state = [day, total, count, cohort]
+
+        self.days[(user_id, metric)] = state
+        self.dirty = True
+        for cohort, daily_values in finished.items():
+            self.add(cohort, metric, np.array(daily_values))
+
+    def _sketch(self, pattern: Cohort, metric: str) -> QuantileSketch:
+        """The merged sketch of every cohort matching the pattern"""
+        cached = self.merged.get(metric, {}).get(pattern)
+        if cached is not None:
+            return cached
+
+        with self.lock:
+            sketch = QuantileSketch(metric)
+            for (cohort, name), local in self.local.items():
+                if name == metric and _matches(pattern, cohort):
+                    sketch.merge(local)
+            for _, sketches in self.peers.values():
+                for (cohort, name), counts in sketches.items():
+                    if name == metric and _matches(pattern, cohort):
+                        sketch.counts += counts
+            sketch.cumulative()
+            self.merged.setdefault(metric, {})[pattern] = sketch
+        return sketch
+
+    def rank(self, cohort: Cohort, metric: str, value: float) -> dict[str, Any] | None:
+        """
+        Where value falls among the daily values of the user's peers.
+
+        The cohort is widened (any activity level, then any gender, then
+        everyone) until it has POPULATION_MIN_COUNT user-days; returns None
+        when even everyone has fewer.
+        """
+        self._ensure_loaded()
+        self._maybe_refresh()
+        for pattern in _widen(cohort):
+            sketch = self._sketch(pattern, metric)
+            count = sketch.total
+            if count >= POPULATION_MIN_COUNT:
+                return {
+                    "value": value,
+                    "percentile": round(sketch.rank(value), 1),
+                    "count": count,
+                    "cohort": dict(
+                        zip(("age_band", "gender", "activity_level"), pattern)
+                    ),
+                    "quartiles": [
+                        round(sketch.quantile(q), 2) for q in (0.25, 0.5, 0.75)
+                    ],
+                }
+        return None
+
+    def rank_values(
+        self, cohort: Cohort, values: dict[str, float]
+    ) -> dict[str, dict[str, Any] | None]:
+        return {
+            metric: self.rank(cohort, metric, float(value))
+            for metric, value in values.items()
+        }
+
+    def _refresh_peers(self) -> None:
+        if not self.root.exists():
+            return
+
+        for path in self.root.glob("*.npz"):
+            if path == self.path or path.name.startswith("."):
+                # Our own sketches, or another worker's file being written
+                continue
+            try:
+                mtime = path.stat().st_mtime
+                if path in self.peers and self.peers[path][0] == mtime:
+                    continue
+                self.peers[path] = (mtime, _read(path)[0])
+            except (OSError, ValueError) as exc:
+                logger.warning(f"Skipping unreadable sketch file {path.name}: {exc}")
+                continue
+            self.merged.clear()
+
+    def flush(self) -> None:
+        """Save this worker's sketches if they changed and merge in other workers'"""
+        self._ensure_loaded()
+        with self.lock:
+            if self.dirty:
+                _write(
+                    self.path,
+                    {key: sketch.counts for key, sketch in self.local.items()},
+                    self.days,
+                )
+                self.mtime = self.path.stat().st_mtime
+                self.dirty = False
+            self._refresh_peers()
+            self.refreshed = time.monotonic()
+
+
+def latest_daily_values(
+    user_id: str, metrics: list[str]
+) -> dict[str, tuple[date, float]]:
+    """
+    Each metric's daily value on the user's latest complete day with samples.
+
+    Looks back DAILY_VALUE_LOOKBACK_DAYS; today is left out because a day
+    in progress would rank low against finished ones.
+    """
+    day = RESOLUTIONS["day"]
+    today = float(bucket_starts(np.array([time.time()]), day)[0])
+    values = {}
+    for metric in metrics:
+        _, _, buckets = health_rollups.query(
+            user_id, metric, today - DAILY_VALUE_LOOKBACK_DAYS * day, today, day
+        )
+        filled = np.flatnonzero(buckets["count"])
+        if not len(filled):
+            continue
+        last = filled[-1]
+        value = buckets["sum" if metric in ADDITIVE_METRICS else "mean"][last]
+        values[metric] = (
+            datetime.fromtimestamp(buckets["start"][last]).date(),
+            float(value),
+        )
+    return values
+
+
+def _daily_value(metric: str, state: list) -> float:
+    _, total, count, _ = state
+    return total if metric in ADDITIVE_METRICS else total / count
+
+
+def _write(
+    path: Path, sketches: dict[SketchKey, np.ndarray], days: dict[DayKey, list]
+) -> None:
+    """Save sketches sparsely (non-empty bins and their counts, one run per
+    sketch) along with the days in progress"""
+    keys, offsets, bins, counts = [], [0], [], []
+    for (cohort, metric), sketch_counts in sketches.items():
+        nonzero = np.flatnonzero(sketch_counts)
+        keys.append("|".join((*cohort, metric)))
+        bins.append(nonzero.astype(np.uint16))
+        counts.append(sketch_counts[nonzero])
+        offsets.append(offsets[-1] + len(nonzero))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".npz", delete=False
+    ) as temp_file:
+        np.savez(
+            temp_file,
+            bins=SKETCH_BINS,
+            keys=np.array(keys, dtype=str),
+            offsets=np.array(offsets, dtype=np.int64),
+            bin=np.concatenate(bins) if bins else np.empty(0, dtype=np.uint16),
+            count=_narrow(np.concatenate(counts) if counts else np.empty(0, np.uint64)),
+            day_keys=np.array(["|".join(key) for key in days], dtype=str),
+            day_start=np.array([state[0] for state in days.values()], dtype=np.float64),
+            day_sum=np.array([state[1] for state in days.values()], dtype=np.float64),
+            day_count=np.array([state[2] for state in days.values()], dtype=np.int64),
+            day_cohort=np.array(
+                ["|".join(state[3]) if state[3] else "" for state in days.values()],
+                dtype=str,
+            ),
+        )
+    os.replace(temp_file.name, path)
+
+
+def _narrow(counts: np.ndarray) -> np.ndarray:
+    """Smallest unsigned dtype that holds every count"""
+    return counts.astype(np.min_scalar_type(int(counts.max(initial=0))))
+
+
+def _read(path: Path) -> tuple[dict[SketchKey, np.ndarray], dict[DayKey, list]]:
+    with np.load(path) as data:
+        if int(data["bins"]) != SKETCH_BINS:
+            raise ValueError(
+                f"sketches have {int(data['bins'])} bins, not {SKETCH_BINS}"
+            )
+        offsets, bins, counts = data["offsets"], data["bin"], data["count"]
+        sketches = {}
+        for index, key in enumerate(data["keys"].tolist()):
+            band, gender, activity, metric = key.split("|")
+            dense = np.zeros(SKETCH_BINS, dtype=np.uint64)
+            run = slice(offsets[index], offsets[index + 1])
+            dense[bins[run]] = counts[run].astype(np.uint64)
+            sketches[((band, gender, activity), metric)] = dense
+
+        days = {}
+        if "day_keys" in data.files:
+            for key, start, total, count, cohort in zip(
+                data["day_keys"].tolist(),
+                data["day_start"].tolist(),
+                data["day_sum"].tolist(),
+                data["day_count"].tolist(),
+                data["day_cohort"].tolist(),
+            ):
+                user_id, metric = key.split("|")
+                days[(user_id, metric)] = [
+                    start,
+                    total,
+                    count,
+                    tuple(cohort.split("|")) if cohort else None,
+                ]
+        return sketches, days
+
+
+# Global sketches fed by the sample ingestor
+population_sketches = PopulationSketches()
+
+metrics.gauge(
+    "population_sketches",
+    "Cohort and metric sketches recorded by this worker",
+    lambda: len(population_sketches.local),
+)
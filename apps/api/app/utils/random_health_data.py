@@ -3,14 +3,20 @@ Random Health Data Generator
 Tạo dữ liệu sức khỏe ngẫu nhiên trong các ngưỡng cố định
 """
 
+import hashlib
 import json
+import os
 import random
-from datetime import datetime, timedelta
-from pathlib import Path
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
 from typing import Any, Dict, List
 
 SPORT_OPTIONS = ("pickleball", "swim", "running")
 
+# Configuration
+MOCK_HEALTH_CACHE_SIZE = int(os.getenv("MOCK_HEALTH_CACHE_SIZE", "4096"))
+WORKOUT_DAY_PROBABILITY = 0.5  # The rest are rest days, about 3.5 workouts a week
+
 
 class HealthDataGenerator:
     """Generator for random health data"""
@@ -72,51 +78,68 @@ class HealthDataGenerator:
         return data_list
 
     @classmethod
-    def generate_realistic_health_data(cls) -> dict[str, Any]:
+    def generate_realistic_health_data(
+        cls,
+        rng: random.Random | None = None,
+        day: date | None = None,
+        user_id: str | None = None,
+    ) -> dict[str, Any]:
+        """Generate correlated health data; pass a seeded rng and day to make it reproducible"""
+        rng = rng or random.Random()
         data = {}
 
-        data["steps"] = random.randint(3000, 15000)
+        data["steps"] = rng.randint(3000, 15000)
         data["distance_meters"] = int(data["steps"] * 0.7)  # Correlated with steps
-        data["calories_burned"] = int(data["steps"] * 0.1 + random.randint(500, 1000))
+        data["calories_burned"] = int(data["steps"] * 0.1 + rng.randint(500, 1000))
 
-        data["sleep_duration"] = round(random.uniform(6.0, 9.0), 1)
-        data["sleep_quality"] = random.randint(60, 95)
+        data["sleep_duration"] = round(rng.uniform(6.0, 9.0), 1)
+        data["sleep_quality"] = rng.randint(60, 95)
 
         base_heart_rate = 60
         activity_factor = data["steps"] / 10000  # 0.3 đến 1.5
-        stress_factor = random.randint(10, 50)
+        stress_factor = rng.randint(10, 50)
         data["heart_rate"] = int(
             base_heart_rate + activity_factor * 20 + stress_factor * 0.3
         )
 
-        data["stress_score"] = random.randint(20, 80)
+        data["stress_score"] = rng.randint(20, 80)
 
         base_systolic = 110
         base_diastolic = 70
         stress_effect = (data["stress_score"] - 50) * 0.5
 
         data["bp_systolic"] = int(
-            base_systolic + stress_effect + random.randint(-10, 10)
+            base_systolic + stress_effect + rng.randint(-10, 10)
         )
         data["bp_diastolic"] = int(
-            base_diastolic + stress_effect * 0.6 + random.randint(-5, 5)
+            base_diastolic + stress_effect * 0.6 + rng.randint(-5, 5)
         )
 
         data["blood_glucose"] = int(
-            90 + (data["steps"] / 1000) * 5 + random.randint(-20, 20)
+            90 + (data["steps"] / 1000) * 5 + rng.randint(-20, 20)
         )
 
-        data["blood_oxygen"] = random.randint(95, 100)
+        data["blood_oxygen"] = rng.randint(95, 100)
 
         data["blood_pressure"] = f"{data['bp_systolic']}/{data['bp_diastolic']}"
-        data["timestamp"] = datetime.now().isoformat()
-        data["weekly_workouts"] = _generate_weekly_workout_history()
+        data["timestamp"] = (
+            datetime.combine(day, time.min) if day else datetime.now()
+        ).isoformat()
+        data["weekly_workouts"] = _generate_weekly_workout_history(
+            rng=rng, today=day, user_id=user_id
+        )
 
         return data
 
 
-def _generate_weekly_workout_history(days: int = 7) -> List[Dict[str, Any]]:
-    today = datetime.now().date()
+def _generate_weekly_workout_history(
+    days: int = 7,
+    rng: random.Random | None = None,
+    today: date | None = None,
+    user_id: str | None = None,
+) -> List[Dict[str, Any]]:
+    rng = rng or random.Random()
+    today = today or datetime.now().date()
     workouts: List[Dict[str, Any]] = []
     calorie_burn_rate = {
         "pickleball": 9.0,
@@ -126,10 +149,14 @@ def _generate_weekly_workout_history(days: int = 7) -> List[Dict[str, Any]]:
 
     for offset in range(days):
         day = today - timedelta(days=offset)
-        sport = random.choice(SPORT_OPTIONS)
-        duration = random.randint(30, 75)
+        # Seed each day separately so overlapping weeks agree on shared days
+        day_rng = _seeded_rng(user_id, day, "workout") if user_id else rng
+        if day_rng.random() >= WORKOUT_DAY_PROBABILITY:
+            continue
+        sport = day_rng.choice(SPORT_OPTIONS)
+        duration = day_rng.randint(30, 75)
         burn_rate = calorie_burn_rate[sport]
-        calories = int(duration * burn_rate * random.uniform(0.85, 1.15))
+        calories = int(duration * burn_rate * day_rng.uniform(0.85, 1.15))
 
         workouts.append(
             {
@@ -143,32 +170,36 @@ def _generate_weekly_workout_history(days: int = 7) -> List[Dict[str, Any]]:
     return list(reversed(workouts))
 
 
-CACHE_FILE_PATH = Path(__file__).resolve().parent / "mock_health_data_cache.json"
+def _seeded_rng(user_id: str, day: date, purpose: str = "health") -> random.Random:
+    digest = hashlib.blake2b(
+        f"{user_id}:{day.isoformat()}:{purpose}".encode(), digest_size=8
+    ).digest()
+    return random.Random(int.from_bytes(digest, "big"))
 
 
-def _load_cache() -> Dict[str, Any]:
-    if not CACHE_FILE_PATH.exists():
-        return {}
+@lru_cache(maxsize=MOCK_HEALTH_CACHE_SIZE)
+def _user_mock_health_data(user_id: str, day: date) -> dict[str, Any]:
+    return HealthDataGenerator.generate_realistic_health_data(
+        _seeded_rng(user_id, day), day, user_id
+    )
 
-    try:
-        with CACHE_FILE_PATH.open("r", encoding="utf-8") as cache_file:
-            data = json.load(cache_file)
-            if isinstance(data, dict):
-                return data
-    except (OSError, json.JSONDecodeError):
-        return {}
 
-    return {}
+def get_mock_workout(user_id: str, day: date) -> dict[str, Any] | None:
+    """The workout the user's mock history records for a day, None on rest days"""
+    workouts = _generate_weekly_workout_history(days=1, today=day, user_id=user_id)
+    return workouts[0] if workouts else None
 
 
-def _write_cache(cache: Dict[str, Any]) -> None:
-    try:
-        CACHE_FILE_PATH.parent.mkdir(parents=True, exist_ok=True)
-        with CACHE_FILE_PATH.open("w", encoding="utf-8") as cache_file:
-            json.dump(cache, cache_file)
-    except OSError:
-        # If persisting fails we still return in-memory data.
-        pass
+def get_mock_health_data(user_id: str, day: date | None = None) -> dict[str, Any]:
+    """
+    Return the user's mock health data for a day (default: today).
+
+    Values are derived from a hash of (user_id, day), so every worker
+    produces the same data without shared state, and a new day brings new
+    data. Results are memoized in a bounded LRU; the returned value is
+    shared and must not be mutated.
+    """
+    return _user_mock_health_data(user_id, day or date.today())
 
 
 def _create_mock_health_data(data_type: str) -> Any:
@@ -186,29 +217,6 @@ def _create_mock_health_data(data_type: str) -> Any:
     return generator.generate_single_health_data()
 
 
-def get_persisted_mock_health_data(data_type: str = "realistic") -> Any:
-    cache = _load_cache()
-    cached_value = cache.get(data_type)
-
-    if cached_value is not None:
-        if (
-            data_type == "realistic"
-            and isinstance(cached_value, dict)
-            and "weekly_workouts" not in cached_value
-        ):
-            data = _create_mock_health_data(data_type)
-            cache[data_type] = data
-            _write_cache(cache)
-            return data
-        return cached_value
-
-    data = _create_mock_health_data(data_type)
-    cache[data_type] = data
-    _write_cache(cache)
-
-    return data
-
-
 def generate_mock_health_data(data_type: str = "single") -> Any:
     """
 
@@ -0,0 +1,250 @@
+"""
+Resilience - Deadlines, hedged retries and a circuit breaker around model calls
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import TypeVar
+
+from app.utils.metrics import metrics
+
+logger = logging.getLogger("resilience")
+
+T = TypeVar("T")
+
+# Configuration
+LLM_HEDGING_ENABLED = os.getenv("ENABLE_LLM_HEDGING", "1") == "1"
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SEC = float(os.getenv("LLM_BREAKER_RESET_SEC", "30"))
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20  # Latencies needed before the p95 is trusted
+HEDGE_MIN_DELAY_SEC = 0.5
+LATENCY_WINDOW = 200
+
+
+@dataclass(frozen=True)
+class CallPolicy:
+    """How long a call may take and whether a duplicate may be raced against it"""
+
+    deadline_sec: float
+    hedge: bool = False
+
+
+# Agent policies apply to each model call of a run; tool calls run outside
+# them. The chatbot is not hedged so each of its replies is generated once.
+CALL_POLICIES = {
+    "chatbot": CallPolicy(float(os.getenv("LLM_DEADLINE_CHAT_SEC", "30"))),
+    "insights": CallPolicy(
+        float(os.getenv("LLM_DEADLINE_INSIGHTS_SEC", "20")), hedge=True
+    ),
+    "event_changed_suggestion": CallPolicy(
+        float(os.getenv("LLM_DEADLINE_SUGGESTION_SEC", "20")), hedge=True
+    ),
+    # Runs before the chatbot's own model call, so it must give up early
+    "chat_summary": CallPolicy(
+        float(os.getenv("LLM_DEADLINE_CHAT_SUMMARY_SEC", "8")), hedge=True
+    ),
+    "planner_rationale": CallPolicy(
+        float(os.getenv("LLM_DEADLINE_RATIONALE_SEC", "5")), hedge=True
+    ),
+    # One deadline for a whole chunk of batched prompts; a hedge would double it
+    "batch_insights": CallPolicy(float(os.getenv("LLM_DEADLINE_BATCH_SEC", "300"))),
+}
+DEFAULT_POLICY = CallPolicy(float(os.getenv("LLM_DEADLINE_SEC", "30")))
+
+resilient_calls = metrics.counter(
+    "llm_resilient_calls_total",
+    "Guarded model calls by call and outcome (ok, hedged_ok, timeout, error, short_circuit)",
+    ("call", "outcome"),
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the model while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stops calling a failing dependency until a probe call succeeds
+
+    Opens after ``failure_threshold`` consecutive failures. Once
+    ``reset_timeout_sec`` has passed a single probe is let through
+    (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout_sec: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_sec = reset_timeout_sec
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Whether a call may go through now"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout_sec:
+                return False
+            self.state = "half_open"
+            self.probe_in_flight = False
+
+        if self.state == "half_open":
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+
+        return True
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            logger.info(f"Circuit {self.name} closed")
+        self.state = "closed"
+        self.failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probe_in_flight = False
+
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(
+                    f"Circuit {self.name} opened after {self.failures} failures"
+                )
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == "open"
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.samples: deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ResilientCaller:
+    """Runs model calls under a per-call deadline, hedging and a shared breaker
+
+    One breaker covers every call because they all depend on the same model
+    provider. Hedged calls start a second attempt once the first has been
+    running longer than the call's recent p95 and return whichever finishes
+    first; the other attempt is cancelled.
+    """
+
+    def __init__(self, name: str):
+        self.breaker = CircuitBreaker(
+            name, LLM_BREAKER_FAILURE_THRESHOLD, LLM_BREAKER_RESET_SEC
+        )
+        self.latencies: dict[str, LatencyTracker] = {}
+
+    def as_middleware(self, call: str):
+        """Agent middleware that runs each model call under the named call's policy"""
+        from app.dependencies.resilience_middleware import ResilientModelMiddleware
+
+        return ResilientModelMiddleware(self, call)
+
+    def _hedge_delay(self, call: str, policy: CallPolicy) -> float | None:
+        if not (policy.hedge and LLM_HEDGING_ENABLED):
+            return None
+
+        tracker = self.latencies.get(call)
+        p95 = tracker.quantile(HEDGE_QUANTILE) if tracker else None
+        if p95 is None:
+            return None
+        return max(p95, HEDGE_MIN_DELAY_SEC)
+
+    async def _race(
+        self, call: str, func: Callable[[], Awaitable[T]], hedge_delay: float | None
+    ) -> tuple[T, bool]:
+        tasks = {asyncio.ensure_future(func())}
+        hedged = False
+
+        try:
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    logger.info(f"Hedging {call} after {hedge_delay:.2f}s")
+                    tasks.add(asyncio.ensure_future(func()))
+                    hedged = True
+
+            error: BaseException | None = None
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), hedged
+                    error = task.exception()
+
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(self, call: str, func: Callable[[], Awaitable[T]]) -> T:
+        """Run func under the policy of the named call"""
+        policy = CALL_POLICIES.get(call, DEFAULT_POLICY)
+
+        if not self.breaker.allow():
+            resilient_calls.inc(call=call, outcome="short_circuit")
+            raise CircuitOpenError(f"Model calls are suspended ({call})")
+        is_probe = self.breaker.state == "half_open"
+
+        started = time.monotonic()
+        try:
+            result, hedged = await asyncio.wait_for(
+                self._race(call, func, self._hedge_delay(call, policy)),
+                timeout=policy.deadline_sec,
+            )
+        except TimeoutError:
+            self.breaker.record_failure()
+            resilient_calls.inc(call=call, outcome="timeout")
+            raise TimeoutError(
+                f"{call} did not finish within {policy.deadline_sec:g}s"
+            ) from None
+        except asyncio.CancelledError:
+            # The caller gave up; this says nothing about the provider
+            if is_probe:
+                self.breaker.probe_in_flight = False
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            resilient_calls.inc(call=call, outcome="error")
+            raise
+
+        self.breaker.record_success()
+        self.latencies.setdefault(call, LatencyTracker()).observe(
+            time.monotonic() - started
+        )
+        resilient_calls.inc(call=call, outcome="hedged_ok" if hedged else "ok")
+        return result
+
+
+# Global guard for calls to the model provider
+llm_calls = ResilientCaller("llm")
+
+metrics.gauge(
+    "llm_circuit_open",
+    "Whether model calls are currently short-circuited (1) or allowed (0)",
+    lambda: 1 if llm_calls.breaker.is_open else 0,
+)
@@ -0,0 +1,395 @@
+"""
+Sample Ingest - Validates streamed wearable samples and writes them to the health store in batches
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from array import array
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
+
+import numpy as np
+
+from app.utils.health_rollups import health_rollups
+from app.utils.health_rules import SAMPLE_RANGES
+from app.utils.health_store import health_store
+from app.utils.event_poller import broadcast_realtime
+from app.utils.metrics import metrics
+from app.utils.population_sketches import (
+    POPULATION_SKETCHES_ENABLED,
+    population_sketches,
+)
+from app.utils.vitals_detector import VitalsAlert, vitals_detector
+
+logger = logging.getLogger("sample_ingest")
+
+# Configuration
+INGEST_BUFFER_MAX_SAMPLES = int(os.getenv("INGEST_BUFFER_MAX_SAMPLES", "200000"))
+INGEST_FLUSH_BATCH_SAMPLES = int(os.getenv("INGEST_FLUSH_BATCH_SAMPLES", "20000"))
+INGEST_FLUSH_INTERVAL_SEC = float(os.getenv("INGEST_FLUSH_INTERVAL_SEC", "1"))
+HEALTH_STORE_FLUSH_INTERVAL_SEC = float(
+    os.getenv("HEALTH_STORE_FLUSH_INTERVAL_SEC", "30")
+)
+# Samples stamped further ahead than this are refused; they would pin the
+# series' last timestamp in the future
+INGEST_MAX_FUTURE_SKEW_SEC = float(os.getenv("INGEST_MAX_FUTURE_SKEW_SEC", "300"))
+MIN_SAMPLE_TIMESTAMP = 946684800.0  # 2000-01-01 UTC
+MAX_LINE_BYTES = 1 << 20
+MAX_REPORTED_ERRORS = 100
+
+ingested_samples = metrics.counter(
+    "health_samples_total",
+    "Wearable samples received by outcome (accepted, invalid, rejected)",
+    ("result",),
+)
+
+
+class IngestBufferFull(Exception):
+    """Raised when accepting more samples would exceed INGEST_BUFFER_MAX_SAMPLES"""
+
+    def __init__(self, retry_after_sec: int):
+        super().__init__(f"Ingest buffer is full, retry after {retry_after_sec}s")
+        self.retry_after_sec = retry_after_sec
+
+
+class InvalidSample(ValueError):
+    """A sample that is malformed or outside its metric's range"""
+
+
+def _timestamp(value: Any) -> float:
+    timestamp = None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        timestamp = float(value)
+    elif isinstance(value, str):
+        try:
+            timestamp = datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    if timestamp is None or not math.isfinite(timestamp):
+        raise InvalidSample(f"invalid timestamp: {value!r}")
+
+    if timestamp < MIN_SAMPLE_TIMESTAMP:
+        raise InvalidSample(f"timestamp {value!r} is too far in the past")
+    if timestamp > time.time() + INGEST_MAX_FUTURE_SKEW_SEC:
+        raise InvalidSample(f"timestamp {value!r} is in the future")
+    return timestamp
+
+
+def parse_sample(sample: Any) -> tuple[str, float, float]:
+    """Validate one sample object, returning (metric, timestamp, value)"""
+    if not isinstance(sample, dict):
+        raise InvalidSample("sample must be an object")
+
+    metric = sample.get("metric")
+    bounds = SAMPLE_RANGES.get(metric)
+    if bounds is None:
+        raise InvalidSample(f"unknown metric: {metric!r}")
+
+    value = sample.get("value")
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        raise InvalidSample(f"{metric} value must be a number")
+    if not bounds[0] <= value <= bounds[1]:
+        raise InvalidSample(f"{metric} value {value} outside {bounds[0]}-{bounds[1]}")
+
+    return metric, _timestamp(sample.get("timestamp")), float(value)
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a streamed body into lines as chunks arrive"""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        if b"\n" not in chunk:
+            if len(pending) > MAX_LINE_BYTES:
+                raise InvalidSample(f"line longer than {MAX_LINE_BYTES} bytes")
+            continue
+
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line
+
+    if pending:
+        yield pending
+
+
+def _cached_profiles(
+    user_ids: set[str],
+) -> tuple[dict[str, dict[str, Any]], set[str]]:
+    """Cached profiles that place users in a population cohort, and the users not cached"""
+    if not POPULATION_SKETCHES_ENABLED:
+        return {}, set()
+
+    from app.dependencies.profile_cache import profile_cache
+
+    profiles, missing = {}, set()
+    for user_id in user_ids:
+        found, profile = profile_cache.lookup(user_id)
+        if not found:
+            missing.add(user_id)
+        elif profile is not None:
+            profiles[user_id] = profile
+    return profiles, missing
+
+
+async def _load_profiles(user_ids: set[str]) -> None:
+    """Fill the profile cache for users whose samples were written without one"""
+    from app.dependencies.user_profile import get_user_profiles
+
+    try:
+        await get_user_profiles(list(user_ids))
+    except Exception as exc:
+        logger.warning(f"Profiles unavailable for population sketches: {exc}")
+
+
+@dataclass
+class SeriesBuffer:
+    timestamps: array = field(default_factory=lambda: array("d"))
+    values: array = field(default_factory=lambda: array("d"))
+
+
+@dataclass
+class IngestResult:
+    """Outcome of one ingest request; lines count every line consumed in order"""
+
+    lines: int = 0
+    accepted: int = 0
+    invalid: int = 0
+    errors: list[dict[str, Any]] = field(default_factory=list)
+
+    def add_error(self, line: int, error: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+
+class SampleIngestor:
+    """Buffers accepted samples per (user, metric) and flushes them in batches
+
+    Every flush hands whole columns to the health store, its rollups, the
+    vitals detector and the population sketches in one call per series;
+    alerts are broadcast on the realtime channel. Samples waiting in the
+    buffer or being flushed count against INGEST_BUFFER_MAX_SAMPLES; beyond
+    it new samples are refused so callers can back off instead of growing
+    memory.
+    """
+
+    def __init__(self):
+        self.running = False
+        self.task = None
+        self.buffer: dict[tuple[str, str], SeriesBuffer] = {}
+        self.buffered = 0
+        self.flushing = 0
+        self.flush_needed = asyncio.Event()
+        self.last_store_flush = time.monotonic()
+        self.broadcasts: set[asyncio.Task] = set()
+        self.profile_loads: set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        return self.buffered + self.flushing
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(INGEST_FLUSH_INTERVAL_SEC))
+
+    def offer(self, user_id: str, samples: list[tuple[str, float, float]]) -> None:
+        """Buffer all samples or, when they do not fit, none of them"""
+        if self.pending + len(samples) > INGEST_BUFFER_MAX_SAMPLES:
+            ingested_samples.inc(len(samples), result="rejected")
+            self.flush_needed.set()
+            raise IngestBufferFull(self.retry_after())
+
+        for metric, timestamp, value in samples:
+            series = self.buffer.get((user_id, metric))
+            if series is None:
+                series = self.buffer[(user_id, metric)] = SeriesBuffer()
+            series.timestamps.append(timestamp)
+            series.values.append(value)
+
+        self.buffered += len(samples)
+        ingested_samples.inc(len(samples), result="accepted")
+        if self.buffered >= INGEST_FLUSH_BATCH_SAMPLES:
+            self.flush_needed.set()
+
+    async def ingest(
+        self, user_id: str, lines: AsyncIterator[bytes], result: IngestResult
+    ) -> IngestResult:
+        """
+        Validate and buffer NDJSON lines, each a sample object or a list of them.
+
+        Invalid samples are reported and skipped. A line is buffered whole, so
+        when IngestBufferFull is raised result.lines tells the client where to resume.
+        Raises StoreLockedError before reading anything when another process
+        writes the health store, since samples accepted here could not be saved.
+        """
+        health_store.claim_writer()
+        async for raw_line in lines:
+            line_number = result.lines + 1
+            if raw_line.strip():
+                try:
+                    parsed = json.loads(raw_line)
+                except ValueError as exc:
+                    result.add_error(line_number, f"invalid JSON: {exc}")
+                    ingested_samples.inc(result="invalid")
+                    result.lines += 1
+                    continue
+
+                samples = []
+                for sample in parsed if isinstance(parsed, list) else (parsed,):
+                    try:
+                        samples.append(parse_sample(sample))
+                    except InvalidSample as exc:
+                        result.add_error(line_number, str(exc))
+                        ingested_samples.inc(result="invalid")
+
+                if samples:
+                    self.offer(user_id, samples)
+                    result.accepted += len(samples)
+
+            result.lines += 1
+
+        return result
+
+    def _write(
+        self,
+        batch: dict[tuple[str, str], SeriesBuffer],
+        profiles: dict[str, dict[str, Any]],
+    ) -> list[VitalsAlert]:
+        alerts = []
+        for (user_id, metric), series in batch.items():
+            timestamps = np.frombuffer(series.timestamps)
+            values = np.frombuffer(series.values)
+            # One failing series must not cost the rest of the batch
+            try:
+                health_rollups.append(user_id, metric, timestamps, values)
+            except Exception as exc:
+                logger.error(
+                    f"Dropped {len(timestamps)} {metric} samples of {user_id}: {exc}"
+                )
+                continue
+
+            try:
+                alerts.extend(
+                    vitals_detector.observe(user_id, metric, timestamps, values)
+                )
+                if POPULATION_SKETCHES_ENABLED:
+                    population_sketches.observe(
+                        user_id, profiles.get(user_id), metric, timestamps, values
+                    )
+            except Exception as exc:
+                logger.error(f"Analysing {metric} samples of {user_id} failed: {exc}")
+
+        if time.monotonic() - self.last_store_flush >= HEALTH_STORE_FLUSH_INTERVAL_SEC:
+            try:
+                health_store.flush()
+                population_sketches.flush()
+            except Exception as exc:
+                logger.error(f"Persisting the health store failed: {exc}")
+            self.last_store_flush = time.monotonic()
+
+        return alerts
+
+    async def flush(self) -> None:
+        """
+        Write everything buffered so far to the health store.
+
+        Samples are never held back for profiles: users whose profile is not
+        cached are folded into the sketches without a cohort for now (their
+        day in progress takes one once it is known), and their profiles are
+        loaded in the background for later batches.
+        """
+        if not self.buffer:
+            return
+
+        batch, self.buffer = self.buffer, {}
+        self.flushing, self.buffered = self.buffered, 0
+        profiles, missing = _cached_profiles({user_id for user_id, _ in batch})
+        if missing:
+            task = asyncio.create_task(_load_profiles(missing))
+            self.profile_loads.add(task)
+            task.add_done_callback(self.profile_loads.discard)
+        try:
+            alerts = await asyncio.to_thread(self._write, batch, profiles)
+        except Exception as exc:
+            logger.error(f"Writing {self.flushing} samples failed: {exc}")
+            return
+        finally:
+            self.flushing = 0
+
+        if alerts:
+            logger.info(f"Broadcasting {len(alerts)} vitals alerts")
+            self._track(
+                asyncio.create_task(
+                    asyncio.to_thread(
+                        broadcast_realtime,
+                        [alert.broadcast_payload() for alert in alerts],
+                        per_user=True,
+                    )
+                )
+            )
+
+    def _track(self, task: asyncio.Task) -> None:
+        # Broadcasts run in the background so a slow realtime API never holds up ingest
+        self.broadcasts.add(task)
+        task.add_done_callback(self.broadcasts.discard)
+
+    async def flush_loop(self):
+        """Flush when a batch is full or the flush interval has passed"""
+        logger.info("Sample ingestor started")
+
+        while self.running:
+            try:
+                await asyncio.wait_for(
+                    self.flush_needed.wait(), timeout=INGEST_FLUSH_INTERVAL_SEC
+                )
+            except TimeoutError:
+                pass
+            self.flush_needed.clear()
+            await self.flush()
+
+        logger.info("Sample ingestor stopped")
+
+    async def start(self):
+        """Start the background flusher"""
+        if self.running:
+            logger.warning("Sample ingestor already running")
+            return
+
+        self.running = True
+        self.task = asyncio.create_task(self.flush_loop())
+
+    async def stop(self):
+        """Stop the flusher and write out what is still buffered"""
+        if not self.running:
+            return
+
+        self.running = False
+
+        if self.task:
+            # Let the loop finish its flush rather than cancel it mid-batch
+            self.flush_needed.set()
+            await self.task
+            self.task = None
+
+        for task in self.profile_loads:
+            task.cancel()
+        await self.flush()
+        await asyncio.to_thread(health_store.flush)
+        await asyncio.to_thread(population_sketches.flush)
+        if self.broadcasts:
+            await asyncio.gather(*self.broadcasts, return_exceptions=True)
+
+
+# Global sample ingestor
+sample_ingestor = SampleIngestor()
+
+metrics.gauge(
+    "health_ingest_pending_samples",
+    "Accepted samples not yet written to the health store",
+    lambda: sample_ingestor.pending,
+)
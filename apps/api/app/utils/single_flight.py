@@ -0,0 +1,106 @@
+"""
+Single Flight - Coalesces identical concurrent calls into one execution
+"""
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+from app.utils.metrics import metrics
+
+logger = logging.getLogger("single_flight")
+
+
+def normalize_input(text: str | None) -> str:
+    """Normalize free-form input so trivially different requests share a key"""
+    return " ".join((text or "").lower().split())
+
+
+single_flight_calls = metrics.counter(
+    "single_flight_calls_total",
+    "Calls through a single-flight coalescer by whether they executed or were coalesced",
+    ("flight", "result"),
+)
+
+
+class _Flight:
+    """A shared execution and the number of callers awaiting it"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one execution per key and shares its result with duplicates"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.flights: dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Await the in-flight execution for ``key``, starting one if needed
+
+        The execution runs in its own task so a cancelled caller does not
+        cancel it for the others; it is only cancelled once every caller
+        awaiting it has gone away.
+        """
+        self.calls += 1
+        flight = self.flights.get(key)
+
+        if flight is None:
+            self.executions += 1
+            single_flight_calls.inc(flight=self.name, result="executed")
+            flight = _Flight(asyncio.create_task(func()))
+            self.flights[key] = flight
+            flight.task.add_done_callback(
+                lambda task, key=key: self._forget(key, task)
+            )
+        else:
+            self.coalesced += 1
+            single_flight_calls.inc(flight=self.name, result="coalesced")
+            logger.debug(f"Coalesced request for {key!r}")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                logger.debug(f"All callers for {key!r} cancelled; cancelling execution")
+                # Forget it now so a new caller starts a fresh execution instead
+                # of joining one that is being cancelled
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+                flight.task.cancel()
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        flight = self.flights.get(key)
+        if flight is not None and flight.task is task:
+            del self.flights[key]
+
+        # Mark the exception as retrieved when every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict[str, int]:
+        """Counters describing how many executions were saved"""
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self.flights),
+        }
+
+
+# Global coalescer for agent invocations, keyed by (agent, user_id, normalized input)
+agent_requests = SingleFlight("agent_requests")
+metrics.gauge(
+    "single_flight_in_flight",
+    "Agent executions currently shared by the agent_requests coalescer",
+    lambda: len(agent_requests.flights),
+)
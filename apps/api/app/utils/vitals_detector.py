@@ -0,0 +1,227 @@
+"""
+Vitals Detector - Streaming anomaly detection on ingested vital signs
+"""
+
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.utils.health_rules import VITAL_LIMITS
+from app.utils.metrics import metrics
+
+# Configuration
+VITALS_ALERTS_ENABLED = os.getenv("ENABLE_VITALS_ALERTS", "1") == "1"
+VITALS_EWMA_ALPHA = float(os.getenv("VITALS_EWMA_ALPHA", "0.2"))
+VITALS_ALERT_COOLDOWN_SEC = float(os.getenv("VITALS_ALERT_COOLDOWN_SEC", "1800"))
+VITALS_ALERT_MAX_AGE_SEC = 3600  # Older (backfilled) samples never alert
+BASELINE_WINDOW = 1440  # Samples the personal baseline roughly remembers
+BASELINE_MIN_SAMPLES = 30
+DEVIATION_Z_SCORE = 4.0
+MIN_SUSTAINED_SAMPLES = 5  # Before the EWMA is trusted for threshold rules
+
+VITAL_NAMES = {
+    "blood_oxygen": ("blood oxygen", "%"),
+    "bp_systolic": ("systolic blood pressure", " mmHg"),
+    "bp_diastolic": ("diastolic blood pressure", " mmHg"),
+    "heart_rate": ("heart rate", " bpm"),
+    "blood_glucose": ("blood glucose", " mg/dL"),
+}
+
+vitals_alerts = metrics.counter(
+    "vitals_alerts_total",
+    "Vital sign alerts raised by metric, rule and severity",
+    ("metric", "rule", "severity"),
+)
+
+
+@dataclass
+class VitalsAlert:
+    """A concerning vital sign reading for one user"""
+
+    user_id: str
+    metric: str
+    rule: str  # "threshold" or "deviation"
+    severity: str  # "warning" or "critical"
+    value: float
+    timestamp: float
+    message: str
+
+    def broadcast_payload(self) -> dict:
+        name, _ = VITAL_NAMES[self.metric]
+        return {
+            "type": "vitals_alert",
+            "user_id": self.user_id,
+            "alert": {
+                "metric": self.metric,
+                "rule": self.rule,
+                "severity": self.severity,
+                "value": self.value,
+                "timestamp": self.timestamp,
+            },
+            # Shown by the web client the same way as event suggestions
+            "suggestion": {
+                "title": f"Check your {name}",
+                "description": self.message,
+                "rationale": f"{self.severity.title()} {self.rule} alert",
+            },
+        }
+
+
+class VitalState:
+    """Constant-size running statistics for one user's metric
+
+    mean and var follow Welford's update until BASELINE_WINDOW samples have
+    been seen, then decay exponentially so the baseline keeps adapting.
+    ewma is a short-term level used to judge sustained readings.
+    """
+
+    __slots__ = ("count", "mean", "var", "ewma", "last_timestamp", "last_alert")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.ewma = 0.0
+        self.last_timestamp = -math.inf
+        self.last_alert = -math.inf
+
+    def z_score(self, value: float) -> float | None:
+        """How unusual a value is against the baseline, once there is one"""
+        if self.count < BASELINE_MIN_SAMPLES or self.var <= 0:
+            return None
+        return (value - self.mean) / math.sqrt(self.var)
+
+    def update(self, value: float) -> None:
+        self.count += 1
+        weight = 1 / min(self.count, BASELINE_WINDOW)
+        diff = value - self.mean
+        increment = weight * diff
+        self.mean += increment
+        self.var = (1 - weight) * (self.var + diff * increment)
+        self.ewma = (
+            value
+            if self.count == 1
+            else self.ewma + VITALS_EWMA_ALPHA * (value - self.ewma)
+        )
+
+
+def _threshold(metric: str, level: float) -> tuple[str, str, float] | None:
+    """(severity, direction, limit) of the worst limit the level crosses"""
+    for direction, (warning, critical) in VITAL_LIMITS[metric].items():
+        for severity, limit in (("critical", critical), ("warning", warning)):
+            if level < limit if direction == "low" else level >= limit:
+                return severity, direction, limit
+    return None
+
+
+class VitalsDetector:
+    """Checks every ingested vital sign sample against rules and a personal baseline
+
+    Threshold rules use the EWMA of recent samples, so one noisy reading
+    does not alert but a sustained one does. The deviation rule flags
+    samples far outside the user's own baseline. Each (user, metric)
+    alerts at most once per VITALS_ALERT_COOLDOWN_SEC.
+    """
+
+    def __init__(self):
+        self.states: dict[tuple[str, str], VitalState] = {}
+        self.lock = threading.Lock()
+
+    def _state(self, user_id: str, metric: str) -> VitalState:
+        key = (user_id, metric)
+        state = self.states.get(key)
+        if state is None:
+            with self.lock:
+                state = self.states.setdefault(key, VitalState())
+        return state
+
+    def _check(
+        self,
+        user_id: str,
+        metric: str,
+        state: VitalState,
+        timestamp: float,
+        value: float,
+        z_score: float | None,
+    ) -> VitalsAlert | None:
+        name, unit = VITAL_NAMES[metric]
+
+        if state.count >= MIN_SUSTAINED_SAMPLES:
+            crossed = _threshold(metric, state.ewma)
+            if crossed is not None:
+                severity, direction, limit = crossed
+                relation = "below" if direction == "low" else "at or above"
+                level = round(state.ewma, 1)
+                return VitalsAlert(
+                    user_id=user_id,
+                    metric=metric,
+                    rule="threshold",
+                    severity=severity,
+                    value=level,
+                    timestamp=timestamp,
+                    message=f"Your {name} has been around {level:g}{unit}, {relation} {limit:g}{unit}.",
+                )
+
+        if z_score is not None and abs(z_score) >= DEVIATION_Z_SCORE:
+            return VitalsAlert(
+                user_id=user_id,
+                metric=metric,
+                rule="deviation",
+                severity="warning",
+                value=value,
+                timestamp=timestamp,
+                message=f"Your {name} of {value:g}{unit} is unusual for you (usually about {state.mean:.0f}{unit}).",
+            )
+
+        return None
+
+    def observe(
+        self, user_id: str, metric: str, timestamps: np.ndarray, values: np.ndarray
+    ) -> list[VitalsAlert]:
+        """Update the user's statistics with new samples and return any alerts"""
+        if not VITALS_ALERTS_ENABLED or metric not in VITAL_LIMITS:
+            return []
+
+        state = self._state(user_id, metric)
+        if len(timestamps) > 1 and (np.diff(timestamps) < 0).any():
+            order = np.argsort(timestamps, kind="stable")
+            timestamps, values = timestamps[order], values[order]
+
+        alerts = []
+        recent_after = time.time() - VITALS_ALERT_MAX_AGE_SEC
+        for timestamp, value in zip(timestamps.tolist(), values.tolist()):
+            if timestamp < state.last_timestamp:
+                # Late samples would corrupt the short-term level
+                continue
+            state.last_timestamp = timestamp
+            # Scored against the baseline before this sample joins it
+            z_score = state.z_score(value)
+            state.update(value)
+
+            if (
+                timestamp < recent_after
+                or timestamp - state.last_alert < VITALS_ALERT_COOLDOWN_SEC
+            ):
+                continue
+
+            alert = self._check(user_id, metric, state, timestamp, value, z_score)
+            if alert is not None:
+                state.last_alert = timestamp
+                vitals_alerts.inc(metric=metric, rule=alert.rule, severity=alert.severity)
+                alerts.append(alert)
+
+        return alerts
+
+
+# Global detector fed by the sample ingestor
+vitals_detector = VitalsDetector()
+
+metrics.gauge(
+    "vitals_detector_series",
+    "User vital sign series with running statistics",
+    lambda: len(vitals_detector.states),
+)
@@ -0,0 +1,261 @@
+"""
+Workout Planner - Places workouts and walks into free calendar slots without the model
+"""
+
+import re
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any
+
+from app.utils.random_health_data import SPORT_OPTIONS
+
+# Configuration
+DAY_START_HOUR = 6
+DAY_END_HOUR = 21
+SLOT_STEP = timedelta(minutes=15)
+EVENT_BUFFER = timedelta(minutes=15)  # Kept free before and after every event
+WORKOUT_DURATIONS = (30, 45, 60)  # Minutes
+DEFAULT_WORKOUTS_PER_WEEK = 3
+STEPS_PER_WALK_MINUTE = 100
+WALK_MINUTES = (15, 60)  # Shortest and longest suggested walk
+
+SPORT_TITLES = {"pickleball": "Pickleball", "swim": "Swim", "running": "Run"}
+SPORT_CALORIES_PER_MINUTE = {
+    "pickleball": 9.0,
+    "swim": 10.5,
+    "running": 11.5,
+    "walk": 4.0,
+}
+# Hours of the day that suit each activity best
+PREFERRED_HOURS = {
+    "pickleball": range(16, 20),
+    "swim": range(6, 9),
+    "running": range(6, 9),
+    "walk": range(12, 14),
+}
+
+WORKOUTS_PER_WEEK_PATTERN = re.compile(
+    r"(\d+)\s*(?:x|times|workouts?|sessions?)\s*(?:a|per|each|/)\s*week", re.IGNORECASE
+)
+
+
+@dataclass
+class PlannedWorkout:
+    """A workout or walk placed in a free slot of today's calendar"""
+
+    activity: str
+    start: datetime
+    end: datetime
+    score: float
+    rationale: str
+
+    @property
+    def title(self) -> str:
+        return SPORT_TITLES.get(self.activity, self.activity.title())
+
+    @property
+    def description(self) -> str:
+        minutes = int((self.end - self.start).total_seconds() // 60)
+        calories = int(minutes * SPORT_CALORIES_PER_MINUTE[self.activity])
+        return f"{minutes} minute {self.title.lower()}, about {calories} kcal."
+
+
+def workouts_per_week(custom_goals: Any) -> int:
+    """Read a workouts-per-week target such as "work out 4 times per week" from the goals"""
+    match = WORKOUTS_PER_WEEK_PATTERN.search(str(custom_goals or ""))
+    return int(match.group(1)) if match else DEFAULT_WORKOUTS_PER_WEEK
+
+
+def busy_intervals(events: list[Any]) -> list[tuple[datetime, datetime]]:
+    """Time ranges taken by calendar events, padded by EVENT_BUFFER"""
+    intervals = []
+    for event in events:
+        start = getattr(event.when, "start_time", None)
+        end = getattr(event.when, "end_time", None)
+        if start is None:
+            # All-day events do not block a time slot
+            continue
+        intervals.append(
+            (
+                datetime.fromtimestamp(start) - EVENT_BUFFER,
+                datetime.fromtimestamp(end or start) + EVENT_BUFFER,
+            )
+        )
+    return sorted(intervals)
+
+
+def free_intervals(
+    busy: list[tuple[datetime, datetime]], now: datetime
+) -> list[tuple[datetime, datetime]]:
+    """Free ranges between now and the end of the day"""
+    day_start = now.replace(hour=DAY_START_HOUR, minute=0, second=0, microsecond=0)
+    day_end = now.replace(hour=DAY_END_HOUR, minute=0, second=0, microsecond=0)
+
+    # Start on the next slot boundary
+    cursor = max(day_start, now.replace(second=0, microsecond=0))
+    overshoot = (cursor - day_start) % SLOT_STEP
+    if overshoot:
+        cursor += SLOT_STEP - overshoot
+
+    free = []
+    for start, end in busy:
+        if end <= cursor:
+            continue
+        if start > cursor:
+            free.append((cursor, min(start, day_end)))
+        cursor = max(cursor, end)
+        if cursor >= day_end:
+            break
+
+    if cursor < day_end:
+        free.append((cursor, day_end))
+    return [(start, end) for start, end in free if end > start]
+
+
+def _slot_score(activity: str, start: datetime, now: datetime) -> float:
+    """Higher is better: preferred hours first, then sooner rather than later"""
+    score = 2.0 if start.hour in PREFERRED_HOURS[activity] else 0.0
+    score -= (start - now).total_seconds() / 3600 * 0.1
+    if activity != "walk" and start.hour >= 19:
+        # Vigorous exercise late in the evening hurts sleep
+        score -= 1.5
+    return score
+
+
+def _sport_scores(history: list[dict[str, Any]], today: str) -> dict[str, float]:
+    """Prefer sports done least this week, and avoid repeating yesterday's"""
+    counts = Counter(workout.get("sport") for workout in history)
+    recent = [workout for workout in history if workout.get("date", "") < today]
+    last_sport = (
+        max(recent, key=lambda workout: workout["date"])["sport"] if recent else None
+    )
+
+    return {
+        sport: -counts.get(sport, 0) - (1.0 if sport == last_sport else 0.0)
+        for sport in SPORT_OPTIONS
+    }
+
+
+def _sport_note(history: list[dict[str, Any]], sport: str) -> str:
+    sessions = sum(1 for workout in history if workout.get("sport") == sport)
+    if sessions == 0:
+        return f"none of them {sport}"
+    return f"only {sessions} of them {sport}"
+
+
+def _best_slot(
+    activity: str,
+    minutes: int,
+    free: list[tuple[datetime, datetime]],
+    now: datetime,
+) -> tuple[datetime, float] | None:
+    duration = timedelta(minutes=minutes)
+    best = None
+    for free_start, free_end in free:
+        start = free_start
+        while start + duration <= free_end:
+            score = _slot_score(activity, start, now)
+            if best is None or score > best[1]:
+                best = (start, score)
+            start += SLOT_STEP
+    return best
+
+
+def _take(
+    free: list[tuple[datetime, datetime]], start: datetime, end: datetime
+) -> list[tuple[datetime, datetime]]:
+    """Remove a planned slot (and its buffer) from the free ranges"""
+    busy_start, busy_end = start - EVENT_BUFFER, end + EVENT_BUFFER
+    remaining = []
+    for free_start, free_end in free:
+        if busy_end <= free_start or busy_start >= free_end:
+            remaining.append((free_start, free_end))
+            continue
+        if busy_start > free_start:
+            remaining.append((free_start, busy_start))
+        if busy_end < free_end:
+            remaining.append((busy_end, free_end))
+    return remaining
+
+
+def plan_workouts(
+    events: list[Any],
+    health_data: dict[str, Any],
+    step_goal: int | None,
+    custom_goals: Any = None,
+    now: datetime | None = None,
+) -> list[PlannedWorkout]:
+    """
+    Plan today's workout and walk around the calendar, most important first.
+
+    A workout is planned while the weekly target from custom_goals is not
+    met and none was done today; its sport and length are scored against
+    the week's history. A walk covers any remaining step goal deficit.
+    Planned slots never overlap events or each other.
+    """
+    now = now or datetime.now()
+    today = now.date().isoformat()
+    week_start = (now.date() - timedelta(days=6)).isoformat()
+    # Sessions actually done in the last 7 days, today included
+    history = [
+        workout
+        for workout in health_data.get("weekly_workouts") or []
+        if workout.get("date", "") >= week_start
+        and workout.get("duration_minutes", 0) > 0
+    ]
+    free = free_intervals(busy_intervals(events), now)
+    plans: list[PlannedWorkout] = []
+
+    done_this_week = len(history)
+    done_today = any(workout.get("date") == today for workout in history)
+    target = workouts_per_week(custom_goals)
+
+    if done_this_week < target and not done_today:
+        sport_scores = _sport_scores(history, today)
+        best = None
+        for sport, sport_score in sport_scores.items():
+            for minutes in WORKOUT_DURATIONS:
+                slot = _best_slot(sport, minutes, free, now)
+                if slot is None:
+                    continue
+                # Longer sessions are worth more while the weekly deficit is large
+                deficit_bonus = minutes / 60 * (target - done_this_week) * 0.5
+                score = slot[1] + sport_score + deficit_bonus
+                if best is None or score > best[0]:
+                    best = (score, sport, minutes, slot[0])
+
+        if best is not None:
+            score, sport, minutes, start = best
+            end = start + timedelta(minutes=minutes)
+            plans.append(
+                PlannedWorkout(
+                    activity=sport,
+                    start=start,
+                    end=end,
+                    score=score,
+                    rationale=f"You have done {done_this_week} of {target} workouts this week, {_sport_note(history, sport)}.",
+                )
+            )
+            free = _take(free, start, end)
+
+    steps = health_data.get("steps") or 0
+    if step_goal and steps < step_goal:
+        deficit = step_goal - steps
+        low, high = WALK_MINUTES
+        minutes = min(high, max(low, -(-deficit // STEPS_PER_WALK_MINUTE)))
+        minutes = -(-minutes // 15) * 15
+        slot = _best_slot("walk", minutes, free, now)
+        if slot is not None:
+            start, score = slot
+            plans.append(
+                PlannedWorkout(
+                    activity="walk",
+                    start=start,
+                    end=start + timedelta(minutes=minutes),
+                    score=score,
+                    rationale=f"You are {deficit:,} steps short of your {step_goal:,} step goal; a {minutes} minute walk covers about {minutes * STEPS_PER_WALK_MINUTE:,} steps.",
+                )
+            )
+
+    return plans
@@ -0,0 +1,129 @@
+"""
+Context Tokens Benchmark - Compares prompt tokens spent on tool outputs
+
+Usage (from apps/api):
+    python -m benchmarks.context_tokens [--requests 200] [--events 6]
+
+Encodes the same generated health data, profile and calendar with the
+previous verbose tool outputs and with the compact context encoder, and
+reports the estimated tokens each adds to one agent request.
+"""
+
+import argparse
+import json
+import random
+import statistics
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.utils.context_encoder import (
+    encode_health_data,
+    encode_objectives,
+    encode_schedule,
+    estimate_tokens,
+)
+from app.utils.random_health_data import HealthDataGenerator
+
+EVENT_TITLES = ("Team standup", "Lunch with Sam", "Dentist", "Project review", "Gym")
+EVENT_DESCRIPTIONS = (
+    "Daily sync with the product and engineering team to go over blockers and plans",
+    "Catch up at the usual place near the office",
+    "Regular check-up and cleaning, bring insurance card",
+    "Quarterly review of roadmap progress with stakeholders and leads",
+    "",
+)
+
+
+LEGACY_HEALTH_FIELDS = (
+    "steps",
+    "distance_meters",
+    "calories_burned",
+    "sleep_duration",
+    "sleep_quality",
+    "heart_rate",
+    "stress_score",
+    "bp_systolic",
+    "bp_diastolic",
+    "blood_glucose",
+    "blood_oxygen",
+    "blood_pressure",
+    "timestamp",
+    "weekly_workouts",
+)
+
+
+def legacy_health_data(data: dict) -> str:
+    return json.dumps({key: data[key] for key in LEGACY_HEALTH_FIELDS})
+
+
+def legacy_schedule(events: list) -> str:
+    return "User's schedule for today: " + ", ".join(
+        f"{datetime.fromtimestamp(event.when.start_time).strftime('%H:%M:%S')} - {event.title} ({event.description})"
+        for event in events
+    )
+
+
+def legacy_objectives(user: dict) -> str:
+    return f"My step goal is {user['step_goal']} steps per day. My custom goals are: {user['custom_goals']}"
+
+
+def sample_request(rng: random.Random, event_count: int):
+    random.seed(rng.random())
+    health = HealthDataGenerator.generate_realistic_health_data()
+
+    start = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
+    events = []
+    for index in range(event_count):
+        begins = start + timedelta(minutes=90 * index + rng.choice((0, 15, 30)))
+        events.append(
+            SimpleNamespace(
+                title=rng.choice(EVENT_TITLES),
+                description=rng.choice(EVENT_DESCRIPTIONS),
+                when=SimpleNamespace(
+                    start_time=int(begins.timestamp()),
+                    end_time=int((begins + timedelta(minutes=45)).timestamp()),
+                ),
+            )
+        )
+
+    user = {
+        "step_goal": rng.choice((6000, 8000, 10000)),
+        "custom_goals": "Sleep at least 7 hours, work out 4 times per week, drink more water",
+    }
+    return health, events, user
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--events", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = {
+        name: ([], []) for name in ("health_data", "schedule", "objectives", "total")
+    }
+
+    for _ in range(args.requests):
+        health, events, user = sample_request(rng, args.events)
+        pairs = {
+            "health_data": (legacy_health_data(health), encode_health_data(health)),
+            "schedule": (legacy_schedule(events), encode_schedule(events)),
+            "objectives": (legacy_objectives(user), encode_objectives(user)),
+        }
+        for name, (legacy, compact) in pairs.items():
+            rows[name][0].append(estimate_tokens(legacy))
+            rows[name][1].append(estimate_tokens(compact))
+        rows["total"][0].append(sum(rows[name][0][-1] for name in pairs))
+        rows["total"][1].append(sum(rows[name][1][-1] for name in pairs))
+
+    print(f"Tokens per request over {args.requests} requests ({args.events} events each)")
+    print(f"{'tool output':<14}{'legacy':>10}{'compact':>10}{'saved':>8}")
+    for name, (legacy, compact) in rows.items():
+        before, after = statistics.mean(legacy), statistics.mean(compact)
+        print(f"{name:<14}{before:>10.1f}{after:>10.1f}{1 - after / before:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
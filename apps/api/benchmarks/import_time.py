@@ -0,0 +1,78 @@
+"""
+Import Time Benchmark - Guards the cold start cost of importing the API
+
+Usage (from apps/api):
+    python -m benchmarks.import_time [--runs 5] [--max-seconds 1.0]
+
+Each run imports ``app.main`` in a fresh interpreter, so nothing is shared
+between runs. Fails when the median exceeds the budget or when a heavy
+package that should be imported lazily is loaded at import time.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Packages that must only be imported on first use of an agent or client
+LAZY_PACKAGES = (
+    "langchain",
+    "langchain_google_genai",
+    "langgraph",
+    "supabase",
+    "nylas",
+)
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+loaded = [name for name in {LAZY_PACKAGES!r} if name in sys.modules]
+print(json.dumps({{"seconds": elapsed, "loaded": loaded}}))
+"""
+
+
+def measure_once() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "ENABLE_EVENT_POLLER": "0"},
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    samples = [measure_once() for _ in range(args.runs)]
+    timings = sorted(sample["seconds"] for sample in samples)
+    median = statistics.median(timings)
+    loaded = sorted({name for sample in samples for name in sample["loaded"]})
+
+    print(
+        f"import app.main: median {median * 1000:.0f} ms, "
+        f"min {timings[0] * 1000:.0f} ms, max {timings[-1] * 1000:.0f} ms "
+        f"over {args.runs} runs"
+    )
+
+    failed = False
+    if loaded:
+        print(f"FAIL: heavy packages imported eagerly: {', '.join(loaded)}")
+        failed = True
+    if median > args.max_seconds:
+        print(f"FAIL: median import time above {args.max_seconds:.2f} s budget")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+Workout Plans Benchmark - How often the planner schedules workouts and walks on mock data
+
+Usage (from apps/api):
+    python -m benchmarks.workout_plans [--users 500] [--goal "4 times per week"]
+
+Plans one morning for many mock users with an empty calendar and reports
+how often a workout and a walk were planned. Exits non-zero when no
+workout was planned at all, which means the workout branch cannot fire
+with the data the app serves.
+"""
+
+import argparse
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from app.utils.random_health_data import get_mock_health_data
+from app.utils.workout_planner import plan_workouts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--step-goal", type=int, default=10000)
+    parser.add_argument("--goal", default="work out 4 times per week")
+    args = parser.parse_args()
+
+    now = datetime.now().replace(hour=7, minute=0, second=0, microsecond=0)
+    planned = Counter()
+    started = time.perf_counter()
+    for index in range(args.users):
+        user_id = str(uuid.UUID(int=index))
+        health_data = get_mock_health_data(user_id, now.date())
+        plans = plan_workouts([], health_data, args.step_goal, args.goal, now=now)
+        planned.update(
+            {"walk" if plan.activity == "walk" else "workout" for plan in plans}
+        )
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{args.users} users planned in {elapsed * 1000:.1f}ms "
+        f"({elapsed / args.users * 1e6:.0f}us each), goal {args.goal!r}"
+    )
+    for activity in ("workout", "walk"):
+        print(f"{activity:<8}{planned[activity] / args.users:>8.0%}")
+
+    if not planned["workout"]:
+        sys.exit("No workout was planned for any user")
+
+
+if __name__ == "__main__":
+    main()
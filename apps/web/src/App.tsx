@@ -15,6 +15,7 @@ import Health from './pages/Health';
 import NotFound from './pages/NotFound';
 import Profile from './pages/Profile';
 import { useEffect } from 'react';
+import { CURRENT_USER_ID } from './hooks/use-user';
 import { pushNotification } from './lib/utils';
 import { supabase } from './integrations/supabase/client';
 import { useNotifs } from './store';
@@ -26,6 +27,8 @@ const persister = createAsyncStoragePersister({
 });
 
 const notifChannel = supabase.channel('event-changes');
+// Vitals alerts are sent only to the user they are about
+const userChannel = supabase.channel(`event-changes:${CURRENT_USER_ID}`);
 
 const messageReceived = (payload: any) => {
   pushNotification({
@@ -44,20 +47,25 @@ const App = () => {
 
     registerServiceWorker().then(console.log);
 
-    notifChannel
-      .on('broadcast', { event: 'shout' }, ({ payload }) => {
-        messageReceived(payload);
+    const onBroadcast = ({ payload }: { payload: any }) => {
+      if (payload?.user_id && payload.user_id !== CURRENT_USER_ID) {
+        return;
+      }
 
-        addNotification({
-          id: Date.now().toString(),
-          type: 'activity',
-          title: payload?.suggestion?.title || 'New Notification',
-          message: payload?.suggestion?.description || '',
-          time: 'Just now',
-          read: false,
-        });
-      })
-      .subscribe();
+      messageReceived(payload);
+
+      addNotification({
+        id: Date.now().toString(),
+        type: 'activity',
+        title: payload?.suggestion?.title || 'New Notification',
+        message: payload?.suggestion?.description || '',
+        time: 'Just now',
+        read: false,
+      });
+    };
+
+    notifChannel.on('broadcast', { event: 'shout' }, onBroadcast).subscribe();
+    userChannel.on('broadcast', { event: 'shout' }, onBroadcast).subscribe();
   }, []);
 
   return (
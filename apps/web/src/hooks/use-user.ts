@@ -1,13 +1,15 @@
 import { UserProfile } from '@/shared/types';
 import { useQuery } from '@tanstack/react-query';
 
+// Signed-in user; the API does not authenticate requests yet
+export const CURRENT_USER_ID = '7e0d54d0-e609-4f0c-be79-d850812bf788';
+
 export function useUserProfile() {
   return useQuery({
     queryKey: ['userProfile'],
     queryFn: async (): Promise<UserProfile> => {
       const response = await fetch(
-        import.meta.env.VITE_API_URL +
-          '/users/7e0d54d0-e609-4f0c-be79-d850812bf788',
+        import.meta.env.VITE_API_URL + `/users/${CURRENT_USER_ID}`,
       );
       return await response.json();
     },